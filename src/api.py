@@ -5,14 +5,25 @@ import json
 from typing import List, Optional
 from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from llm_engine import LLMManager
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+import httpx
+from llm_engine import LLMManager, LLMError, llm_router, rate_limiters
 # Import Models
-from database import SessionModel, SourceModel, get_db, init_db
+from database import SessionModel, SourceModel, get_async_db, init_db
 from wiki_composer import WikiComposer
 from database import SessionLocal, LLMConfig
 from drive_service import upload_text_to_drive
+from job_queue import IngestQueue, QueueFullError
+from bulk_ingest import BulkIngester, resolve_youtube_urls, watch_url
+from extractor import youtube_video_id
+from batch_pipeline import BatchPipeline, MODES
+import model_registry
+import executors
+import threading
 import json
 # Khoi tao DB & App
 init_db()
@@ -27,12 +38,62 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Lỗi LLM (429 sau khi đã retry, timeout, provider lỗi) trả về đúng mã HTTP thay vì 500
+@app.exception_handler(LLMError)
+async def llm_error_handler(request, exc: LLMError):
+    headers = {"Retry-After": str(int(exc.retry_after + 0.999))} if exc.retry_after else None
+    return JSONResponse(status_code=exc.status_code, headers=headers,
+                        content={"detail": str(exc), "error": type(exc).__name__, "provider": exc.provider})
+
 # Khoi tao Composer
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 composer = WikiComposer(base_dir=os.path.join(BASE_DIR, "data_storage"))
+ingest_queue = IngestQueue(composer, max_workers=int(os.getenv("INGEST_WORKERS", "2")))
+bulk_ingester = BulkIngester(composer, ingest_queue)
+batch_pipeline = BatchPipeline(composer, os.path.join(BASE_DIR, "data_storage", "batches"))
 TEMP_DIR = os.path.join(BASE_DIR, "temp_uploads")
 os.makedirs(TEMP_DIR, exist_ok=True)
 
+@app.on_event("startup")
+def warm_up_models():
+    # Nap model o background de server len ngay, request dau tien khong phai cho
+    if os.getenv("MODEL_WARMUP", "1") == "1":
+        threading.Thread(target=composer.warm_up, daemon=True, name="warm-up").start()
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "models": model_registry.loaded_models()}
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    ingest_queue.shutdown()
+    bulk_ingester.shutdown()
+    executors.shutdown()
+
+@app.post("/admin/warm-up")
+async def admin_warm_up():
+    await executors.run_in("embed", composer.warm_up)
+    return {"status": "ok", "models": model_registry.loaded_models()}
+
+@app.post("/admin/compact")
+async def compact_storage(db: AsyncSession = Depends(get_async_db)):
+    """Dọn vector / raw backup / tóm tắt của các session không còn trong DB"""
+    session_ids = (await db.execute(select(SessionModel.id))).scalars().all()
+    return await executors.run_in("io", composer.compact_storage, session_ids)
+
+@app.get("/vector-store/stats")
+async def vector_store_stats():
+    return await executors.run_in("io", composer.vector_store.stats)
+
+@app.get("/lexical-index/stats")
+async def lexical_index_stats():
+    return await executors.run_in("io", composer.lexical_index.stats)
+
+@app.post("/admin/unload")
+def admin_unload(kind: Optional[str] = None, name: Optional[str] = None):
+    removed = model_registry.unload(kind, name)
+    return {"status": "ok", "unloaded": removed, "models": model_registry.loaded_models()}
+
 # --- Schemas (Cập nhật sửa lỗi) ---
 class SessionCreate(BaseModel):
     title: str = "Bài viết mới"
@@ -60,23 +121,31 @@ class GenerateFooterReq(BaseModel):
     used_ids: List[int]
 
 # --- API SESSIONS ---
+async def _get_session_or_404(db: AsyncSession, session_id: str, with_sources: bool = False) -> SessionModel:
+    stmt = select(SessionModel).where(SessionModel.id == session_id)
+    if with_sources:
+        stmt = stmt.options(selectinload(SessionModel.sources))
+    sess = (await db.execute(stmt)).scalars().first()
+    if not sess: raise HTTPException(404, "Not found")
+    return sess
+
 @app.post("/sessions")
-def create_session(item: SessionCreate, db: Session = Depends(get_db)):
+async def create_session(item: SessionCreate, db: AsyncSession = Depends(get_async_db)):
     new_id = str(uuid.uuid4())
     db_sess = SessionModel(id=new_id, title=item.title)
     db.add(db_sess)
-    db.commit()
-    db.refresh(db_sess)
+    await db.commit()
+    await db.refresh(db_sess)
     return db_sess
 
 @app.get("/sessions")
-def list_sessions(db: Session = Depends(get_db)):
-    return db.query(SessionModel).order_by(SessionModel.created_at.desc()).all()
+async def list_sessions(db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(SessionModel).order_by(SessionModel.created_at.desc()))
+    return result.scalars().all()
 
 @app.get("/sessions/{session_id}")
-def get_session(session_id: str, db: Session = Depends(get_db)):
-    sess = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not sess: raise HTTPException(404, "Not found")
+async def get_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    sess = await _get_session_or_404(db, session_id, with_sources=True)
     outline = json.loads(sess.outline) if sess.outline else []
     return {
         "id": sess.id, "title": sess.title, 
@@ -85,29 +154,31 @@ def get_session(session_id: str, db: Session = Depends(get_db)):
     }
 
 @app.put("/sessions/{session_id}/save")
-def save_session(session_id: str, req: SaveReq, db: Session = Depends(get_db)):
-    sess = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not sess: raise HTTPException(404, "Not found")
+async def save_session(session_id: str, req: SaveReq, db: AsyncSession = Depends(get_async_db)):
+    sess = await _get_session_or_404(db, session_id)
     
     sess.wiki_content = req.content
     sess.outline = json.dumps(req.outline, ensure_ascii=False)
-    db.commit()
+    await db.commit()
     return {"status": "saved"}
 
 @app.delete("/sessions/{session_id}")
-def delete_session(session_id: str, db: Session = Depends(get_db)):
-    sess = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not sess: raise HTTPException(404, "Not found")
-    db.delete(sess)
-    db.commit()
+async def delete_session(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    sess = await _get_session_or_404(db, session_id, with_sources=True)
+    await db.delete(sess)
+    await db.commit()
+    # Xóa luôn vector, raw backup, cache tóm tắt của session
+    await executors.run_in("io", composer.delete_session_data, session_id)
     return {"status": "deleted"}
 
 # --- API SOURCES ---
 @app.post("/sessions/{session_id}/upload")
-async def upload_source(session_id: str, file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_source(session_id: str, file: UploadFile = File(...), db: AsyncSession = Depends(get_async_db)):
     file_path = os.path.join(TEMP_DIR, f"{session_id}_{file.filename}")
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    def save_upload():
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+    await executors.run_in("io", save_upload)
     
     ext = file.filename.split('.')[-1].lower()
     itype = "unknown"
@@ -117,53 +188,205 @@ async def upload_source(session_id: str, file: UploadFile = File(...), db: Sessi
     
     if itype == "unknown": raise HTTPException(400, "Unsupported file type")
 
-    success = composer.process_input_to_vector(file_path, itype, session_id=session_id)
-    
-    src = SourceModel(
-        session_id=session_id, name=file.filename, 
-        source_type=itype, source_path=file_path, 
-        status="done" if success else "error"
-    )
-    db.add(src)
-    db.commit()
-    return src
+    return await _enqueue_source(db, session_id, file.filename, itype, file_path)
 
 @app.post("/sessions/{session_id}/add-url")
-def add_url(session_id: str, req: UrlRequest, db: Session = Depends(get_db)):
-    success = composer.process_input_to_vector(req.url, req.type, session_id=session_id)
+async def add_url(session_id: str, req: UrlRequest, db: AsyncSession = Depends(get_async_db)):
+    url = req.url
+    if req.type == "youtube":
+        # Cùng dạng URL với bulk-ingest (watch?v=<id>) để 1 video chỉ có 1 source ID dù thêm bằng cách nào
+        video_id = youtube_video_id(url)
+        if video_id:
+            url = watch_url(video_id)
+    return await _enqueue_source(db, session_id, url, req.type, url)
+
+async def _enqueue_source(db: AsyncSession, session_id: str, name: str, itype: str, path: str) -> dict:
+    """Tạo SourceModel (processing) rồi đẩy việc trích xuất/embedding vào hàng đợi"""
     src = SourceModel(
-        session_id=session_id, name=req.url, 
-        source_type=req.type, source_path=req.url, 
-        status="done" if success else "error"
+        session_id=session_id, name=name,
+        source_type=itype, source_path=path,
+        status="processing"
     )
     db.add(src)
-    db.commit()
-    return src
+    await db.commit()
+    await db.refresh(src)
+    try:
+        job = ingest_queue.submit(session_id, src.id, path, itype)
+    except QueueFullError as e:
+        src.status = "error"
+        await db.commit()
+        raise HTTPException(503, str(e))
+    return {
+        "id": src.id, "session_id": src.session_id, "name": src.name,
+        "source_type": src.source_type, "source_path": src.source_path,
+        "status": src.status, "job_id": job.id,
+    }
+
+class BulkIngestReq(BaseModel):
+    url: Optional[str] = None          # playlist hoặc kênh YouTube
+    urls: Optional[List[str]] = None   # hoặc danh sách URL (video / playlist / kênh)
+    limit: Optional[int] = None        # số video tối đa lấy từ playlist/kênh
+    concurrency: Optional[int] = None  # số video lấy phụ đề song song
+
+@app.post("/sessions/{session_id}/bulk-ingest")
+async def bulk_ingest(session_id: str, req: BulkIngestReq, db: AsyncSession = Depends(get_async_db)):
+    """Nạp cả playlist/kênh: liệt kê video 1 lần, lấy phụ đề song song, embedding theo lô lớn"""
+    await _get_session_or_404(db, session_id)
+    urls = ([req.url] if req.url else []) + (req.urls or [])
+    if not urls:
+        raise HTTPException(400, "Cần url hoặc urls")
+    try:
+        videos = await executors.run_in("io", resolve_youtube_urls, urls, req.limit)
+    except Exception as e:
+        raise HTTPException(400, f"Không đọc được playlist/kênh: {e}")
+    if not videos:
+        raise HTTPException(400, "Không tìm thấy video nào")
+
+    rows = [SourceModel(session_id=session_id, name=v["title"], source_type="youtube",
+                        source_path=v["url"], status="processing") for v in videos]
+    db.add_all(rows)
+    await db.commit()
+    for v, row in zip(videos, rows):
+        v["source_row_id"] = row.id
+
+    concurrency = min(req.concurrency, 32) if req.concurrency else None
+    job = bulk_ingester.submit(session_id, videos, concurrency=concurrency)
+    return {"bulk_job_id": job.id, "total": len(videos), "items": videos}
+
+@app.get("/bulk-jobs/{job_id}")
+async def get_bulk_job(job_id: str):
+    job = bulk_ingester.get(job_id)
+    if not job: raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+# --- API BATCH: sinh bài hàng loạt (ingest -> generate -> save) ---
+class BatchReq(BaseModel):
+    template: str = ""                       # prompt, hỗ trợ {url} / {title}
+    mode: str = "wiki"                       # "wiki" | "youtube_seo"
+    urls: Optional[List[str]] = None         # video / playlist / kênh / website, mỗi video 1 bài
+    session_ids: Optional[List[str]] = None  # session có sẵn nguồn
+
+@app.post("/batches")
+async def create_batch(req: BatchReq):
+    if req.mode not in MODES:
+        raise HTTPException(400, f"mode phải là 1 trong {MODES}")
+    if not req.urls and not req.session_ids:
+        raise HTTPException(400, "Cần urls hoặc session_ids")
+    try:
+        manifest = await executors.run_in("io", batch_pipeline.create, req.template, req.mode,
+                                          urls=req.urls, session_ids=req.session_ids)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    batch_pipeline.start(manifest["id"])
+    return batch_pipeline.summary(manifest)
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str, items: bool = False):
+    manifest = await executors.run_in("io", batch_pipeline.load, batch_id)
+    if not manifest: raise HTTPException(404, "Batch not found")
+    result = batch_pipeline.summary(manifest)
+    if items:
+        result["items"] = manifest["items"]
+    return result
+
+@app.post("/batches/{batch_id}/resume")
+async def resume_batch(batch_id: str, retry_failed: bool = True):
+    """Chạy tiếp batch bị dừng giữa chừng: bỏ qua item đã lưu, tiếp tục từ stage đã xong"""
+    manifest = await executors.run_in("io", batch_pipeline.load, batch_id)
+    if not manifest: raise HTTPException(404, "Batch not found")
+    if batch_pipeline.is_running(batch_id):
+        raise HTTPException(409, "Batch đang chạy")
+    batch_pipeline.start(batch_id, retry_failed)
+    return batch_pipeline.summary(manifest)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = ingest_queue.get(job_id)
+    if not job: raise HTTPException(404, "Job not found")
+    return job.to_dict()
+
+@app.get("/extract-cache/stats")
+def extract_cache_stats():
+    return composer.extraction_cache.stats()
+
+@app.get("/llm-cache/stats")
+def llm_cache_stats():
+    if not composer.response_cache:
+        return {"enabled": False}
+    return {"enabled": True, **composer.response_cache.stats()}
+
+@app.get("/embedding-cache/stats")
+def embedding_cache_stats():
+    return composer.embedding_cache.stats()
 
 # --- API GENERATE ---
+# Các lệnh gọi LLM chạy trên pool "llm" để không chiếm threadpool mặc định của FastAPI
 @app.post("/sessions/{session_id}/suggestions")
-def get_suggestions(session_id: str):
-    return {"suggestions": composer.get_prompt_suggestion(session_id)}
+async def get_suggestions(session_id: str):
+    return {"suggestions": await executors.run_in("llm", composer.get_prompt_suggestion, session_id)}
 
 @app.post("/sessions/{session_id}/generate-outline")
-def gen_outline(session_id: str, req: GenerateReq, db: Session = Depends(get_db)):
-    outline = composer.generate_outline(session_id, custom_instruction=req.prompt)
-    sess = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if sess:
-        sess.outline = json.dumps(outline, ensure_ascii=False)
-        db.commit()
+async def gen_outline(session_id: str, req: GenerateReq, db: AsyncSession = Depends(get_async_db)):
+    outline = await executors.run_in("llm", composer.generate_outline, session_id, custom_instruction=req.prompt)
+    await db.execute(
+        update(SessionModel).where(SessionModel.id == session_id)
+        .values(outline=json.dumps(outline, ensure_ascii=False))
+    )
+    await db.commit()
     return {"outline": outline}
 
 @app.post("/sessions/{session_id}/write-section")
-def write_sec(session_id: str, req: WriteSectionReq):
-    content, used_ids = composer.write_section(req.section_title, session_id)
+async def write_sec(session_id: str, req: WriteSectionReq):
+    content, used_ids = await executors.run_in("llm", composer.write_section, req.section_title, session_id)
     return {"content": content, "used_ids": used_ids}
 
+# --- API STREAMING (Server-Sent Events) ---
+_STREAM_END = object()
+
+def _sse(events):
+    """Chuyển generator sự kiện {"type": ...} của composer thành luồng SSE"""
+    async def gen():
+        # Lấy từng sự kiện trên pool "llm" để generator blocking không giữ threadpool mặc định
+        iterator = iter(events)
+        try:
+            while True:
+                event = await executors.run_in("llm", next, iterator, _STREAM_END)
+                if event is _STREAM_END:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            print(f"Lỗi stream: {e}")
+            payload = {'type': 'error', 'detail': str(e), 'error': type(e).__name__}
+            yield f"event: error\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return StreamingResponse(gen(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/sessions/{session_id}/generate-outline/stream")
+async def gen_outline_stream(session_id: str, req: GenerateReq):
+    def events():
+        for event in composer.generate_outline_stream(session_id, custom_instruction=req.prompt):
+            if event["type"] == "done":
+                db = SessionLocal()
+                try:
+                    sess = db.query(SessionModel).filter(SessionModel.id == session_id).first()
+                    if sess:
+                        sess.outline = json.dumps(event["outline"], ensure_ascii=False)
+                        db.commit()
+                finally:
+                    db.close()
+            yield event
+    return _sse(events())
+
+@app.post("/sessions/{session_id}/write-section/stream")
+async def write_sec_stream(session_id: str, req: WriteSectionReq):
+    return _sse(composer.write_section_stream(req.section_title, session_id))
+
 # [FIX LỖI 422] Sửa hàm này để nhận object req: GenerateFooterReq
 @app.post("/sessions/{session_id}/generate-footer")
-def gen_footer(session_id: str, req: GenerateFooterReq):
+async def gen_footer(session_id: str, req: GenerateFooterReq):
     # LƯU Ý: Phải truyền session_id=session_id vào đây
-    return {"footer": composer.generate_bibliography(req.used_ids, session_id=session_id)}
+    footer = await executors.run_in("io", composer.generate_bibliography, req.used_ids, session_id=session_id)
+    return {"footer": footer}
 
 # --- Pydantic Models cho Config ---
 class LLMConfigBase(BaseModel):
@@ -172,6 +395,8 @@ class LLMConfigBase(BaseModel):
     base_url: str
     api_key: Optional[str] = None
     model_name: str
+    rpm_limit: Optional[int] = None  # request/phút, bỏ trống = không giới hạn
+    tpm_limit: Optional[int] = None  # token/phút
 
 class LLMConfigCreate(LLMConfigBase):
     pass
@@ -179,18 +404,26 @@ class LLMConfigCreate(LLMConfigBase):
 class LLMConfigResponse(LLMConfigBase):
     id: int
     is_active: bool
+    in_pool: Optional[bool] = False
+    weight: Optional[int] = 1
     class Config:
         orm_mode = True
 
 # --- API QUẢN LÝ MODEL ---
 
 @app.get("/models", response_model=List[LLMConfigResponse])
-def get_models(db: Session = Depends(get_db)):
+async def get_models(db: AsyncSession = Depends(get_async_db)):
     """Lấy danh sách các cấu hình model"""
-    return db.query(LLMConfig).all()
+    return (await db.execute(select(LLMConfig))).scalars().all()
+
+async def _get_model_or_404(db: AsyncSession, model_id: int, detail: str = "Model not found") -> LLMConfig:
+    target = (await db.execute(select(LLMConfig).where(LLMConfig.id == model_id))).scalars().first()
+    if not target:
+        raise HTTPException(404, detail)
+    return target
 
 @app.post("/models")
-def create_model(config: LLMConfigCreate, db: Session = Depends(get_db)):
+async def create_model(config: LLMConfigCreate, db: AsyncSession = Depends(get_async_db)):
     """Thêm cấu hình mới"""
     new_config = LLMConfig(
         name=config.name,
@@ -198,44 +431,42 @@ def create_model(config: LLMConfigCreate, db: Session = Depends(get_db)):
         base_url=config.base_url,
         api_key=config.api_key,
         model_name=config.model_name,
+        rpm_limit=config.rpm_limit,
+        tpm_limit=config.tpm_limit,
         is_active=False # Mới tạo thì chưa active ngay
     )
     db.add(new_config)
-    db.commit()
-    db.refresh(new_config)
+    await db.commit()
+    await db.refresh(new_config)
     return new_config
 
 @app.post("/models/{model_id}/activate")
-def activate_model(model_id: int, db: Session = Depends(get_db)):
+async def activate_model(model_id: int, db: AsyncSession = Depends(get_async_db)):
     """Kích hoạt 1 model, tắt các model khác"""
+    target = await _get_model_or_404(db, model_id)
+
     # 1. Deactivate all
-    db.query(LLMConfig).update({LLMConfig.is_active: False})
+    await db.execute(update(LLMConfig).values(is_active=False))
     
     # 2. Activate one
-    target = db.query(LLMConfig).filter(LLMConfig.id == model_id).first()
-    if not target:
-        raise HTTPException(404, "Model not found")
-    
     target.is_active = True
-    db.commit()
+    await db.commit()
+    LLMManager.invalidate_config(model_id)
     return {"status": "activated", "model": target.name}
 
 @app.delete("/models/{model_id}")
-def delete_model(model_id: int, db: Session = Depends(get_db)):
+async def delete_model(model_id: int, db: AsyncSession = Depends(get_async_db)):
     """Xóa cấu hình"""
-    target = db.query(LLMConfig).filter(LLMConfig.id == model_id).first()
-    if not target:
-        raise HTTPException(404, "Not found")
-    db.delete(target)
-    db.commit()
+    target = await _get_model_or_404(db, model_id, "Not found")
+    await db.delete(target)
+    await db.commit()
+    LLMManager.invalidate_config(model_id)
     return {"status": "deleted"}
 
 @app.put("/models/{model_id}")
-def update_model(model_id: int, config: LLMConfigCreate, db: Session = Depends(get_db)):
+async def update_model(model_id: int, config: LLMConfigCreate, db: AsyncSession = Depends(get_async_db)):
     """Cập nhật thông tin cấu hình model đã có"""
-    target = db.query(LLMConfig).filter(LLMConfig.id == model_id).first()
-    if not target:
-        raise HTTPException(404, "Model not found")
+    target = await _get_model_or_404(db, model_id)
     
     # Ghi đè các thông tin mới từ config gửi lên
     target.name = config.name
@@ -243,18 +474,44 @@ def update_model(model_id: int, config: LLMConfigCreate, db: Session = Depends(g
     target.base_url = config.base_url
     target.api_key = config.api_key
     target.model_name = config.model_name
+    target.rpm_limit = config.rpm_limit
+    target.tpm_limit = config.tpm_limit
     
-    db.commit()
-    db.refresh(target)
+    await db.commit()
+    await db.refresh(target)
+    LLMManager.invalidate_config(model_id)
     return target
 
+class PoolReq(BaseModel):
+    in_pool: bool
+    weight: Optional[int] = 1
+
+@app.post("/models/{model_id}/pool")
+async def set_model_pool(model_id: int, req: PoolReq, db: AsyncSession = Depends(get_async_db)):
+    """Thêm/bỏ model khỏi pool router (có pool thì request được phân phối giữa các model trong pool)"""
+    target = await _get_model_or_404(db, model_id)
+    target.in_pool = req.in_pool
+    target.weight = max(1, req.weight or 1)
+    await db.commit()
+    LLMManager.invalidate_config(model_id)
+    return {"status": "updated", "model": target.name, "in_pool": target.in_pool, "weight": target.weight}
+
+@app.get("/router/stats")
+def router_stats():
+    """Thống kê router: số request đang chạy, độ trễ, tỉ lệ lỗi theo từng model trong pool"""
+    return llm_router.snapshot()
+
+@app.get("/rate-limits/stats")
+def rate_limit_stats():
+    """Trạng thái rate limiter theo từng model: giới hạn, số lần bị 429, tổng thời gian chờ"""
+    return rate_limiters.stats()
 
 @app.post("/models/test")
-def test_model_connection(config: LLMConfigCreate):
+async def test_model_connection(config: LLMConfigCreate):
     """Test kết nối trước khi lưu"""
     manager = LLMManager() # Class này nằm trong file api.py phải import từ llm_engine
     # Lưu ý: Cần import LLMManager ở đầu file api.py
-    success, message = manager.test_connection(
+    success, message = await executors.run_in("io", manager.test_connection,
         config.provider, config.base_url, config.api_key, config.model_name
     )
     if not success:
@@ -265,16 +522,20 @@ class YoutubeSeoReq(BaseModel):
     custom_prompt: Optional[str] = None
 import yt_dlp
 @app.post("/sessions/{session_id}/generate-youtube-seo")
-def gen_youtube_seo(session_id: str, req: YoutubeSeoReq):
+async def gen_youtube_seo(session_id: str, req: YoutubeSeoReq):
     # Trả về chuỗi văn bản liền mạch từ composer
-    content = composer.generate_youtube_seo(session_id, req.custom_prompt)
+    content = await executors.run_in("llm", composer.generate_youtube_seo, session_id, req.custom_prompt)
     return {"content": content}
 
+@app.post("/sessions/{session_id}/generate-youtube-seo/stream")
+async def gen_youtube_seo_stream(session_id: str, req: YoutubeSeoReq):
+    return _sse(composer.generate_youtube_seo_stream(session_id, req.custom_prompt))
+
 
 
 # --- API MỚI: LƯU VÀO DRIVE ---
 @app.get("/check-drive-setup")
-def check_drive_setup():
+async def check_drive_setup():
     # Kiểm tra file credentials.json nằm cùng cấp với api.py (thư mục src)
     current_dir = os.path.dirname(os.path.abspath(__file__))
     creds_path = os.path.join(current_dir, "credentials.json")
@@ -287,10 +548,10 @@ def check_drive_setup():
     return {"ready": True}
 
 @app.post("/sessions/{session_id}/save-drive")
-def save_to_drive(session_id: str, req: DriveSaveReq):
+async def save_to_drive(session_id: str, req: DriveSaveReq):
     try:
         # Gọi hàm upload
-        result = upload_text_to_drive(req.filename, req.content)
+        result = await executors.run_in("io", upload_text_to_drive, req.filename, req.content)
         return {
             "status": "success", 
             "file_id": result.get('id'), 
@@ -300,17 +561,19 @@ def save_to_drive(session_id: str, req: DriveSaveReq):
         print(f"Lỗi Drive: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _fetch_yt_info(url: str) -> dict:
+    ydl_opts = {'quiet': True, 'no_warnings': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        return ydl.extract_info(url, download=False)
+
 @app.post("/get-youtube-title")
-def get_yt_title(req: UrlRequest):
+async def get_yt_title(req: UrlRequest):
     try:
-        ydl_opts = {'quiet': True, 'no_warnings': True}
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(req.url, download=False)
-            return {"title": info.get('title', 'Chủ đề mới')}
+        info = await executors.run_in("io", _fetch_yt_info, req.url)
+        return {"title": info.get('title', 'Chủ đề mới')}
     except Exception as e:
         raise HTTPException(status_code=400, detail="Không thể lấy tiêu đề video.")
 
-import requests # Cần pip install requests
 from datetime import datetime
 
 # URL bạn vừa copy từ Google Apps Script
@@ -325,14 +588,13 @@ config_data = load_project_config()
 GAS_WEBAPP_URL = config_data.get("GAS_WEBAPP_URL", "")
 
 @app.get("/get-config")
-def get_config():
+async def get_config():
     return load_project_config()
 
 
 @app.post("/sessions/{session_id}/save-sheet")
-def save_to_sheet(session_id: str, req: SaveReq, db: Session = Depends(get_db)):
-    sess = db.query(SessionModel).filter(SessionModel.id == session_id).first()
-    if not sess: raise HTTPException(404, "Not found")
+async def save_to_sheet(session_id: str, req: SaveReq, db: AsyncSession = Depends(get_async_db)):
+    sess = await _get_session_or_404(db, session_id, with_sources=True)
     
     payload = {
         "url": sess.sources[0].source_path if sess.sources else "N/A",
@@ -342,8 +604,9 @@ def save_to_sheet(session_id: str, req: SaveReq, db: Session = Depends(get_db)):
     }
     
     try:
-        # 1. Thực hiện gửi request
-        response = requests.post(GAS_WEBAPP_URL, json=payload)
+        # 1. Thực hiện gửi request (Apps Script trả về qua redirect 302)
+        async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
+            response = await client.post(GAS_WEBAPP_URL, json=payload)
         
         # 2. In ra để debug (Response 500 sẽ hiện text lỗi ở đây)
         print(f"Status Code: {response.status_code}")
@@ -359,7 +622,9 @@ def save_to_sheet(session_id: str, req: SaveReq, db: Session = Depends(get_db)):
 
         return {"status": "success", "message": response.text}
 
-    except requests.exceptions.RequestException as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         # Bắt các lỗi kết nối mạng, timeout...
         print(f"Connection Error: {e}")
         raise HTTPException(status_code=500, detail="Không thể kết nối tới Google Script.")
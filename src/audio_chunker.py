@@ -0,0 +1,82 @@
+import os
+import multiprocessing
+from typing import List, Tuple, Callable, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import model_registry
+from transcription_backend import SAMPLE_RATE, load_audio
+FRAME_SECONDS = 0.03
+
+# Model Whisper rieng cho moi process con (nap 1 lan trong initializer)
+_worker_model = None
+
+
+def find_split_points(audio: np.ndarray, split_seconds: float = 300, search_seconds: float = 15) -> List[Tuple[int, int]]:
+    """Chia audio thanh cac doan ~split_seconds, cat tai khoang lang gan nhat.
+
+    Do nang luong RMS theo frame 30ms; trong cua so +-search_seconds quanh moi diem cat
+    du kien, chon frame co nang luong thap nhat (khoang lang / khong co giong noi).
+    """
+    frame = int(SAMPLE_RATE * FRAME_SECONDS)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return [(0, len(audio))]
+    rms = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    step = int(split_seconds / FRAME_SECONDS)
+    window = min(int(search_seconds / FRAME_SECONDS), step // 2)
+    cuts = [0]
+    target = step
+    while target < n_frames - window:
+        lo = max(cuts[-1] + 1, target - window)
+        hi = max(lo + 1, min(n_frames, target + window))
+        cut = lo + int(np.argmin(rms[lo:hi]))
+        cuts.append(cut)
+        target = cut + step
+
+    bounds = [c * frame for c in cuts] + [len(audio)]
+    return [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1) if bounds[i + 1] > bounds[i]]
+
+
+def _init_worker(model_size: str, threads: int, backend: str, options: dict):
+    global _worker_model
+    _worker_model = model_registry.get_whisper(model_size, backend=backend, threads=threads, **options)
+
+
+def _transcribe_segment(index: int, segment: np.ndarray, language: Optional[str]) -> Tuple[int, str]:
+    result = _worker_model.transcribe(segment, language=language)
+    return index, result["text"].strip()
+
+
+def transcribe_long_audio(file_path: str, model_size: str = "base", split_seconds: float = 300, workers: int = 2,
+                          language: Optional[str] = None,
+                          on_progress: Optional[Callable[[int, int], None]] = None,
+                          audio: Optional[np.ndarray] = None,
+                          backend: str = "openai-whisper", backend_options: Optional[dict] = None) -> str:
+    """Chia file audio dai theo khoang lang va chay Whisper song song tren nhieu process."""
+    if audio is None:
+        audio = load_audio(file_path)
+    spans = find_split_points(audio, split_seconds)
+    total = len(spans)
+    print(f"--- Chia audio ({len(audio) / SAMPLE_RATE:.0f}s) thanh {total} doan, {workers} worker ---")
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    texts = [""] * total
+    # spawn thay vi fork: server nhieu thread, fork luc thread khac dang giu lock (registry, loader) se treo process con
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_size, threads, backend, backend_options or {}),
+                             mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(_transcribe_segment, i, audio[start:end], language)
+                   for i, (start, end) in enumerate(spans)]
+        done = 0
+        for future in as_completed(futures):
+            index, text = future.result()
+            texts[index] = text
+            done += 1
+            print(f"-> Whisper: xong doan {index + 1} ({done}/{total})")
+            if on_progress:
+                on_progress(done, total)
+
+    return " ".join(t for t in texts if t).strip()
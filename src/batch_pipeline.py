@@ -0,0 +1,316 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from database import SessionLocal, SessionModel, SourceModel
+from bulk_ingest import resolve_youtube_urls
+
+MODES = ("wiki", "youtube_seo")
+
+
+class _SafeDict(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def render_template(template: str, item: Dict) -> str:
+    """Dien {url} / {title} vao prompt; placeholder khac (hoac dau { le) giu nguyen"""
+    try:
+        return template.format_map(_SafeDict(url=item.get("url") or "", title=item.get("title") or ""))
+    except (ValueError, IndexError):
+        return template
+
+
+def _is_youtube(url: str) -> bool:
+    return "youtube.com" in url or "youtu.be" in url
+
+
+class BatchPipeline:
+    """Sinh bai hang loat: ingest -> generate -> save, moi stage co pool rieng.
+
+    - ingest: trich xuat + embedding (Whisper nang CPU), `ingest_workers` luong
+    - generate: goi LLM, `llm_workers` luong (mac dinh = gioi han song song cua provider)
+    - save: ghi SessionModel.wiki_content, 1 luong
+
+    Trang thai tung item ghi vao manifest JSON (data_storage/batches/<id>.json) sau moi stage,
+    batch loi giua chung chay lai bang resume() se bo qua cac stage da xong.
+    """
+
+    def __init__(self, composer, manifest_dir: str, ingest_workers: Optional[int] = None,
+                 llm_workers: Optional[int] = None):
+        self.composer = composer
+        self.manifest_dir = manifest_dir
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        self.ingest_workers = ingest_workers or int(os.getenv("BATCH_INGEST_WORKERS", "2"))
+        self.llm_workers = llm_workers or int(os.getenv("BATCH_LLM_WORKERS", "0")) or None
+        self._lock = threading.Lock()
+        self._running = set()
+
+    # --- manifest ---
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.manifest_dir, f"{batch_id}.json")
+
+    def load(self, batch_id: str) -> Optional[Dict]:
+        try:
+            with open(self._path(batch_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, manifest: Dict):
+        with self._lock:
+            manifest["updated_at"] = time.time()
+            path = self._path(manifest["id"])
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=1)
+            os.replace(path + ".tmp", path)
+
+    def create(self, template: str, mode: str = "wiki", urls: Optional[List[str]] = None,
+               session_ids: Optional[List[str]] = None) -> Dict:
+        """Tao manifest: moi URL YouTube (playlist/kenh duoc trai ra tung video) hoac session la 1 item"""
+        if mode not in MODES:
+            raise ValueError(f"mode phai la 1 trong {MODES}")
+        items = []
+        urls = urls or []
+        youtube = [u for u in urls if _is_youtube(u)]
+        for video in resolve_youtube_urls(youtube) if youtube else []:
+            items.append({"url": video["url"], "title": video["title"], "type": "youtube"})
+        for url in urls:
+            if not _is_youtube(url):
+                items.append({"url": url, "title": url, "type": "url"})
+        if session_ids:
+            db = SessionLocal()
+            try:
+                titles = dict(db.query(SessionModel.id, SessionModel.title)
+                              .filter(SessionModel.id.in_(session_ids)).all())
+            finally:
+                db.close()
+            missing = [sid for sid in session_ids if sid not in titles]
+            if missing:
+                raise ValueError(f"Session khong ton tai: {', '.join(missing)}")
+            for session_id in session_ids:
+                # Session co san: da co nguon, bo qua stage ingest
+                items.append({"session_id": session_id, "title": titles[session_id], "stage": "ingested"})
+        for i, item in enumerate(items):
+            item.update({"index": i, "status": "pending", "error": None, "attempts": 0})
+            item.setdefault("stage", "pending")
+            item.setdefault("session_id", None)
+            item.setdefault("source_row_id", None)
+
+        manifest = {
+            "id": str(uuid.uuid4()), "mode": mode, "template": template,
+            "created_at": time.time(), "status": "created", "items": items,
+        }
+        self._save(manifest)
+        return manifest
+
+    def summary(self, manifest: Dict) -> Dict:
+        counts = {}
+        for item in manifest["items"]:
+            key = item["stage"] if item["status"] != "error" else "error"
+            counts[key] = counts.get(key, 0) + 1
+        return {"id": manifest["id"], "mode": manifest["mode"], "status": manifest["status"],
+                "total": len(manifest["items"]), "counts": counts}
+
+    # --- cac stage (stage cua item la stage cuoi cung da xong: pending -> ingested -> generated -> saved) ---
+    def _ingest(self, item: Dict):
+        db = SessionLocal()
+        try:
+            if not item["session_id"]:
+                sess = SessionModel(id=str(uuid.uuid4()), title=item["title"][:200])
+                db.add(sess)
+                db.commit()
+                item["session_id"] = sess.id
+            if not item.get("source_row_id"):
+                src = SourceModel(session_id=item["session_id"], name=item["title"], source_type=item["type"],
+                                  source_path=item["url"], status="processing")
+                db.add(src)
+                db.commit()
+                item["source_row_id"] = src.id
+        finally:
+            db.close()
+
+        try:
+            ok = self.composer.process_input_to_vector(item["url"], item["type"], session_id=item["session_id"])
+        except Exception:
+            # Loi khi chia chunk / index (hoac trich xuat giua chung) duoc raise ra: van dong trang thai nguon
+            self._set_source_status(item["source_row_id"], "error")
+            raise
+        self._set_source_status(item["source_row_id"], "done" if ok else "error")
+        if not ok:
+            raise RuntimeError("Khong trich xuat duoc noi dung.")
+
+    def _set_source_status(self, source_row_id: int, status: str):
+        db = SessionLocal()
+        try:
+            src = db.query(SourceModel).filter(SourceModel.id == source_row_id).first()
+            if src:
+                src.status = status
+                db.commit()
+        finally:
+            db.close()
+
+    def _generate(self, manifest: Dict, item: Dict):
+        """Tra ve (noi dung, dan y); dan y chi co o mode wiki"""
+        prompt = render_template(manifest["template"], item)
+        outline = None
+        if manifest["mode"] == "youtube_seo":
+            content = self.composer.generate_youtube_seo(item["session_id"], prompt)
+        else:
+            outline = self.composer.generate_outline(item["session_id"], custom_instruction=prompt)
+            if not outline:
+                raise RuntimeError("Khong the tao dan y.")
+            content = self.composer.compose_wiki(item["session_id"], custom_instruction=prompt, outline=outline)
+        if not content:
+            raise RuntimeError("LLM tra ve noi dung rong.")
+        return content, outline
+
+    def _store(self, item: Dict, content: str, outline: Optional[List[str]]):
+        db = SessionLocal()
+        try:
+            sess = db.query(SessionModel).filter(SessionModel.id == item["session_id"]).first()
+            if not sess:
+                raise RuntimeError(f"Session {item['session_id']} khong ton tai.")
+            sess.wiki_content = content
+            if outline:
+                sess.outline = json.dumps(outline, ensure_ascii=False)
+            db.commit()
+        finally:
+            db.close()
+
+    # --- dieu phoi ---
+    def _fail(self, manifest: Dict, item: Dict, stage: str, error: Exception):
+        print(f"[BATCH {manifest['id'][:8]}] Item {item['index']} loi o stage {stage}: {error}")
+        item["status"], item["error"] = "error", f"{stage}: {error}"
+        self._save(manifest)
+
+    def is_running(self, batch_id: str) -> bool:
+        with self._lock:
+            return batch_id in self._running
+
+    def run(self, batch_id: str, retry_failed: bool = True) -> Dict:
+        """Chay (hoac chay tiep) batch cho toi khi moi item xong hoac loi. Blocking."""
+        manifest = self.load(batch_id)
+        if manifest is None:
+            raise KeyError(batch_id)
+        with self._lock:
+            if batch_id in self._running:
+                raise RuntimeError("Batch dang chay.")
+            self._running.add(batch_id)
+        try:
+            return self._run(manifest, retry_failed)
+        finally:
+            with self._lock:
+                self._running.discard(batch_id)
+
+    def _run(self, manifest: Dict, retry_failed: bool) -> Dict:
+        todo = [i for i in manifest["items"] if i["stage"] != "saved" and (retry_failed or i["status"] != "error")]
+        for item in todo:
+            item["status"], item["error"] = "pending", None
+        manifest["status"] = "running"
+        self._save(manifest)
+        print(f"[BATCH {manifest['id'][:8]}] {len(todo)}/{len(manifest['items'])} item can xu ly")
+
+        llm_workers = self.llm_workers or self.composer.llm.get_concurrency_limit()
+        ingest_pool = ThreadPoolExecutor(max_workers=self.ingest_workers, thread_name_prefix="batch-ingest")
+        llm_pool = ThreadPoolExecutor(max_workers=max(1, llm_workers), thread_name_prefix="batch-llm")
+        save_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-save")
+        done = threading.Semaphore(0)
+
+        def save_stage(item, content, outline):
+            try:
+                self._store(item, content, outline)
+                item["stage"], item["status"] = "saved", "done"
+                self._save(manifest)
+            except Exception as e:
+                self._fail(manifest, item, "save", e)
+            done.release()
+
+        def generate_stage(item):
+            try:
+                item["attempts"] += 1
+                content, outline = self._generate(manifest, item)
+                item["stage"] = "generated"
+                save_pool.submit(save_stage, item, content, outline)
+            except Exception as e:
+                self._fail(manifest, item, "generate", e)
+                done.release()
+
+        def ingest_stage(item):
+            try:
+                self._ingest(item)
+                item["stage"] = "ingested"
+                self._save(manifest)
+                llm_pool.submit(generate_stage, item)
+            except Exception as e:
+                self._fail(manifest, item, "ingest", e)
+                done.release()
+
+        for item in todo:
+            # Item da "generated" nhung chua luu: noi dung khong nam trong manifest nen sinh lai
+            if item["stage"] == "pending":
+                ingest_pool.submit(ingest_stage, item)
+            else:
+                llm_pool.submit(generate_stage, item)
+        for _ in todo:
+            done.acquire()
+        for pool in (ingest_pool, llm_pool, save_pool):
+            pool.shutdown(wait=True)
+
+        manifest["status"] = "done" if all(i["stage"] == "saved" for i in manifest["items"]) else "partial"
+        self._save(manifest)
+        result = self.summary(manifest)
+        print(f"[BATCH {manifest['id'][:8]}] Ket thuc: {result['counts']}")
+        return result
+
+    def start(self, batch_id: str, retry_failed: bool = True):
+        """Chay batch tren luong nen (cho API)"""
+        threading.Thread(target=self.run, args=(batch_id, retry_failed), daemon=True,
+                         name=f"batch-{batch_id[:8]}").start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sinh bai hang loat: ingest -> generate -> save")
+    parser.add_argument("--urls-file", help="File text, moi dong 1 URL (video / playlist / kenh / website)")
+    parser.add_argument("--urls", nargs="*", default=[], help="Danh sach URL")
+    parser.add_argument("--sessions", nargs="*", default=[], help="Session ID co san (da co nguon)")
+    parser.add_argument("--template", default="", help="Prompt, ho tro {url} va {title}")
+    parser.add_argument("--template-file", help="Doc prompt tu file")
+    parser.add_argument("--mode", choices=MODES, default="wiki")
+    parser.add_argument("--resume", metavar="BATCH_ID", help="Chay tiep batch da tao")
+    parser.add_argument("--skip-failed", action="store_true", help="Khi resume, khong chay lai item da loi")
+    parser.add_argument("--ingest-workers", type=int)
+    parser.add_argument("--llm-workers", type=int)
+    args = parser.parse_args()
+
+    from database import init_db
+    from wiki_composer import WikiComposer
+    init_db()
+    base_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_storage")
+    composer = WikiComposer(base_dir=base_dir)
+    pipeline = BatchPipeline(composer, os.path.join(base_dir, "batches"),
+                             ingest_workers=args.ingest_workers, llm_workers=args.llm_workers)
+
+    if args.resume:
+        batch_id = args.resume
+    else:
+        urls = list(args.urls)
+        if args.urls_file:
+            with open(args.urls_file, 'r', encoding='utf-8') as f:
+                urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        template = args.template
+        if args.template_file:
+            with open(args.template_file, 'r', encoding='utf-8') as f:
+                template = f.read()
+        batch_id = pipeline.create(template, args.mode, urls=urls, session_ids=args.sessions)["id"]
+        print(f"Batch ID: {batch_id} (chay tiep bang --resume {batch_id})")
+    print(pipeline.run(batch_id, retry_failed=not args.skip_failed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import uuid
+import threading
+from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import yt_dlp
+
+from database import SessionLocal, SourceModel
+from extractor import youtube_video_id
+
+# URL kenh (goc) -> tab /videos de 1 lan extract_flat tra ve thang danh sach video
+_CHANNEL_RE = re.compile(r"^(https?://(?:www\.|m\.)?youtube\.com/(?:@[^/?#]+|channel/[^/?#]+|c/[^/?#]+|user/[^/?#]+))/?$")
+
+
+def _is_collection(url: str) -> bool:
+    return "/playlist" in url or any(p in url for p in ("/@", "/channel/", "/c/", "/user/"))
+
+
+def watch_url(video_id: str) -> str:
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def resolve_youtube_urls(urls: List[str], limit: Optional[int] = None) -> List[Dict]:
+    """Doi danh sach URL (video / playlist / kenh) thanh danh sach video {video_id, url, title}.
+
+    Playlist/kenh duoc liet ke bang 1 lan extract_flat (khong tai metadata tung video),
+    URL video le chi can regex nen khong goi yt-dlp. Video trung nhau chi giu 1 lan.
+    """
+    videos, seen = [], set()
+
+    def add(video_id, title=None):
+        if video_id and video_id not in seen:
+            seen.add(video_id)
+            videos.append({"video_id": video_id, "url": watch_url(video_id), "title": title or watch_url(video_id)})
+
+    ydl_opts = {'quiet': True, 'no_warnings': True, 'extract_flat': 'in_playlist', 'skip_download': True}
+    if limit:
+        ydl_opts['playlistend'] = limit
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        for url in urls:
+            url = url.strip()
+            if not url:
+                continue
+            if not _is_collection(url):
+                add(youtube_video_id(url))
+                continue
+            channel = _CHANNEL_RE.match(url)
+            if channel:
+                url = channel.group(1) + "/videos"
+            info = ydl.extract_info(url, download=False) or {}
+            for entry in info.get("entries") or []:
+                if entry:
+                    add(entry.get("id") or youtube_video_id(entry.get("url", "")), entry.get("title"))
+    return videos[:limit] if limit else videos
+
+
+class BulkJob:
+    """Trang thai 1 lan bulk ingest: moi video la 1 item gan voi 1 SourceModel."""
+
+    def __init__(self, session_id: str, items: List[Dict]):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.items = items  # {source_row_id, video_id, url, title, status, error, job_id}
+        self.status = "processing"
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self) -> Dict:
+        counts = {}
+        for item in self.items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "status": self.status,
+            "total": len(self.items),
+            "counts": counts,
+            "elapsed_seconds": round(end - self.created_at, 3),
+            "items": self.items,
+        }
+
+
+class BulkIngester:
+    """Lay phu de nhieu video song song (gioi han `concurrency`), gom chunk thanh lo lon
+    (`embed_batch` chunk) roi encode + upsert 1 lan. Video khong co phu de duoc day sang
+    IngestQueue de chay Whisper nhu add-url binh thuong."""
+
+    def __init__(self, composer, ingest_queue, concurrency: int = None, embed_batch: int = None,
+                 max_history: int = 100):
+        self.composer = composer
+        self.ingest_queue = ingest_queue
+        self.concurrency = concurrency or int(os.getenv("BULK_TRANSCRIPT_CONCURRENCY", "8"))
+        self.embed_batch = embed_batch or int(os.getenv("BULK_EMBED_BATCH", "512"))
+        self.max_history = max_history
+        self.jobs: Dict[str, BulkJob] = {}
+        self._lock = threading.Lock()
+        # Moi job bulk da tu song song ben trong, chi can 1-2 job chay cung luc
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="bulk")
+
+    def submit(self, session_id: str, items: List[Dict], concurrency: Optional[int] = None) -> BulkJob:
+        for item in items:
+            item.setdefault("status", "queued")
+            item.setdefault("error", None)
+        job = BulkJob(session_id, items)
+        with self._lock:
+            finished = [jid for jid, j in self.jobs.items() if j.finished_at]
+            for jid in finished[:max(0, len(finished) - self.max_history)]:
+                del self.jobs[jid]
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, concurrency or self.concurrency)
+        return job
+
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        return self.jobs.get(job_id)
+
+    def _fetch(self, item: Dict):
+        item["status"] = "fetching"
+        text = self.composer.extractor.extract_youtube_transcript(item["video_id"])
+        if not text:
+            return item, None, None
+        return item, text, self.composer.text_splitter.split_text(text)
+
+    def _run(self, job: BulkJob, concurrency: int):
+        batch, batch_chunks = [], 0
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="bulk-fetch") as pool:
+                futures = {pool.submit(self._fetch, item): item for item in job.items}
+                for future in as_completed(futures):
+                    try:
+                        item, text, chunks = future.result()
+                    except Exception as e:
+                        print(f"[BULK {job.id[:8]}] Loi lay phu de: {e}")
+                        item = futures[future]
+                        item["status"], item["error"] = "error", str(e)
+                        self._update_sources([item])
+                        continue
+                    if text is None:
+                        self._fallback(job, item)
+                        continue
+                    item["status"] = "embedding"
+                    batch.append((item, text, chunks))
+                    batch_chunks += len(chunks)
+                    if batch_chunks >= self.embed_batch:
+                        self._flush(job, batch)
+                        batch, batch_chunks = [], 0
+            if batch:
+                self._flush(job, batch)
+        except Exception as e:
+            print(f"[BULK {job.id[:8]}] Loi: {e}")
+            for item in job.items:
+                if item["status"] in ("queued", "fetching", "embedding"):
+                    item["status"], item["error"] = "error", str(e)
+            self._update_sources([i for i in job.items if i["status"] == "error"])
+        finally:
+            job.status = "done"
+            job.finished_at = time.time()
+            print(f"[BULK {job.id[:8]}] Xong: {job.to_dict()['counts']}")
+
+    def _fallback(self, job: BulkJob, item: Dict):
+        """Khong co phu de: chuyen sang IngestQueue (tai audio + Whisper), job do tu cap nhat SourceModel"""
+        try:
+            ingest_job = self.ingest_queue.submit(job.session_id, item["source_row_id"], item["url"], "youtube")
+            item["status"], item["job_id"] = "whisper", ingest_job.id
+        except Exception as e:
+            item["status"], item["error"] = "error", f"Khong co phu de, hang doi Whisper day: {e}"
+            self._update_sources([item])
+
+    def _flush(self, job: BulkJob, batch: List[tuple]):
+        try:
+            self.composer.index_chunks(job.session_id, [(item["url"], text, chunks) for item, text, chunks in batch])
+            for item, _, _ in batch:
+                item["status"] = "done"
+        except Exception as e:
+            print(f"[BULK {job.id[:8]}] Loi nap Vector DB: {e}")
+            for item, _, _ in batch:
+                item["status"], item["error"] = "error", str(e)
+        self._update_sources([item for item, _, _ in batch])
+
+    def _update_sources(self, items: List[Dict]):
+        if not items:
+            return
+        status_by_id = {item["source_row_id"]: item["status"] for item in items}
+        db = SessionLocal()
+        try:
+            for src in db.query(SourceModel).filter(SourceModel.id.in_(list(status_by_id))).all():
+                src.status = status_by_id[src.id]
+            db.commit()
+        finally:
+            db.close()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
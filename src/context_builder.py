@@ -0,0 +1,71 @@
+import os
+from typing import List, Dict, Optional
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken la tuy chon, khong co thi uoc luong theo so ky tu
+    tiktoken = None
+
+# Ngan sach token cho phan context (da chua cho instruction + output).
+# Ollama mac dinh num_ctx 2048 (xem OllamaClient) nen chi dung ~1200 token cho context.
+DEFAULT_BUDGETS = {"ollama": 1200, "openai": 6000}
+
+# Tieng Viet co dau: trung binh ~3 ky tu / token voi tokenizer BPE pho bien
+CHARS_PER_TOKEN = 3.0
+
+_encodings = {}
+
+
+def _encoding_for(model_name: str):
+    if tiktoken is None:
+        return None
+    if model_name not in _encodings:
+        try:
+            _encodings[model_name] = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            _encodings[model_name] = tiktoken.get_encoding("cl100k_base")
+    return _encodings[model_name]
+
+
+def count_tokens(text: str, provider: str = "ollama", model_name: str = "") -> int:
+    if not text:
+        return 0
+    if provider == "openai":
+        enc = _encoding_for(model_name)
+        if enc is not None:
+            return len(enc.encode(text))
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+
+def token_budget(provider: str) -> int:
+    env_value = os.getenv(f"CONTEXT_TOKENS_{provider.upper()}")
+    if env_value:
+        return int(env_value)
+    return DEFAULT_BUDGETS.get(provider, DEFAULT_BUDGETS["ollama"])
+
+
+def pack_chunks(chunks: List[Dict], budget: int, provider: str = "ollama", model_name: str = "",
+                separator: str = "\n") -> List[Dict]:
+    """Lay chunk theo thu tu lien quan cho den khi het ngan sach token.
+
+    Chunk qua lon so voi phan con lai bi bo qua (khong cat giua chung) de chunk nho hon phia sau
+    van co co hoi vao prompt.
+    """
+    sep_tokens = count_tokens(separator, provider, model_name)
+    picked, used = [], 0
+    for chunk in chunks:
+        cost = count_tokens(chunk.get("content", ""), provider, model_name) + sep_tokens
+        if used + cost > budget:
+            continue
+        picked.append(chunk)
+        used += cost
+    return picked
+
+
+def build_context(chunks: List[Dict], budget: Optional[int], provider: str = "ollama", model_name: str = "",
+                  separator: str = "\n") -> str:
+    budget = budget or token_budget(provider)
+    picked = pack_chunks(chunks, budget, provider, model_name, separator)
+    # Giu thu tu xuat hien trong tai lieu de LLM doc mach lac hon
+    picked.sort(key=lambda c: (c.get("source_id", 0), c.get("chunk_index", 0)))
+    return separator.join(c.get("content", "") for c in picked)
@@ -4,13 +4,20 @@ from datetime import datetime
 from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy import create_engine, Column, Integer, String, Text, ForeignKey, DateTime, Boolean, UniqueConstraint
+from sqlalchemy import inspect, text
 
 # Ket noi SQLite
 SQLALCHEMY_DATABASE_URL = "sqlite:///./wiki_app.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Engine async (aiosqlite) cho cac handler async trong api.py
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./wiki_app.db"
+async_engine = create_async_engine(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
 class LLMConfig(Base):
@@ -23,6 +30,10 @@ class LLMConfig(Base):
     api_key = Column(String, nullable=True) # VD: "gsk_..."
     model_name = Column(String)     # VD: "llama3-70b-8192" hoặc "qwen2.5:3b"
     is_active = Column(Boolean, default=False) # Chỉ có 1 cái True tại 1 thời điểm
+    in_pool = Column(Boolean, default=False)   # Thuoc pool router (nhieu config cung luc)
+    weight = Column(Integer, default=1)        # Trong so khi router chon theo "weighted"
+    rpm_limit = Column(Integer, nullable=True) # Gioi han request/phut cua provider (VD Groq: 30)
+    tpm_limit = Column(Integer, nullable=True) # Gioi han token/phut (VD Groq: 6000)
 
 
 # Bang SESSION (Luu bai viet)
@@ -53,12 +64,45 @@ class SourceModel(Base):
     
     session = relationship("SessionModel", back_populates="sources")
 
+# Bang SOURCE REGISTRY (thay cho source_map.json): so thu tu nguon [1], [2]... trong tung session
+class SourceRegistryEntry(Base):
+    __tablename__ = "source_registry"
+    __table_args__ = (
+        UniqueConstraint("session_id", "source_name", name="uq_registry_session_name"),
+        UniqueConstraint("session_id", "source_id", name="uq_registry_session_sid"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, index=True)
+    source_name = Column(String)   # URL hoac duong dan file
+    source_id = Column(Integer)    # ID trich dan, bat dau tu 1 trong moi session
+
+# Cot them sau nay cho bang da co san (create_all khong tu ALTER TABLE)
+_ADDED_COLUMNS = {
+    "llm_configs": {"in_pool": "BOOLEAN DEFAULT 0", "weight": "INTEGER DEFAULT 1",
+                    "rpm_limit": "INTEGER", "tpm_limit": "INTEGER"},
+}
+
+def _add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, columns in _ADDED_COLUMNS.items():
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            for name, ddl in columns.items():
+                if name not in existing:
+                    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
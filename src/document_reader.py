@@ -0,0 +1,88 @@
+import os
+import multiprocessing
+from collections import deque
+from itertools import islice
+from typing import Iterator, List, Tuple
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+from docx import Document
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+# PDF it trang doc tuan tu luon (khoi dong process con ton hon doc vai chuc trang)
+PARALLEL_MIN_PAGES = 64
+PAGES_PER_TASK = 16
+
+
+def _read_pdf_range(args: Tuple[str, int, int]) -> List[str]:
+    """Chay trong process con: moi process tu mo file (doi tuong fitz khong pickle duoc)"""
+    file_path, start, end = args
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text() for i in range(start, end)]
+
+
+def iter_pdf_pages(file_path: str, workers: int = None, pages_per_task: int = PAGES_PER_TASK,
+                   parallel_min_pages: int = PARALLEL_MIN_PAGES) -> Iterator[str]:
+    """Yield text tung trang theo dung thu tu.
+
+    PDF lon: chia thanh cac day trang, doc song song tren nhieu process. Chi giu toi da
+    2 * workers day trang dang cho, nen bo nho khong phu thuoc so trang cua file.
+    """
+    workers = workers or os.cpu_count() or 1
+    with fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        if workers <= 1 or page_count < parallel_min_pages:
+            for page in doc:
+                yield page.get_text()
+            return
+
+    ranges = ((file_path, start, min(start + pages_per_task, page_count))
+              for start in range(0, page_count, pages_per_task))
+    # spawn: tranh fork tu server nhieu thread (process con co the ke thua lock dang bi giu va treo)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending = deque(pool.submit(_read_pdf_range, r) for r in islice(ranges, 2 * workers))
+        while pending:
+            pages = pending.popleft().result()
+            for r in islice(ranges, 1):
+                pending.append(pool.submit(_read_pdf_range, r))
+            yield from pages
+
+
+def _table_text(table: Table) -> str:
+    rows = []
+    for row in table.rows:
+        cells = []
+        previous = None
+        for cell in row.cells:
+            # O gop (merged) duoc python-docx tra ve lap lai (cung 1 phan tu <w:tc>) cho moi cot
+            # no chiem; so theo phan tu chu khong theo text de giu cac o ke nhau co gia tri bang nhau
+            if previous is not None and cell._tc is previous._tc:
+                continue
+            previous = cell
+            cells.append(cell.text.strip())
+        if any(cells):
+            rows.append(" | ".join(cells))
+    return "\n".join(rows)
+
+
+def iter_docx_blocks(file_path: str) -> Iterator[str]:
+    """Yield doan van va bang (moi dong 1 hang, cac o cach nhau ' | ') theo dung thu tu trong tai lieu"""
+    doc = Document(file_path)
+    for child in doc.element.body.iterchildren():
+        if child.tag == qn('w:p'):
+            yield Paragraph(child, doc).text + "\n"
+        elif child.tag == qn('w:tbl'):
+            text = _table_text(Table(child, doc))
+            if text:
+                yield text + "\n"
+
+
+def iter_document(file_path: str, workers: int = None) -> Iterator[str]:
+    """Block text cua PDF (tung trang) / DOCX (tung doan, bang); noi cac block lai = toan van"""
+    if file_path.endswith(".pdf"):
+        return iter_pdf_pages(file_path, workers=workers)
+    if file_path.endswith(".docx"):
+        return iter_docx_blocks(file_path)
+    return iter(())
@@ -0,0 +1,51 @@
+from typing import List
+
+# torch: SentenceTransformer goc (float32)
+# onnx:  cung model chay bang ONNX Runtime (can sentence-transformers>=3.2 va `pip install optimum onnxruntime`)
+# int8:  PyTorch dynamic quantization cac lop Linear sang int8 (khong can them thu vien)
+BACKENDS = ("torch", "onnx", "int8")
+
+
+class Embedder:
+    """Boc SentenceTransformer: co dinh batch size cho encode, giu ten backend de log / benchmark"""
+
+    def __init__(self, model, backend: str, batch_size: int = 64):
+        self.model = model
+        self.backend = backend
+        self.batch_size = batch_size
+
+    def encode(self, texts: List[str], **kwargs):
+        kwargs.setdefault("batch_size", self.batch_size)
+        return self.model.encode(texts, **kwargs)
+
+
+def _onnx_model(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if threads:
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = options
+    try:
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    except TypeError as e:
+        raise RuntimeError("Backend onnx can sentence-transformers>=3.2 (tham so backend)") from e
+
+
+def load_embedder(model_name: str, backend: str = "torch", threads: int = 0, batch_size: int = 64) -> Embedder:
+    """Nap embedder theo backend. threads=0: de thu vien tu chon so luong CPU."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend embedding khong hop le: {backend} (chon {', '.join(BACKENDS)})")
+    if backend == "onnx":
+        return Embedder(_onnx_model(model_name, threads), backend, batch_size)
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        # Trong so Linear luu int8, activation luong tu hoa luc chay: nhanh hon ~2x tren CPU, sai lech nho
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return Embedder(model, backend, batch_size)
@@ -0,0 +1,110 @@
+import os
+import time
+import random
+import argparse
+from typing import Dict, List
+
+import numpy as np
+
+from embedding_backend import BACKENDS, load_embedder
+
+
+def _query_from_chunk(text: str, words: int = 12) -> str:
+    # Cau hoi gia lap: vai chuc tu dau cua 1 chunk (gan giong tieu de muc / cau hoi ngan)
+    return " ".join(text.split()[:words])
+
+
+def _top_k(query_vecs: np.ndarray, doc_vecs: np.ndarray, k: int) -> np.ndarray:
+    query_vecs = query_vecs / (np.linalg.norm(query_vecs, axis=1, keepdims=True) + 1e-12)
+    doc_vecs = doc_vecs / (np.linalg.norm(doc_vecs, axis=1, keepdims=True) + 1e-12)
+    scores = query_vecs @ doc_vecs.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall_at_k(baseline: np.ndarray, candidate: np.ndarray) -> float:
+    """Ty le top-k cua baseline (float) ma backend khac cung lay duoc"""
+    k = baseline.shape[1]
+    hits = sum(len(set(b) & set(c)) for b, c in zip(baseline.tolist(), candidate.tolist()))
+    return hits / (k * len(baseline)) if len(baseline) else 0.0
+
+
+def run_benchmark(sessions: Dict[str, List[str]], model_name: str, backends: List[str],
+                  threads: int = 0, batch_size: int = 64, n_queries: int = 50, k: int = 4,
+                  seed: int = 0) -> List[Dict]:
+    """sessions: {session_id: [chunk text]}. Backend dau tien nap duoc la baseline.
+
+    Backend nao khong nap duoc (thieu thu vien...) thi in loi va bo qua, cac backend khac van chay.
+    """
+    rng = random.Random(seed)
+    queries = {sid: [_query_from_chunk(t) for t in rng.sample(chunks, min(n_queries, len(chunks)))]
+               for sid, chunks in sessions.items()}
+    total_chunks = sum(len(chunks) for chunks in sessions.values())
+
+    rows, baseline_top = [], {}
+    for backend in backends:
+        start = time.time()
+        try:
+            embedder = load_embedder(model_name, backend=backend, threads=threads, batch_size=batch_size)
+        except Exception as e:
+            print(f"Khong nap duoc backend {backend}: {e}")
+            continue
+        load_seconds = time.time() - start
+
+        encode_seconds, recalls = 0.0, []
+        for sid, chunks in sessions.items():
+            start = time.time()
+            doc_vecs = np.asarray(embedder.encode(chunks))
+            encode_seconds += time.time() - start
+            top = _top_k(np.asarray(embedder.encode(queries[sid])), doc_vecs, k)
+            if sid not in baseline_top:
+                baseline_top[sid] = top
+            recalls.append(recall_at_k(baseline_top[sid], top))
+
+        row = {
+            "backend": backend,
+            "load_seconds": round(load_seconds, 2),
+            "chunks": total_chunks,
+            "chunks_per_sec": round(total_chunks / encode_seconds, 1) if encode_seconds else None,
+            f"recall@{k}": round(float(np.mean(recalls)), 4) if recalls else None,
+        }
+        print(row)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sanh toc do / do chinh xac cac backend embedding tren du lieu session")
+    parser.add_argument("--session", action="append", dest="sessions",
+                        help="Session can do (lap lai nhieu lan), mac dinh: tat ca")
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="Danh sach backend, cai dau tien la baseline (mac dinh: torch,onnx,int8)")
+    parser.add_argument("--max-chunks", type=int, default=2000, help="So chunk toi da moi session")
+    parser.add_argument("--queries", type=int, default=50, help="So cau hoi gia lap moi session")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBEDDING_THREADS", "0")))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")))
+    args = parser.parse_args()
+
+    from wiki_composer import WikiComposer
+    base_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_storage")
+    composer = WikiComposer(base_dir=base_dir)
+    store = composer.vector_store
+    session_ids = args.sessions or list(store.sessions())
+    rng = random.Random(0)
+    sessions = {}
+    for sid in session_ids:
+        chunks = store.get(sid, include=["documents"])["documents"]
+        if len(chunks) > args.max_chunks:
+            chunks = rng.sample(chunks, args.max_chunks)
+        if chunks:
+            sessions[sid] = chunks
+    if not sessions:
+        print("Khong co chunk nao de do.")
+        return
+    print(f"--- {sum(len(c) for c in sessions.values())} chunks tu {len(sessions)} session ---")
+    run_benchmark(sessions, composer.embedding_model_name, args.backends.split(","),
+                  threads=args.threads, batch_size=args.batch_size, n_queries=args.queries, k=args.k)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,13 @@ import re
 import csv
 import time
 from extractor import Extractor
+from transcription_backend import SAMPLE_RATE, load_audio
 import unicodedata
 from thefuzz import fuzz
 
 class Evaluator:
-    def __init__(self, model_size="base"):
-        self.extractor = Extractor(model_size=model_size)
+    def __init__(self, model_size="base", backend="openai-whisper", **extractor_options):
+        self.extractor = Extractor(model_size=model_size, backend=backend, **extractor_options)
         self.log_file = os.path.join(os.path.dirname(__file__), "evaluation_results.csv")
         if not os.path.exists(self.log_file):
             try:
@@ -326,6 +327,107 @@ class Evaluator:
         except Exception as e:
             print(f"Lỗi file CSV Video: {e}")
 
+    def run_long_audio_eval(self, split_seconds=300, workers=4, threshold=90):
+        """So sánh Whisper chia đoạn song song với chạy 1 lượt trên cùng file audio dài"""
+        print("\n>>> Đang chạy đánh giá: LONG AUDIO (chia đoạn song song vs 1 lượt)")
+        audio_dir = "datasets/audio/long"
+
+        if not os.path.isdir(audio_dir):
+            print(f"Không tìm thấy thư mục {audio_dir}")
+            return
+
+        files = sorted(f for f in os.listdir(audio_dir) if f.lower().endswith((".mp3", ".wav", ".m4a")))
+        correct = 0
+        for name in files:
+            file_path = os.path.join(audio_dir, name)
+            print(f"Đang xử lý file dài: {file_path}")
+            try:
+                start = time.time()
+                single = self.extractor.model.transcribe(file_path)["text"].strip()
+                single_duration = round(time.time() - start, 3)
+
+                start = time.time()
+                chunked = self.extractor.extract_long_audio(file_path, split_seconds=split_seconds, workers=workers)
+                duration = round(time.time() - start, 3)
+
+                match, score = self.compare(chunked, single, threshold=threshold)
+                print(f"1 lượt: {single_duration}s | Song song: {duration}s | Score: {score}%")
+                if match:
+                    correct += 1
+                self.log_result("LONG_AUDIO", name, "ĐÚNG" if match else "SAI", duration, score, threshold)
+            except Exception as e:
+                print(f"Lỗi khi xử lý file {file_path}: {e}")
+                self.log_result("LONG_AUDIO", name, "ERROR", None, None, threshold)
+
+        print(f"--- Tổng kết LONG AUDIO: Đúng {correct}/{len(files)} file ---")
+
+    def run_backend_comparison(self, configs=None, threshold=85):
+        """So sánh các backend Whisper trên bộ AUDIO: tốc độ (RTF) và độ chính xác (điểm fuzzy).
+
+        configs: danh sách (backend, model_size, tham số Extractor khác).
+        """
+        print("\n>>> Đang chạy đánh giá: SO SÁNH BACKEND WHISPER")
+        configs = configs or [
+            ("openai-whisper", "base", {}),
+            ("faster-whisper", "base", {"compute_type": "int8"}),
+            ("whisper.cpp", "base", {}),
+        ]
+        csv_path = "datasets/audio/train.csv"
+        audio_dir = "datasets/audio/mp3"
+        try:
+            df = pd.read_csv(csv_path)
+        except Exception as e:
+            print(f"Lỗi đọc file CSV audio: {e}")
+            return []
+
+        # Độ dài audio đo 1 lần, dùng chung cho mọi backend
+        files = []
+        for _, row in df.iterrows():
+            file_path = os.path.join(audio_dir, f"{row['file_name']}.mp3")
+            try:
+                files.append((file_path, row['content'], len(load_audio(file_path)) / SAMPLE_RATE))
+            except Exception as e:
+                print(f"Bỏ qua {file_path}: {e}")
+
+        summary = []
+        for backend, model_size, options in configs:
+            label = f"{backend}:{model_size}"
+            try:
+                # Không dùng cache trích xuất để đo thời gian thật; nạp model trước, không tính vào thời gian
+                extractor = Extractor(model_size=model_size, backend=backend, **options)
+                _ = extractor.model
+            except Exception as e:
+                print(f"Không nạp được {label}: {e}")
+                self.log_result("ASR_BACKEND", label, "ERROR", None, None, threshold)
+                continue
+
+            correct, scores, elapsed, audio_seconds = 0, [], 0.0, 0.0
+            for file_path, truth, seconds in files:
+                start = time.time()
+                try:
+                    result = extractor.extract_mp3(file_path)
+                except Exception as e:
+                    print(f"Lỗi {label} với {file_path}: {e}")
+                    continue
+                elapsed += time.time() - start
+                audio_seconds += seconds
+                match, score = self.compare(result, truth, threshold=threshold)
+                correct += int(match)
+                scores.append(score)
+
+            row = {
+                "backend": label,
+                "files": len(scores),
+                "correct": correct,
+                "avg_score": round(sum(scores) / len(scores), 2) if scores else None,
+                "seconds": round(elapsed, 2),
+                "rtf": round(elapsed / audio_seconds, 3) if audio_seconds else None,
+            }
+            print(f"{label}: Đúng {correct}/{len(scores)} | Điểm TB {row['avg_score']} | RTF {row['rtf']}")
+            self.log_result("ASR_BACKEND", label, f"{correct}/{len(scores)}", row["seconds"], row["avg_score"], threshold)
+            summary.append(row)
+        return summary
+
 if __name__ == "__main__":
     evaluator = Evaluator(model_size="large-v3-turbo")
     # evaluator.run_audio_eval()
@@ -333,4 +435,6 @@ if __name__ == "__main__":
     # evaluator.run_text_files_eval()
     # evaluator.run_video_eval()
     # evaluator.run_local_video_eval()
+    # evaluator.run_long_audio_eval()
+    # evaluator.run_backend_comparison()
     evaluator.run_youtube_eval()
@@ -0,0 +1,43 @@
+import os
+import asyncio
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+# Moi loai cong viec chay tren pool rieng de request nhe (list sessions...) khong phai
+# xep hang sau cac lenh sinh bai dai. Whisper chay tren worker cua IngestQueue.
+POOL_SIZES = {
+    "llm": int(os.getenv("LLM_EXECUTOR_WORKERS", "16")),   # cho LLM tra loi (I/O)
+    "io": int(os.getenv("IO_EXECUTOR_WORKERS", "8")),      # yt-dlp, Google Drive, file
+    "embed": int(os.getenv("EMBED_EXECUTOR_WORKERS", "2")),  # SentenceTransformer (CPU)
+}
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    with _lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(max_workers=POOL_SIZES.get(name, 4), thread_name_prefix=f"{name}-pool")
+        return _pools[name]
+
+
+async def run_in(name: str, fn, *args, **kwargs):
+    """Chay ham blocking tren pool `name` tu handler async"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(name), partial(fn, *args, **kwargs))
+
+
+def run_blocking(name: str, fn, *args, **kwargs):
+    """Chay ham tren pool `name` va cho ket qua (tu code dong bo), de gioi han so luong song song"""
+    if threading.current_thread().name.startswith(f"{name}-pool"):
+        return fn(*args, **kwargs)
+    return get_executor(name).submit(fn, *args, **kwargs).result()
+
+
+def shutdown():
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False)
+        _pools.clear()
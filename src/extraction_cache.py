@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Optional, Dict, Iterator
+
+
+class ExtractionCache:
+    """Cache tren dia cho ket qua trich xuat (transcript YouTube, Whisper, PDF/DOCX).
+
+    Moi entry la 1 file JSON, ten file = sha256 cua khoa (kind + identifier + model size).
+    mtime cua file duoc cap nhat moi lan hit, nen evict theo mtime cu nhat chinh la LRU.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash_file(file_path: str) -> str:
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(block)
+        return sha.hexdigest()
+
+    def make_key(self, kind: str, identifier: str, model_size: Optional[str] = None) -> str:
+        raw = f"{kind}|{identifier}|{model_size or '-'}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = json.load(f).get("content")
+            os.utime(path, None)
+        except (OSError, ValueError):
+            text = None
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def set(self, key: str, text: str, meta: Dict = None):
+        if not text:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"meta": meta or {}, "content": text}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def tee(self, key: str, blocks: Iterator[str], meta: Dict = None) -> Iterator[str]:
+        """Yield lai tung block dong thoi ghi dan vao cache (cung dinh dang file voi set()),
+        khong can giu toan van trong bo nho. Chi luu khi doc het generator."""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        complete = False
+        wrote = False
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write('{"meta": ' + json.dumps(meta or {}, ensure_ascii=False) + ', "content": "')
+                for block in blocks:
+                    if block:
+                        f.write(json.dumps(block, ensure_ascii=False)[1:-1])
+                        wrote = True
+                    yield block
+                f.write('"}')
+            complete = True
+        finally:
+            if complete and wrote:
+                os.replace(tmp_path, path)
+                self._evict()
+            else:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+                entries.append((st.st_mtime, st.st_size, name))
+            except OSError:
+                continue
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for _, size, name in sorted(entries):
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    continue
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._lock:
+            for _, _, name in self._entries():
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict:
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
@@ -1,16 +1,110 @@
 import os
 import tempfile
 import trafilatura
-import fitz 
-from docx import Document
-import whisper
 import yt_dlp
 import re
 from youtube_transcript_api import YouTubeTranscriptApi
+import time
+import threading
+import model_registry
+from document_reader import iter_document
+from transcription_backend import (AUTO_MODEL_SIZE, MODEL_SIZES, SAMPLE_RATE, load_audio, record_rtf,
+                                   select_model_size)
+
+_VIDEO_ID_RE = re.compile(r"(?:v=|\/)([0-9A-Za-z_-]{11}).*")
+
+
+def youtube_video_id(url: str):
+    """Video ID 11 ky tu trong URL YouTube (None neu khong tim thay)"""
+    id_match = _VIDEO_ID_RE.search(url)
+    return id_match.group(1) if id_match else None
+
 
 class Extractor:
-    def __init__(self, model_size="base"):
-        self.model = whisper.load_model(model_size)
+    def __init__(self, model_size="base", cache=None, split_seconds=300, transcribe_workers=1, pdf_workers=None,
+                 backend="openai-whisper", compute_type="int8", threads=0, target_rtf=0.5, min_budget_seconds=0):
+        # model_size="auto": chon model theo do dai audio sao cho RTF (giay xu ly / giay audio) ~ target_rtf,
+        # min_budget_seconds > 0 cho phep audio ngan dung model lon hon (xem select_model_size)
+        self.model_size = model_size
+        self.backend = backend
+        self.backend_options = {"compute_type": compute_type} if backend == "faster-whisper" else {}
+        self.threads = threads
+        self.target_rtf = target_rtf
+        self.min_budget_seconds = min_budget_seconds
+        # Che do auto chi giu 1 model trong RAM: doi model thi unload model auto truoc do
+        self._auto_size = None
+        self._auto_lock = threading.Lock()
+        # ExtractionCache (tuy chon): None thi luon trich xuat lai
+        self.cache = cache
+        # Audio dai hon 2 doan se duoc chia theo khoang lang va chay song song (khi workers > 1)
+        self.split_seconds = split_seconds
+        self.transcribe_workers = transcribe_workers
+        # So process doc PDF lon song song (None = so CPU)
+        self.pdf_workers = pdf_workers
+
+    @property
+    def model(self):
+        # Whisper chi duoc nap khi can transcribe lan dau, dung chung qua model_registry
+        return self.transcriber(self.model_size)
+
+    @property
+    def warm_up_size(self) -> str:
+        # Che do auto: nap truoc model "base" (model thuc te chi biet khi co audio)
+        return "base" if self.model_size == AUTO_MODEL_SIZE else self.model_size
+
+    @property
+    def whisper_options(self) -> dict:
+        return {"backend": self.backend, "threads": self.threads, **self.backend_options}
+
+    def transcriber(self, model_size: str):
+        if model_size == AUTO_MODEL_SIZE:
+            model_size = self.warm_up_size
+        return model_registry.get_whisper(model_size, **self.whisper_options)
+
+    def transcription_key(self, model_size: str = None) -> str:
+        # Khoa cache cua ban transcribe theo model thuc te: backend mac dinh giu dung khoa cu (chi model_size)
+        model_size = model_size or self.model_size
+        if self.backend == "openai-whisper":
+            return model_size
+        return f"{self.backend}:{model_size}"
+
+    def _transcription_keys(self, kind: str):
+        """Cac nhan cache co the chua ban transcribe cua cau hinh hien tai.
+
+        Che do auto chi biet model sau khi doc audio, nen tra cuu moi model (lon truoc);
+        phu de YouTube o che do auto luu rieng nhan "subtitles" (khong phu thuoc model).
+        """
+        if self.model_size != AUTO_MODEL_SIZE:
+            return [self.transcription_key()]
+        labels = [self.transcription_key(size) for size in MODEL_SIZES]
+        return labels + ["subtitles"] if kind == "youtube" else labels
+
+    def _result_key(self, model_size) -> str:
+        # model_size None: ket qua khong qua Whisper (phu de YouTube)
+        if self.model_size != AUTO_MODEL_SIZE:
+            return self.transcription_key()
+        return self.transcription_key(model_size) if model_size else "subtitles"
+
+    def _lookup(self, kind: str, identifier: str):
+        for label in self._transcription_keys(kind):
+            text = self.cache.get(self.cache.make_key(kind, identifier, label))
+            if text is not None:
+                return text
+        return None
+
+    def _cached(self, kind: str, identifier: str, extract_fn) -> str:
+        """extract_fn() -> (text, model_size thuc te hoac None); ghi cache theo model thuc te"""
+        if not self.cache:
+            return extract_fn()[0]
+        text = self._lookup(kind, identifier)
+        if text is not None:
+            print(f"--- Cache hit ({kind}): {identifier[:16]} ---")
+            return text
+        text, model_size = extract_fn()
+        label = self._result_key(model_size)
+        self.cache.set(self.cache.make_key(kind, identifier, label), text,
+                       meta={"kind": kind, "id": identifier, "model_size": label})
+        return text
 
     def extract_website(self, url: str) -> str:
         downloaded = trafilatura.fetch_url(url)
@@ -19,47 +113,119 @@ class Extractor:
         return trafilatura.extract(downloaded) or ""
 
     def extract_text_file(self, file_path: str) -> str:
-        text_content = ""
-        
-        if file_path.endswith(".pdf"):
-            with fitz.open(file_path) as doc:
-                for page in doc:
-                    text_content += page.get_text()
-                    
-        elif file_path.endswith(".docx"):
-            doc = Document(file_path)
-            paragraphs = [p.text for p in doc.paragraphs]
-            text_content = "\n".join(paragraphs)
-            
-        return text_content
+        return "".join(self.iter_text_file(file_path))
+
+    def iter_text_file(self, file_path: str):
+        """Generator block text cua PDF (tung trang) / DOCX (tung doan van, bang).
+
+        Da co trong cache thi tra ve toan van 1 block; chua co thi vua doc vua ghi vao cache.
+        """
+        if not self.cache:
+            return iter_document(file_path, workers=self.pdf_workers)
+        kind = "pdf" if file_path.endswith(".pdf") else "docx"
+        identifier = self.cache.hash_file(file_path)
+        key = self.cache.make_key(kind, identifier)
+        text = self.cache.get(key)
+        if text is not None:
+            print(f"--- Cache hit ({kind}): {identifier[:16]} ---")
+            return iter([text])
+        return self.cache.tee(key, iter_document(file_path, workers=self.pdf_workers),
+                              meta={"kind": kind, "id": identifier, "model_size": None})
+
+    def _select_auto_size(self, audio_seconds: float) -> str:
+        """Chon model cho che do auto (tinh ca thoi gian nap model chua co trong RAM)"""
+        loaded = [size for size in MODEL_SIZES
+                  if model_registry.is_loaded("whisper", model_registry.whisper_name(size, self.backend))]
+        model_size = select_model_size(audio_seconds, self.backend, self.target_rtf,
+                                       min_budget_seconds=self.min_budget_seconds, loaded=loaded)
+        with self._auto_lock:
+            previous, self._auto_size = self._auto_size, model_size
+        if previous and previous != model_size:
+            # Transcribe dang chay van giu tham chieu toi model cu, chi bo khoi registry
+            model_registry.unload("whisper", model_registry.whisper_name(previous, self.backend))
+        return model_size
+
+    def _transcribe(self, file_path: str):
+        """-> (text, model_size thuc te da dung)"""
+        model_size = self.model_size
+        audio = None
+        if self.transcribe_workers > 1 or model_size == AUTO_MODEL_SIZE:
+            audio = load_audio(file_path)
+        if model_size == AUTO_MODEL_SIZE:
+            model_size = self._select_auto_size(len(audio) / SAMPLE_RATE)
+            print(f"--- Audio {len(audio) / SAMPLE_RATE:.0f}s: chon model {model_size} ({self.backend}) ---")
+        if self.transcribe_workers > 1 and len(audio) > 2 * self.split_seconds * SAMPLE_RATE:
+            return self.extract_long_audio(file_path, audio=audio, model_size=model_size), model_size
+
+        start = time.time()
+        result = self.transcriber(model_size).transcribe(audio if audio is not None else file_path)
+        if audio is not None:
+            record_rtf(self.backend, model_size, len(audio) / SAMPLE_RATE, time.time() - start)
+        return result["text"].strip(), model_size
+
+    def extract_long_audio(self, file_path: str, split_seconds=None, workers=None, on_progress=None, audio=None,
+                           model_size=None) -> str:
+        """Whisper song song theo doan (chia tai khoang lang), ghep lai dung thu tu"""
+        from audio_chunker import transcribe_long_audio
+        model_size = model_size or self.warm_up_size
+        return transcribe_long_audio(
+            file_path, model_size=model_size,
+            split_seconds=split_seconds or self.split_seconds,
+            workers=workers or max(2, self.transcribe_workers),
+            on_progress=on_progress, audio=audio,
+            backend=self.backend, backend_options=self.backend_options
+        )
 
     def extract_mp3(self, file_path: str) -> str:
-        result = self.model.transcribe(file_path)
-        return result["text"].strip()
+        if not self.cache:
+            return self._transcribe(file_path)[0]
+        return self._cached("whisper", self.cache.hash_file(file_path), lambda: self._transcribe(file_path))
 
     def extract_mp4(self, file_path: str) -> str:
-        result = self.model.transcribe(file_path)
-        return result["text"].strip()
+        return self.extract_mp3(file_path)
 
     def extract_youtube(self, url: str) -> str:
-        # 1. Thử lấy phụ đề trực tiếp (Ưu tiên tốc độ)
-        video_id = None
         # Trích xuất Video ID từ URL bằng Regex
-        id_match = re.search(r"(?:v=|\/)([0-9A-Za-z_-]{11}).*", url)
-        if id_match:
-            video_id = id_match.group(1)
+        video_id = youtube_video_id(url)
+        # Khoa theo video ID (cung 1 video du link khac nhau), khong co ID thi theo URL
+        return self._cached("youtube", video_id or url, lambda: self._extract_youtube(url, video_id))
 
-        if video_id:
-            try:
-                ytt_api = YouTubeTranscriptApi()
-                fetched_transcript = ytt_api.fetch(video_id, languages=['vi', 'en'])
+    def extract_youtube_transcript(self, video_id: str):
+        """Chỉ lấy phụ đề (không fallback Whisper): None nếu video không có phụ đề.
+
+        Dùng chung cache với extract_youtube nên video đã trích xuất trước đó không gọi mạng lại.
+        """
+        if self.cache:
+            text = self._lookup("youtube", video_id)
+            if text is not None:
+                return text
+        try:
+            text = self._fetch_transcript(video_id)
+        except Exception as e:
+            print(f"--- Lỗi khi lấy phụ đề {video_id}: {str(e)} ---")
+            return None
+        if self.cache and text:
+            label = self._result_key(None)
+            self.cache.set(self.cache.make_key("youtube", video_id, label), text,
+                           meta={"kind": "youtube", "id": video_id, "model_size": label})
+        return text
+
+    def _fetch_transcript(self, video_id: str) -> str:
+        ytt_api = YouTubeTranscriptApi()
+        fetched_transcript = ytt_api.fetch(video_id, languages=['vi', 'en'])
 
-                full_text = ''
-                # is iterable
-                for snippet in fetched_transcript:
-                    full_text += snippet.text.replace(">>", "") + ' '
-                return full_text.strip()
+        full_text = ''
+        # is iterable
+        for snippet in fetched_transcript:
+            full_text += snippet.text.replace(">>", "") + ' '
+        return full_text.strip()
 
+    def _extract_youtube(self, url: str, video_id: str):
+        """-> (text, model_size Whisper đã dùng hoặc None nếu lấy được phụ đề)"""
+        # 1. Thử lấy phụ đề trực tiếp (Ưu tiên tốc độ)
+        if video_id:
+            try:
+                return self._fetch_transcript(video_id), None
             except Exception as e:
                 print(f"--- Lỗi khi lấy phụ đề: {str(e)} ---")
                 print("--- Đang chuyển sang phương án dự phòng (Tải Audio & Whisper)... ---")
@@ -93,9 +259,9 @@ class Extractor:
                 audio_file = filename.rsplit(".", 1)[0] + ".mp3"
 
                 print("--- Đang sử dụng Whisper để chuyển đổi âm thanh thành văn bản... ---")
-                text_content = self.extract_mp3(audio_file)
+                text_content, model_size = self._transcribe(audio_file)
                 
-        return text_content
+        return text_content, model_size
 
 if __name__ == "__main__":
     extractor = Extractor()
@@ -0,0 +1,131 @@
+import time
+import queue
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# (chunk_id, text, metadata)
+Record = Tuple[str, str, Dict]
+
+_DONE = object()
+
+
+class StreamingIndexer:
+    """Pipeline chunk -> embed -> index theo lo co dinh.
+
+    Luong goi (producer) lay record tu generator (trich xuat + chia chunk) va gom thanh lo
+    `batch_size` chunk; 1 luong encode, 1 luong upsert vao Chroma. Cac stage noi voi nhau bang
+    queue toi da `max_pending` lo nen producer bi chan khi embed/index cham (backpressure):
+    bo nho khong tang theo kich thuoc nguon, va lo dau tien tim kiem duoc ngay khi upsert xong.
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], List], upsert_fn: Callable[..., None],
+                 batch_size: int = 64, max_pending: int = 2,
+                 on_progress: Optional[Callable[[Dict], None]] = None):
+        self.encode_fn = encode_fn
+        self.upsert_fn = upsert_fn
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max(1, max_pending)
+        self.on_progress = on_progress
+        self.stats = {"chunks_read": 0, "chunks_embedded": 0, "chunks_indexed": 0, "batches_indexed": 0}
+        self._lock = threading.Lock()
+        self._error = None
+        self._stop = threading.Event()
+
+    def _report(self, key: str, n: int):
+        with self._lock:
+            self.stats[key] += n
+            if key == "chunks_indexed":
+                self.stats["batches_indexed"] += 1
+            snapshot = dict(self.stats)
+        if self.on_progress and key != "chunks_read":
+            try:
+                self.on_progress(snapshot)
+            except Exception as e:
+                print(f"-> Loi callback tien do: {e}")
+
+    def _fail(self, error: Exception):
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """put co chan, nhung thoat duoc khi stage khac da loi"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _embed_worker(self, inbox: queue.Queue, outbox: queue.Queue):
+        try:
+            while True:
+                batch = inbox.get()
+                if batch is _DONE or self._stop.is_set():
+                    break
+                ids, texts, metas = zip(*batch)
+                vectors = self.encode_fn(list(texts))
+                self._report("chunks_embedded", len(batch))
+                if not self._put(outbox, (list(ids), list(texts), vectors, list(metas))):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put_final(outbox)
+
+    def _put_final(self, q: queue.Queue):
+        # Luon bao ket thuc cho stage sau (ke ca khi loi) de khong ai cho mai
+        while True:
+            try:
+                q.put(_DONE, timeout=0.5)
+                return
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _index_worker(self, inbox: queue.Queue):
+        try:
+            while True:
+                item = inbox.get()
+                if item is _DONE or self._stop.is_set():
+                    break
+                ids, texts, vectors, metas = item
+                self.upsert_fn(ids=ids, documents=texts, embeddings=vectors, metadatas=metas)
+                self._report("chunks_indexed", len(ids))
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, records: Iterable[Record]) -> Dict:
+        """Chay het generator `records`; loi o bat ky stage nao duoc raise lai o day"""
+        start = time.time()
+        embed_q = queue.Queue(maxsize=self.max_pending)
+        index_q = queue.Queue(maxsize=self.max_pending)
+        embedder = threading.Thread(target=self._embed_worker, args=(embed_q, index_q), daemon=True, name="ingest-embed")
+        indexer = threading.Thread(target=self._index_worker, args=(index_q,), daemon=True, name="ingest-index")
+        embedder.start()
+        indexer.start()
+        try:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    self._report("chunks_read", len(batch))
+                    if not self._put(embed_q, batch):
+                        break
+                    batch = []
+            if batch and not self._stop.is_set():
+                self._report("chunks_read", len(batch))
+                self._put(embed_q, batch)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put_final(embed_q)
+            embedder.join()
+            indexer.join()
+        if self._error is not None:
+            raise self._error
+        self.stats["seconds"] = round(time.time() - start, 3)
+        return dict(self.stats)
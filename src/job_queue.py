@@ -0,0 +1,117 @@
+import time
+import uuid
+import threading
+from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from database import SessionLocal, SourceModel
+
+
+class QueueFullError(Exception):
+    """Hang doi ingest da day, client nen thu lai sau."""
+
+
+class IngestJob:
+    """Trang thai cua 1 job ingest (extract -> split -> embed -> Chroma upsert, 3 buoc sau chay theo lo)."""
+
+    def __init__(self, session_id: str, source_row_id: int, input_source: str, input_type: str):
+        self.id = str(uuid.uuid4())
+        self.session_id = session_id
+        self.source_row_id = source_row_id
+        self.input_source = input_source
+        self.input_type = input_type
+        self.stage = "queued"
+        self.status = "processing"
+        self.error = None
+        self.progress = {}
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> Dict:
+        end = self.finished_at or time.time()
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "source_id": self.source_row_id,
+            "source": self.input_source,
+            "type": self.input_type,
+            "status": self.status,
+            "stage": self.stage,
+            "error": self.error,
+            "progress": self.progress,
+            "queued_seconds": round((self.started_at or end) - self.created_at, 3),
+            "elapsed_seconds": round(end - self.created_at, 3),
+        }
+
+
+class IngestQueue:
+    """Worker pool co gioi han chay process_input_to_vector ngoai request thread."""
+
+    def __init__(self, composer, max_workers: int = 2, max_pending: int = 200, max_history: int = 1000):
+        self.composer = composer
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    def submit(self, session_id: str, source_row_id: int, input_source: str, input_type: str) -> IngestJob:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Dang co {self._pending} job cho xu ly.")
+            self._pending += 1
+            self._prune_history()
+            job = IngestJob(session_id, source_row_id, input_source, input_type)
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def _prune_history(self):
+        # Chi giu lai max_history job gan nhat da ket thuc (dict giu thu tu chen)
+        finished = [jid for jid, j in self.jobs.items() if j.finished_at]
+        for jid in finished[:max(0, len(finished) - self.max_history)]:
+            del self.jobs[jid]
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    def _set_stage(self, job: IngestJob, stage: str):
+        job.stage = stage
+        print(f"[JOB {job.id[:8]}] {stage}")
+
+    def _run(self, job: IngestJob):
+        job.started_at = time.time()
+        try:
+            success = self.composer.process_input_to_vector(
+                job.input_source, job.input_type, session_id=job.session_id,
+                on_stage=lambda stage: self._set_stage(job, stage),
+                on_progress=lambda stats: setattr(job, "progress", stats)
+            )
+            job.status = "done" if success else "error"
+            if not success:
+                job.error = "Khong trich xuat duoc noi dung."
+        except Exception as e:
+            print(f"[JOB {job.id[:8]}] Loi: {e}")
+            job.status = "error"
+            job.error = str(e)
+        finally:
+            job.stage = job.status
+            job.finished_at = time.time()
+            self._update_source_status(job)
+            with self._lock:
+                self._pending -= 1
+
+    def _update_source_status(self, job: IngestJob):
+        db = SessionLocal()
+        try:
+            src = db.query(SourceModel).filter(SourceModel.id == job.source_row_id).first()
+            if src:
+                src.status = job.status
+                db.commit()
+        finally:
+            db.close()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,156 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List
+
+# Tham so BM25 chuan (Okapi)
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Hang so cua Reciprocal Rank Fusion (Cormack et al.)
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    """Chuan hoa giong Evaluator.clean_text (NFC, chu thuong, bo dau cau) roi tach am tiet.
+
+    Tu tieng Viet thuong gom nhieu am tiet ("tri tue", "nhan tao") nen them bigram am tiet
+    ke nhau: tieu de muc khop dung cum tu duoc diem cao hon khop tung am tiet le.
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFC', text.lower())
+    syllables = re.sub(r'[^\w\s]', ' ', text).split()
+    return syllables + [f"{a}_{b}" for a, b in zip(syllables, syllables[1:])]
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = RRF_K) -> List[str]:
+    """Gop nhieu danh sach id da xep hang: score = sum 1 / (k + hang). Khong can chuan hoa diem."""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+class LexicalIndex:
+    """Inverted index BM25 theo session, luu trong SQLite.
+
+    Posting (session, term, chunk, tf) duoc ghi ngay luc ingest (cung lo voi upsert vector),
+    nen truy van chi doc posting cua cac term trong cau hoi thay vi quet toan bo chunk.
+    Chunk ID giong ID ben Vector DB (hash noi dung), chunk da co thi bo qua.
+    """
+
+    def __init__(self, db_path: str):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS lex_chunks ("
+            " session_id TEXT NOT NULL, chunk_id TEXT NOT NULL, length INTEGER NOT NULL,"
+            " content TEXT NOT NULL, source_id INTEGER, chunk_index INTEGER,"
+            " PRIMARY KEY (session_id, chunk_id));"
+            "CREATE TABLE IF NOT EXISTS lex_postings ("
+            " session_id TEXT NOT NULL, term TEXT NOT NULL, chunk_id TEXT NOT NULL, tf INTEGER NOT NULL,"
+            " PRIMARY KEY (session_id, term, chunk_id)) WITHOUT ROWID;"
+        )
+        self._conn.commit()
+
+    def add(self, session_id: str, ids: List[str], documents: List[str], metadatas: List[Dict]):
+        """Them 1 lo chunk vao index (goi cung luc voi upsert vao Vector DB)"""
+        if not ids:
+            return
+        with self._lock:
+            existing = set()
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                marks = ",".join("?" * len(batch))
+                existing.update(cid for (cid,) in self._conn.execute(
+                    f"SELECT chunk_id FROM lex_chunks WHERE session_id = ? AND chunk_id IN ({marks})",
+                    [session_id] + batch
+                ))
+            chunk_rows, posting_rows = [], []
+            for cid, text, meta in zip(ids, documents, metadatas):
+                if cid in existing:
+                    continue
+                existing.add(cid)
+                counts = Counter(tokenize(text))
+                meta = meta or {}
+                chunk_rows.append((session_id, cid, sum(counts.values()), text,
+                                   meta.get("source_id", 0), meta.get("chunk_index", 0)))
+                posting_rows.extend((session_id, term, cid, tf) for term, tf in counts.items())
+            self._conn.executemany("INSERT INTO lex_chunks VALUES (?, ?, ?, ?, ?, ?)", chunk_rows)
+            self._conn.executemany("INSERT OR REPLACE INTO lex_postings VALUES (?, ?, ?, ?)", posting_rows)
+            self._conn.commit()
+
+    def count(self, session_id: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM lex_chunks WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+
+    def search(self, session_id: str, query: str, n_results: int = 20) -> List[Dict]:
+        """Top chunk theo BM25: [{"id", "content", "source_id", "chunk_index", "score"}]"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        marks = ",".join("?" * len(terms))
+        with self._lock:
+            total, avg_len = self._conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM lex_chunks WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if not total:
+                return []
+            rows = self._conn.execute(
+                "SELECT p.term, p.chunk_id, p.tf, c.length FROM lex_postings p"
+                " JOIN lex_chunks c ON c.session_id = p.session_id AND c.chunk_id = p.chunk_id"
+                f" WHERE p.session_id = ? AND p.term IN ({marks})",
+                [session_id] + terms
+            ).fetchall()
+
+        df = Counter(term for term, _, _, _ in rows)
+        scores = {}
+        for term, cid, tf, length in rows:
+            idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_len or 1))
+            scores[cid] = scores.get(cid, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        top = sorted(scores, key=lambda cid: -scores[cid])[:n_results]
+        if not top:
+            return []
+
+        marks = ",".join("?" * len(top))
+        with self._lock:
+            found = {cid: (content, source_id, chunk_index) for cid, content, source_id, chunk_index in self._conn.execute(
+                "SELECT chunk_id, content, source_id, chunk_index FROM lex_chunks"
+                f" WHERE session_id = ? AND chunk_id IN ({marks})",
+                [session_id] + top
+            )}
+        return [{"id": cid, "content": found[cid][0], "source_id": found[cid][1],
+                 "chunk_index": found[cid][2], "score": round(scores[cid], 4)} for cid in top]
+
+    def delete_session(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM lex_postings WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM lex_chunks WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+    def compact(self, valid_session_ids: Iterable[str]) -> int:
+        """Xoa index cua session khong con ton tai, tra ve so session da xoa"""
+        valid = set(valid_session_ids)
+        with self._lock:
+            sessions = [sid for (sid,) in self._conn.execute("SELECT DISTINCT session_id FROM lex_chunks")]
+        removed = [sid for sid in sessions if sid not in valid]
+        for sid in removed:
+            self.delete_session(sid)
+        return len(removed)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            sessions, chunks = self._conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(*) FROM lex_chunks"
+            ).fetchone()
+            postings = self._conn.execute("SELECT COUNT(*) FROM lex_postings").fetchone()[0]
+        return {"sessions": sessions, "chunks": chunks, "postings": postings}
@@ -1,70 +1,440 @@
 import os
 from sqlalchemy.orm import Session
+import openai
 from openai import OpenAI
 import requests
 import json
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
 
 # Import DB để lấy cấu hình
 from database import SessionLocal, LLMConfig
+from llm_router import LLMRouter, is_failure
+from rate_limiter import RateLimiterRegistry
+from context_builder import count_tokens
 
-class LLMManager:
-    def __init__(self):
+# Số request đồng thời tối đa cho mỗi provider (ghi đè bằng biến môi trường LLM_CONCURRENCY_<PROVIDER>)
+DEFAULT_CONCURRENCY_LIMITS = {"openai": 4, "ollama": 1}
+
+# Timeout (connect, read) cho HTTP; sinh bài dài trên Ollama có thể mất vài phút
+OPENAI_TIMEOUT = 120
+OLLAMA_TIMEOUT = (10, 1200)
+
+# Retry cho provider OpenAI-compatible: backoff lũy thừa (có jitter), ưu tiên Retry-After của provider
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Gọi qua router (pool >= 2 provider): chỉ retry 1 lần nếu chờ ngắn, còn lại để router chuyển provider khác
+ROUTED_MAX_RETRIES = 1
+ROUTED_MAX_DELAY = float(os.getenv("LLM_ROUTED_MAX_RETRY_DELAY", "2"))
+# Số token output dự trù khi xin TPM trước request (trừ bù lại theo usage thực tế sau đó)
+COMPLETION_TOKEN_ESTIMATE = 1000
+
+
+class LLMError(Exception):
+    """Lỗi khi gọi LLM (thay cho chuỗi "Lỗi gọi API: ..." trả về trước đây)"""
+    status_code = 502
+    # Mặc định không retry: chỉ lỗi tạm thời (429, timeout, mạng, 5xx) mới được thử lại
+    retryable = False
+
+    def __init__(self, message: str, provider: str = None, retry_after: float = None):
+        super().__init__(message)
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class LLMRateLimitError(LLMError):
+    """Provider vẫn trả 429 sau khi đã retry hết số lần"""
+    status_code = 429
+    retryable = True
+
+
+class LLMTimeoutError(LLMError):
+    status_code = 504
+    retryable = True
+
+
+class LLMConnectionError(LLMError):
+    status_code = 503
+    retryable = True
+
+
+class LLMServerError(LLMError):
+    """Provider trả 5xx"""
+    status_code = 502
+    retryable = True
+
+
+class LLMConfigError(LLMError):
+    """Cấu hình model không hợp lệ (provider lạ...)"""
+    status_code = 400
+
+
+def _retry_after(exc) -> float:
+    """Đọc Retry-After (giây hoặc HTTP-date) / retry-after-ms từ response lỗi của provider"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
         pass
+    return None
+
+
+def _classify_openai_error(exc, provider: str) -> LLMError:
+    """Đổi exception của SDK openai sang LLMError; chỉ lỗi tạm thời (429, 5xx, timeout, mạng) mới retry"""
+    if isinstance(exc, openai.RateLimitError):
+        return LLMRateLimitError(str(exc), provider, _retry_after(exc))
+    if isinstance(exc, openai.APITimeoutError):
+        return LLMTimeoutError(str(exc), provider)
+    if isinstance(exc, openai.APIConnectionError):
+        return LLMConnectionError(str(exc), provider)
+    if isinstance(exc, openai.APIStatusError):
+        if exc.status_code >= 500:
+            return LLMServerError(str(exc), provider, _retry_after(exc))
+        err = LLMError(str(exc), provider, _retry_after(exc))
+        err.status_code = 400
+        return err
+    return LLMError(str(exc), provider)
+
+
+def _is_retryable(err: LLMError) -> bool:
+    return err.retryable
+
+
+class ClientRegistry:
+    """Giữ HTTP client dùng lâu dài (keep-alive, connection pool) theo ID cấu hình"""
+
+    def __init__(self, pool_size: int = 8):
+        self.pool_size = pool_size
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def openai(self, config) -> OpenAI:
+        with self._lock:
+            client = self._clients.get(config.id)
+            if client is None:
+                # Retry do LLMManager tự xử lý (theo rate limiter + Retry-After), tắt retry của SDK
+                client = OpenAI(base_url=config.base_url, api_key=config.api_key, timeout=OPENAI_TIMEOUT,
+                                max_retries=0)
+                self._clients[config.id] = client
+            return client
+
+    def ollama(self, key) -> requests.Session:
+        with self._lock:
+            session = self._clients.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._clients[key] = session
+            return session
+
+    def drop(self, key):
+        with self._lock:
+            client = self._clients.pop(key, None)
+        if client is not None and hasattr(client, "close"):
+            client.close()
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._clients)
+        for key in keys:
+            self.drop(key)
+
+
+client_registry = ClientRegistry()
+llm_router = LLMRouter()
+rate_limiters = RateLimiterRegistry()
+
+
+class LLMManager:
+    # Cache cấu hình active dùng chung cho mọi instance, xóa qua invalidate_config()
+    _active_config = None
+    _pool_configs = []
+    _active_loaded = False
+    _config_lock = threading.Lock()
+
+    def __init__(self, concurrency_limits: dict = None, response_cache=None):
+        # ResponseCache (tùy chọn): None thì luôn gọi LLM
+        self.response_cache = response_cache
+        self.concurrency_limits = dict(DEFAULT_CONCURRENCY_LIMITS)
+        for provider in self.concurrency_limits:
+            env_value = os.getenv(f"LLM_CONCURRENCY_{provider.upper()}")
+            if env_value:
+                self.concurrency_limits[provider] = int(env_value)
+        self.concurrency_limits.update(concurrency_limits or {})
+        self._semaphores = {p: threading.BoundedSemaphore(n) for p, n in self.concurrency_limits.items()}
+
+    def get_concurrency_limit(self, provider: str = None) -> int:
+        """Giới hạn song song của provider (mặc định: provider đang active)"""
+        if provider is None:
+            pool = self._get_pool_configs()
+            if pool:
+                # Pool: tổng giới hạn của các provider khác nhau trong pool
+                return sum(self.concurrency_limits.get(p, 1) for p in {c.provider for c in pool})
+            config = self._get_active_config()
+            provider = config.provider if config else "ollama"
+        return self.concurrency_limits.get(provider, 1)
+
+    def _slot(self, provider: str):
+        if provider not in self._semaphores:
+            self._semaphores[provider] = threading.BoundedSemaphore(self.concurrency_limits.get(provider, 1))
+        return self._semaphores[provider]
+
+    def _load_configs(self):
+        """Đọc cấu hình active + pool router từ DB 1 lần, sau đó dùng cache"""
+        cls = LLMManager
+        if cls._active_loaded:
+            return
+        with cls._config_lock:
+            if not cls._active_loaded:
+                db = SessionLocal()
+                try:
+                    config = db.query(LLMConfig).filter(LLMConfig.is_active == True).first()
+                    pool = db.query(LLMConfig).filter(LLMConfig.in_pool == True).all()
+                    db.expunge_all()
+                    cls._active_config = config
+                    cls._pool_configs = pool
+                    cls._active_loaded = True
+                finally:
+                    db.close()
 
     def _get_active_config(self):
-        """Lấy cấu hình đang được kích hoạt từ DB"""
-        db = SessionLocal()
-        try:
-            config = db.query(LLMConfig).filter(LLMConfig.is_active == True).first()
-            return config
-        finally:
-            db.close()
+        """Lấy cấu hình đang được kích hoạt"""
+        self._load_configs()
+        return LLMManager._active_config
 
-    def send_prompt(self, prompt: str, options: dict = None) -> str:
-        """Hàm chung để gửi prompt, tự động chọn Local hay API"""
+    def _get_pool_configs(self):
+        """Các cấu hình trong pool router (rỗng = chỉ dùng cấu hình active)"""
+        self._load_configs()
+        return LLMManager._pool_configs
+
+    def active_provider_model(self):
+        """(provider, model_name) đang dùng; chưa cấu hình thì là Ollama mặc định"""
+        pool = self._get_pool_configs()
+        if pool:
+            # Ngân sách context theo provider hạn chế nhất trong pool (Ollama context nhỏ)
+            config = next((c for c in pool if c.provider == "ollama"), pool[0])
+            return config.provider, config.model_name
         config = self._get_active_config()
-        
+        if not config:
+            return "ollama", "qwen2.5:3b"
+        return config.provider, config.model_name
+
+    @classmethod
+    def invalidate_config(cls, config_id: int = None):
+        """Gọi khi cấu hình model thay đổi (activate / update / delete)"""
+        with cls._config_lock:
+            cls._active_config = None
+            cls._pool_configs = []
+            cls._active_loaded = False
+        if config_id is not None:
+            client_registry.drop(config_id)
+
+    def _cache_key(self, config, prompt: str, options: dict, pool=None):
+        """Khóa cache nếu request đủ điều kiện (cache bật, temperature thấp), ngược lại None"""
+        if not self.response_cache:
+            return None
+        if pool:
+            # Pool: provider thực tế do router chọn, khóa theo tập model trong pool
+            provider = "ollama" if any(c.provider == "ollama" for c in pool) else "openai"
+            model_name = "pool:" + ",".join(sorted(f"{c.provider}/{c.model_name}" for c in pool))
+        else:
+            provider, model_name = (config.provider, config.model_name) if config else ("ollama", "qwen2.5:3b")
+        if not self.response_cache.is_cacheable(provider, options):
+            return None
+        return self.response_cache.make_key(provider, model_name, prompt, options)
+
+    def send_prompt(self, prompt: str, options: dict = None) -> str:
+        """Hàm chung để gửi prompt, tự động chọn Local hay API (hoặc qua router nếu có pool)"""
+        pool = self._get_pool_configs()
+        config = None if pool else self._get_active_config()
+
+        key = self._cache_key(config, prompt, options, pool)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                print("--- Dùng kết quả LLM từ cache ---")
+                return cached
+
+        if pool:
+            # Pool nhiều provider: không retry lâu trên provider đang quá tải, để router failover
+            call = self._dispatch_routed if len(pool) > 1 else self._dispatch
+            result = llm_router.route(pool, call, prompt, options)
+        else:
+            result = self._dispatch(config, prompt, options)
+        if key and not is_failure(result):
+            self.response_cache.set(key, result)
+        return result
+
+    def _dispatch_routed(self, config, prompt: str, options: dict) -> str:
+        return self._dispatch(config, prompt, options, routed=True)
+
+    def _dispatch(self, config, prompt: str, options: dict, routed: bool = False) -> str:
         # Mặc định nếu chưa cấu hình gì thì fallback về Ollama Local cứng
         if not config:
             print("[WARN] Chưa có cấu hình Active, dùng Ollama mặc định.")
-            return self._call_ollama_raw("qwen2.5:3b", "http://localhost:11434", prompt, options)
+            with self._slot("ollama"):
+                return self._call_ollama_raw("qwen2.5:3b", "http://localhost:11434", prompt, options)
 
         print(f"--- Đang dùng Model: {config.name} ({config.model_name}) ---")
         
         if config.provider == "openai":
-            return self._call_openai_compatible(config, prompt, options)
+            return self._call_openai_compatible(config, prompt, options, routed=routed)
         elif config.provider == "ollama":
-            return self._call_ollama_raw(config.model_name, config.base_url, prompt, options)
+            with self._slot("ollama"):
+                return self._call_ollama_raw(config.model_name, config.base_url, prompt, options, client_key=config.id)
         else:
-            return "Lỗi: Provider không hợp lệ."
+            raise LLMConfigError(f"Provider không hợp lệ: {config.provider}", config.provider)
+
+    def send_prompt_stream(self, prompt: str, options: dict = None):
+        """Giống send_prompt nhưng là generator, trả về từng đoạn token ngay khi nhận được"""
+        pool = self._get_pool_configs()
+        config = None if pool else self._get_active_config()
+
+        key = self._cache_key(config, prompt, options, pool)
+        if key:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        parts = []
+        tokens = self._route_stream(pool, prompt, options) if pool else self._dispatch_stream(config, prompt, options)
+        for token in tokens:
+            parts.append(token)
+            yield token
+        result = "".join(parts)
+        if key and not is_failure(result):
+            self.response_cache.set(key, result)
+
+    def _route_stream(self, pool, prompt: str, options: dict):
+        """Stream qua pool: chỉ failover khi provider lỗi trước token đầu tiên"""
+        last_error = LLMError("Không có provider nào trong pool.")
+        routed = len(pool) > 1
+        for config in llm_router.order(pool):
+            start = time.time()
+            stream = self._dispatch_stream(config, prompt, options, routed=routed)
+            try:
+                first = next(stream, "")
+                if is_failure(first):
+                    raise LLMError("Phản hồi rỗng", config.provider)
+            except LLMError as e:
+                last_error = e
+                llm_router.record_stream(config, start, error=e)
+                print(f"[ROUTER] {config.name} lỗi khi stream, chuyển provider khác: {e}")
+                continue
+            yield first
+            yield from stream
+            llm_router.record_stream(config, start)
+            return
+        raise last_error
+
+    def _dispatch_stream(self, config, prompt: str, options: dict, routed: bool = False):
+        if not config:
+            print("[WARN] Chưa có cấu hình Active, dùng Ollama mặc định.")
+            with self._slot("ollama"):
+                yield from self._stream_ollama_raw("qwen2.5:3b", "http://localhost:11434", prompt, options)
+            return
+
+        print(f"--- Đang dùng Model (stream): {config.name} ({config.model_name}) ---")
 
-    def _call_openai_compatible(self, config, prompt: str, options: dict) -> str:
+        if config.provider == "openai":
+            yield from self._stream_openai_compatible(config, prompt, options, routed=routed)
+        elif config.provider == "ollama":
+            with self._slot("ollama"):
+                yield from self._stream_ollama_raw(config.model_name, config.base_url, prompt, options, client_key=config.id)
+        else:
+            raise LLMConfigError(f"Provider không hợp lệ: {config.provider}", config.provider)
+
+    def _with_retries(self, config, estimated_tokens: int, request, routed: bool = False):
+        """Gọi request() với rate limiter của config; lỗi tạm thời thì backoff rồi thử lại.
+
+        Chờ limiter / backoff diễn ra ngoài semaphore provider để không giữ chỗ của config khác.
+        429 tạm dừng cả limiter theo Retry-After, các request song song cùng config cũng chờ theo.
+        routed=True (gọi từ router): tối đa ROUTED_MAX_RETRIES lần, không chờ quá ROUTED_MAX_DELAY,
+        lỗi ngay để router chuyển sang provider khác.
+        """
+        limiter = rate_limiters.get(config)
+        max_retries = ROUTED_MAX_RETRIES if routed else MAX_RETRIES
+        max_delay = ROUTED_MAX_DELAY if routed else None
+        for attempt in range(max_retries + 1):
+            if not limiter.acquire(estimated_tokens, max_wait=max_delay):
+                raise LLMRateLimitError(f"{config.name} đang bị giới hạn tốc độ", config.provider,
+                                        limiter.stats()["paused_for"] or None)
+            try:
+                with self._slot("openai"):
+                    return request()
+            except Exception as e:
+                err = _classify_openai_error(e, config.provider)
+            delay = err.retry_after
+            if delay is None:
+                delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            if isinstance(err, LLMRateLimitError):
+                limiter.pause(delay)
+            if not _is_retryable(err) or attempt == max_retries or (max_delay is not None and delay > max_delay):
+                print(f"Lỗi API OpenAI/Groq ({config.name}): {err}")
+                raise err
+            print(f"[RETRY] {config.name}: {type(err).__name__}, thử lại sau {delay:.1f}s (lần {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+    def _openai_request(self, config, prompt: str, options: dict, stream: bool = False):
+        client = client_registry.openai(config)
+        # Mapping tham số tùy chỉnh
+        temp = options.get("temperature", 0.2) if options else 0.2
+        return client.chat.completions.create(
+            model=config.model_name,
+            messages=[
+                {"role": "system", "content": "Bạn là trợ lý AI hữu ích, trả lời bằng Tiếng Việt."},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=temp,
+            max_tokens=6000,
+            top_p=0.9,
+            stream=stream,
+        )
+
+    def _call_openai_compatible(self, config, prompt: str, options: dict, routed: bool = False) -> str:
         """Gọi Groq, DeepSeek, OpenAI..."""
+        estimated = count_tokens(prompt, "openai", config.model_name) + COMPLETION_TOKEN_ESTIMATE
+        response = self._with_retries(config, estimated, lambda: self._openai_request(config, prompt, options),
+                                      routed=routed)
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens:
+            rate_limiters.get(config).adjust(estimated, usage.total_tokens)
+        return response.choices[0].message.content
+
+    def _stream_openai_compatible(self, config, prompt: str, options: dict, routed: bool = False):
+        """Stream từ Groq, DeepSeek, OpenAI... (stream=True). Chỉ retry khi chưa nhận token nào"""
+        estimated = count_tokens(prompt, "openai", config.model_name) + COMPLETION_TOKEN_ESTIMATE
+        stream = self._with_retries(config, estimated, lambda: self._openai_request(config, prompt, options, stream=True),
+                                    routed=routed)
+        parts = []
         try:
-            client = OpenAI(
-                base_url=config.base_url,
-                api_key=config.api_key
-            )
-            
-            # Mapping tham số tùy chỉnh
-            temp = options.get("temperature", 0.2) if options else 0.2
-            
-            response = client.chat.completions.create(
-                model=config.model_name,
-                messages=[
-                    {"role": "system", "content": "Bạn là trợ lý AI hữu ích, trả lời bằng Tiếng Việt."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=temp,
-                max_tokens=6000, 
-                top_p=0.9,
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Lỗi API OpenAI/Groq: {e}")
-            return f"Lỗi gọi API: {str(e)}"
+            with self._slot("openai"):
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+        except openai.OpenAIError as e:
+            print(f"Lỗi API OpenAI/Groq (stream): {e}")
+            raise _classify_openai_error(e, config.provider)
+        finally:
+            actual = count_tokens(prompt, "openai", config.model_name) + count_tokens("".join(parts), "openai", config.model_name)
+            rate_limiters.get(config).adjust(estimated, actual)
 
-    def _call_ollama_raw(self, model_name, base_url, prompt: str, options: dict) -> str:
+    def _call_ollama_raw(self, model_name, base_url, prompt: str, options: dict, client_key="default") -> str:
         """Gọi Ollama Local (dự phòng)"""
         try:
             url = f"{base_url}/api/generate"
@@ -74,13 +444,42 @@ class LLMManager:
                 "stream": False,
                 "options": options or {}
             }
-            res = requests.post(url, json=payload)
-            if res.status_code == 200:
-                return res.json().get("response", "")
-            return f"Lỗi Ollama: {res.text}"
-        except Exception as e:
+            res = client_registry.ollama(client_key).post(url, json=payload, timeout=OLLAMA_TIMEOUT)
+        except requests.Timeout as e:
+            raise LLMTimeoutError(f"Ollama timeout: {e}", "ollama")
+        except requests.RequestException as e:
+            print(f"Lỗi kết nối Ollama: {e}")
+            raise LLMConnectionError(f"Không kết nối được Ollama: {e}", "ollama")
+        if res.status_code != 200:
+            raise LLMError(f"Ollama trả về {res.status_code}: {res.text}", "ollama")
+        return res.json().get("response", "")
+
+    def _stream_ollama_raw(self, model_name, base_url, prompt: str, options: dict, client_key="default"):
+        """Stream Ollama: mỗi dòng NDJSON chứa 1 đoạn 'response'"""
+        try:
+            url = f"{base_url}/api/generate"
+            payload = {
+                "model": model_name,
+                "prompt": prompt,
+                "stream": True,
+                "options": options or {}
+            }
+            with client_registry.ollama(client_key).post(url, json=payload, stream=True, timeout=OLLAMA_TIMEOUT) as res:
+                if res.status_code != 200:
+                    raise LLMError(f"Ollama trả về {res.status_code}: {res.text}", "ollama")
+                for line in res.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get("response"):
+                        yield data["response"]
+                    if data.get("done"):
+                        break
+        except requests.Timeout as e:
+            raise LLMTimeoutError(f"Ollama timeout: {e}", "ollama")
+        except requests.RequestException as e:
             print(f"Lỗi kết nối Ollama: {e}")
-            return ""
+            raise LLMConnectionError(f"Không kết nối được Ollama: {e}", "ollama")
 
     # Hàm test kết nối dùng cho nút "Test Connection" ở Frontend
     def test_connection(self, provider, base_url, api_key, model_name):
@@ -95,7 +494,7 @@ class LLMManager:
                 return True, "Kết nối thành công! Trả lời: " + res.choices[0].message.content
             elif provider == "ollama":
                 # Test Ollama đơn giản
-                requests.get(base_url)
+                requests.get(base_url, timeout=10)
                 return True, "Kết nối Ollama thành công!"
         except Exception as e:
             return False, str(e)
\ No newline at end of file
@@ -0,0 +1,171 @@
+import os
+import time
+import random
+import threading
+from typing import List, Dict, Callable, Optional
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Provider loi lien tiep tu nguong nay bi day xuong cuoi thu tu (van dung de failover)
+FAILURE_THRESHOLD = 3
+
+
+class ProviderStats:
+    """Thong ke theo tung LLMConfig: so request dang chay, do tre (EWMA), so loi."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.hedged = 0
+        self.latency_ewma = None
+        self.last_error = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_errors": self.consecutive_errors,
+            "error_rate": round(self.errors / self.requests, 3) if self.requests else 0.0,
+            "hedged": self.hedged,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class LLMRouter:
+    """Phan phoi request toi nhieu LLMConfig trong pool: chon theo trong so hoac it request dang chay nhat,
+    chuyen sang provider khac khi loi, va (tuy chon) gui request du phong khi provider dau qua cham."""
+
+    def __init__(self, strategy: str = None, hedge_after: float = None, max_workers: int = 8):
+        self.strategy = strategy or os.getenv("LLM_ROUTER_STRATEGY", "least_outstanding")
+        # Sau bao nhieu giay khong co ket qua thi gui them 1 request sang provider thu 2 (0 = tat)
+        self.hedge_after = hedge_after if hedge_after is not None else float(os.getenv("LLM_HEDGE_AFTER", "0"))
+        self.stats: Dict[int, ProviderStats] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-router")
+
+    def _stats(self, config) -> ProviderStats:
+        with self._lock:
+            if config.id not in self.stats:
+                self.stats[config.id] = ProviderStats(config.name)
+            return self.stats[config.id]
+
+    def order(self, configs: List) -> List:
+        """Thu tu thu cac provider: phan tu dau la lua chon chinh, phan con lai de failover/hedge"""
+        if self.strategy == "weighted":
+            remaining = list(configs)
+            ordered = []
+            while remaining:
+                weights = [max(c.weight or 1, 1) for c in remaining]
+                pick = random.choices(remaining, weights=weights)[0]
+                ordered.append(pick)
+                remaining.remove(pick)
+            return ordered
+        # least_outstanding: provider loi lien tiep xep cuoi, sau do it request dang chay truoc,
+        # hoa thi provider nhanh hon truoc
+        return sorted(configs, key=lambda c: (
+            self._stats(c).consecutive_errors >= FAILURE_THRESHOLD,
+            self._stats(c).outstanding,
+            self._stats(c).latency_ewma if self._stats(c).latency_ewma is not None else 0.0,
+        ))
+
+    def _timed_call(self, config, call: Callable, prompt: str, options: dict) -> str:
+        st = self._stats(config)
+        with self._lock:
+            st.outstanding += 1
+            st.requests += 1
+        start = time.time()
+        try:
+            result = call(config, prompt, options)
+            if is_failure(result):
+                raise RuntimeError(result or "Phản hồi rỗng")
+            elapsed = time.time() - start
+            with self._lock:
+                st.consecutive_errors = 0
+                st.latency_ewma = elapsed if st.latency_ewma is None else 0.8 * st.latency_ewma + 0.2 * elapsed
+            return result
+        except Exception as e:
+            with self._lock:
+                st.errors += 1
+                st.consecutive_errors += 1
+                st.last_error = str(e)[:200]
+            raise
+        finally:
+            with self._lock:
+                st.outstanding -= 1
+
+    def route(self, configs: List, call: Callable, prompt: str, options: dict) -> str:
+        ordered = self.order(configs)
+        last_error: Optional[Exception] = None
+
+        if self.hedge_after > 0 and len(ordered) >= 2:
+            try:
+                return self._hedged(ordered[0], ordered[1], call, prompt, options)
+            except Exception as e:
+                last_error = e
+                ordered = ordered[2:]
+
+        for config in ordered:
+            try:
+                return self._timed_call(config, call, prompt, options)
+            except Exception as e:
+                print(f"[ROUTER] {config.name} lỗi, chuyển provider khác: {e}")
+                last_error = e
+        raise last_error or RuntimeError("Không có provider nào trong pool.")
+
+    def _hedged(self, primary, secondary, call: Callable, prompt: str, options: dict) -> str:
+        futures = {self._executor.submit(self._timed_call, primary, call, prompt, options): primary}
+        done, _ = wait(futures, timeout=self.hedge_after)
+        if not done:
+            print(f"[ROUTER] {primary.name} chậm hơn {self.hedge_after}s, gửi thêm sang {secondary.name}")
+            # _stats tu lay self._lock (Lock khong re-entrant): lay stats truoc roi moi khoa
+            secondary_stats = self._stats(secondary)
+            with self._lock:
+                secondary_stats.hedged += 1
+            futures[self._executor.submit(self._timed_call, secondary, call, prompt, options)] = secondary
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    last_error = e
+            # Provider chinh loi truoc moc hedge: failover sang provider thu 2 ngay
+            if not pending and len(futures) == 1:
+                futures[self._executor.submit(self._timed_call, secondary, call, prompt, options)] = secondary
+                pending = {f for f, c in futures.items() if c is secondary}
+        raise last_error
+
+    def record_stream(self, config, start: float, error: Exception = None):
+        """Cap nhat thong ke cho request stream (router chi chon provider, khong hedge)"""
+        st = self._stats(config)
+        with self._lock:
+            st.requests += 1
+            if error is not None:
+                st.errors += 1
+                st.consecutive_errors += 1
+                st.last_error = str(error)[:200]
+            else:
+                st.consecutive_errors = 0
+                elapsed = time.time() - start
+                st.latency_ewma = elapsed if st.latency_ewma is None else 0.8 * st.latency_ewma + 0.2 * elapsed
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "strategy": self.strategy,
+                "hedge_after": self.hedge_after,
+                "providers": {cid: st.to_dict() for cid, st in self.stats.items()},
+            }
+
+
+def is_failure(result) -> bool:
+    # Loi provider duoc raise (LLMError); ket qua rong cung coi nhu that bai de failover
+    return not result
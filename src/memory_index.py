@@ -0,0 +1,176 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+def _normalize(vectors) -> np.ndarray:
+    matrix = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32))
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class SessionIndex:
+    """Toan bo vector cua 1 session trong 1 ma tran float32 lien tuc (da chuan hoa).
+
+    Trang thai (ids, documents, metadatas, matrix) duoc thay the nguyen khoi khi cap nhat,
+    nen search dang chay tren ban cu khong bi anh huong.
+    """
+
+    def __init__(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings):
+        matrix = _normalize(embeddings) if len(ids) else np.zeros((0, 0), dtype=np.float32)
+        self._state = (list(ids), list(documents), list(metadatas), matrix)
+        self._write_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @property
+    def nbytes(self) -> int:
+        ids, documents, _, matrix = self._state
+        # Uoc luong: ma tran + text (metadata nho, bo qua)
+        return matrix.nbytes + sum(len(d) for d in documents) + 64 * len(ids)
+
+    def upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings):
+        with self._write_lock:
+            self._upsert(ids, documents, metadatas, embeddings)
+
+    def _upsert(self, ids: List[str], documents: List[str], metadatas: List[Dict], embeddings):
+        old_ids, old_docs, old_metas, old_matrix = self._state
+        vectors = _normalize(embeddings)
+        position = {cid: i for i, cid in enumerate(old_ids)}
+        new_ids, new_docs, new_metas = list(old_ids), list(old_docs), list(old_metas)
+        matrix = old_matrix.copy() if old_matrix.size else np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        append_rows = []
+        for i, cid in enumerate(ids):
+            if cid in position:
+                j = position[cid]
+                new_docs[j], new_metas[j] = documents[i], metadatas[i]
+                matrix[j] = vectors[i]
+            else:
+                position[cid] = len(new_ids)
+                new_ids.append(cid)
+                new_docs.append(documents[i])
+                new_metas.append(metadatas[i])
+                append_rows.append(i)
+        if append_rows:
+            matrix = np.ascontiguousarray(np.vstack([matrix, vectors[append_rows]]))
+        self._state = (new_ids, new_docs, new_metas, matrix)
+
+    def search(self, query_embeddings, n_results: int, include: List[str]) -> Dict:
+        """Top-k cosine cho nhieu query: 1 phep nhan ma tran + argpartition. Ket qua cung dang voi Chroma."""
+        ids, documents, metadatas, matrix = self._state
+        queries = _normalize(query_embeddings)
+        n = len(ids)
+        k = min(n_results, n)
+        result = {"ids": [], **{key: [] for key in include}, "distances": []}
+        if k == 0:
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+        scores = queries @ matrix.T  # (q, n)
+        if k < n:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(n), (len(queries), 1))
+        for qi in range(len(queries)):
+            row = top[qi][np.argsort(-scores[qi, top[qi]])]
+            result["ids"].append([ids[i] for i in row])
+            # Vector da chuan hoa: L2^2 = 2 - 2*cos, cung thu tu voi Chroma (metric l2 mac dinh)
+            result["distances"].append((2.0 - 2.0 * scores[qi, row]).tolist())
+            if "documents" in include:
+                result["documents"].append([documents[i] for i in row])
+            if "metadatas" in include:
+                result["metadatas"].append([metadatas[i] for i in row])
+            if "embeddings" in include:
+                result["embeddings"].append(matrix[row])
+        return result
+
+    def get(self, include: List[str]) -> Dict:
+        ids, documents, metadatas, matrix = self._state
+        result = {"ids": list(ids)}
+        if "documents" in include:
+            result["documents"] = list(documents)
+        if "metadatas" in include:
+            result["metadatas"] = list(metadatas)
+        if "embeddings" in include:
+            result["embeddings"] = matrix
+        return result
+
+
+class MemoryIndexCache:
+    """LRU cac SessionIndex: session nho (<= max_chunks) duoc giu trong RAM, tong dung luong <= max_bytes."""
+
+    def __init__(self, max_chunks: int = 5000, max_bytes: int = 256 * 1024 * 1024):
+        self.max_chunks = max_chunks
+        self.max_bytes = max_bytes
+        self._indexes: "OrderedDict[str, SessionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[SessionIndex]:
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is None:
+                self.misses += 1
+                return None
+            self._indexes.move_to_end(session_id)
+            self.hits += 1
+            return index
+
+    def peek(self, session_id: str) -> Optional[SessionIndex]:
+        """Nhu get nhung khong tinh vao hit/miss va khong doi thu tu LRU"""
+        with self._lock:
+            return self._indexes.get(session_id)
+
+    def put(self, session_id: str, index: SessionIndex):
+        if len(index) > self.max_chunks:
+            return
+        with self._lock:
+            self._indexes[session_id] = index
+            self._indexes.move_to_end(session_id)
+            self._evict()
+
+    def upsert(self, session_id: str, ids, documents, metadatas, embeddings):
+        """Cap nhat index dang nam trong RAM sau khi ingest; vuot nguong thi bo ra (dung Chroma)"""
+        with self._lock:
+            index = self._indexes.get(session_id)
+        if index is None:
+            return
+        index.upsert(ids, documents, metadatas, embeddings)
+        with self._lock:
+            if len(index) > self.max_chunks:
+                self._indexes.pop(session_id, None)
+            else:
+                self._evict()
+
+    def drop(self, session_id: str):
+        with self._lock:
+            self._indexes.pop(session_id, None)
+
+    def _evict(self):
+        total = sum(index.nbytes for index in self._indexes.values())
+        while total > self.max_bytes and len(self._indexes) > 1:
+            _, index = self._indexes.popitem(last=False)
+            total -= index.nbytes
+            self.evictions += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._indexes),
+                "chunks": sum(len(index) for index in self._indexes.values()),
+                "bytes": sum(index.nbytes for index in self._indexes.values()),
+                "max_bytes": self.max_bytes,
+                "max_chunks": self.max_chunks,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
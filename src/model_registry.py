@@ -0,0 +1,85 @@
+import time
+import threading
+from typing import Dict, Tuple, Any
+
+# Registry dung chung trong process: moi (loai model, ten/size) chi nap 1 lan, khi can moi nap.
+# Backend whisper / sentence_transformers duoc import ben trong ham de import api.py khong keo theo torch.
+
+_models: Dict[Tuple[str, str], Any] = {}
+_load_seconds: Dict[Tuple[str, str], float] = {}
+_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def _lock_for(key: Tuple[str, str]) -> threading.Lock:
+    with _registry_lock:
+        if key not in _locks:
+            _locks[key] = threading.Lock()
+        return _locks[key]
+
+
+def _get_or_load(key: Tuple[str, str], loader):
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _lock_for(key):
+        model = _models.get(key)
+        if model is None:
+            print(f"Dang tai model {key[0]} ({key[1]})...")
+            start = time.time()
+            model = loader()
+            _load_seconds[key] = round(time.time() - start, 2)
+            _models[key] = model
+        return model
+
+
+def whisper_name(model_size: str, backend: str = "openai-whisper") -> str:
+    """Ten cua transcriber trong registry (dung cho unload / is_loaded)"""
+    return model_size if backend == "openai-whisper" else f"{model_size}@{backend}"
+
+
+def get_whisper(model_size: str = "base", backend: str = "openai-whisper", **options):
+    """Transcriber theo backend (xem transcription_backend.py), transcribe(...) -> {"text": ...}"""
+    def load():
+        from transcription_backend import load_transcriber
+        return load_transcriber(model_size, backend=backend, **options)
+    return _get_or_load(("whisper", whisper_name(model_size, backend)), load)
+
+
+def is_loaded(kind: str, name: str) -> bool:
+    return (kind, name) in _models
+
+
+def get_embedder(model_name: str = "all-MiniLM-L6-v2", backend: str = "torch",
+                 threads: int = 0, batch_size: int = 64):
+    def load():
+        from embedding_backend import load_embedder
+        return load_embedder(model_name, backend=backend, threads=threads, batch_size=batch_size)
+    # Backend torch giu ten cu de /admin/unload?name=... van dung nhu truoc
+    name = model_name if backend == "torch" else f"{model_name}@{backend}"
+    return _get_or_load(("embedder", name), load)
+
+
+def warm_up(whisper_size: str = "base", embedder_name: str = "all-MiniLM-L6-v2",
+            whisper_options: Dict = None, embedder_options: Dict = None):
+    """Nap truoc cac model hay dung (goi o background khi khoi dong server)"""
+    get_embedder(embedder_name, **(embedder_options or {}))
+    get_whisper(whisper_size, **(whisper_options or {}))
+
+
+def unload(kind: str = None, name: str = None) -> int:
+    """Giai phong model khoi bo nho; khong truyen gi thi unload tat ca"""
+    removed = 0
+    with _registry_lock:
+        for key in list(_models):
+            if (kind is None or key[0] == kind) and (name is None or key[1] == name):
+                del _models[key]
+                removed += 1
+    if removed:
+        import gc
+        gc.collect()
+    return removed
+
+
+def loaded_models() -> Dict[str, float]:
+    return {f"{kind}:{name}": _load_seconds.get((kind, name)) for kind, name in list(_models)}
@@ -1,6 +1,7 @@
 import os
+import json
 import requests
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator
 
 class OllamaClient:
     def __init__(self, model: str = "qwen2.5:7b", host: str = None, timeout: int = 1200):
@@ -36,10 +37,7 @@ class OllamaClient:
             print(f"Khong the ket noi toi Ollama tai {self.base_url}")
             return False
 
-    def send_prompt(self, prompt: str, system: str = "", options: Dict[str, Any] = None) -> Optional[str]:
-        """Gui prompt va nhan ket qua"""
-        url = f"{self.base_url}/api/generate"
-        
+    def _build_payload(self, prompt: str, system: str, options: Optional[Dict[str, Any]], stream: bool) -> Dict[str, Any]:
         # Cau hinh mac dinh
         default_options = {
             "temperature": 0.3,
@@ -52,14 +50,19 @@ class OllamaClient:
         if options:
             default_options.update(options)
 
-        payload = {
+        return {
             "model": self.model,
             "prompt": prompt,
             "system": system,
-            "stream": False,
+            "stream": stream,
             "options": default_options
         }
 
+    def send_prompt(self, prompt: str, system: str = "", options: Dict[str, Any] = None) -> Optional[str]:
+        """Gui prompt va nhan ket qua"""
+        url = f"{self.base_url}/api/generate"
+        payload = self._build_payload(prompt, system, options, stream=False)
+
         try:
             print("Dang gui yeu cau xu ly...")
             print(f"-> Dang gui Prompt dai: {len(prompt)} ky tu...")
@@ -76,6 +79,28 @@ class OllamaClient:
             print(f"Loi API: {e}")
             return None
 
+    def send_prompt_stream(self, prompt: str, system: str = "", options: Dict[str, Any] = None) -> Iterator[str]:
+        """Gui prompt va tra ve tung doan token ngay khi Ollama sinh ra"""
+        url = f"{self.base_url}/api/generate"
+        payload = self._build_payload(prompt, system, options, stream=True)
+
+        try:
+            with requests.post(url, json=payload, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    if data.get('response'):
+                        yield data['response']
+                    if data.get('done'):
+                        break
+
+        except requests.exceptions.Timeout:
+            print(f"Yeu cau bi qua thoi gian ({self.timeout}s)")
+        except requests.exceptions.RequestException as e:
+            print(f"Loi API: {e}")
+
 # --- Huong dan su dung ---
 if __name__ == "__main__":
     # Khoi tao
@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Token bucket nap lai deu theo phut (vd RPM, TPM). acquire() block cho toi khi du token."""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """So giay can cho de co du `amount` token (0 = lay duoc ngay)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # request lon hon ca bucket: cho bucket day roi cho qua
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        # Cho phep am de request sau phai cho bu phan vuot (vd khi usage thuc te > uoc luong)
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """Gioi han RPM + TPM cho 1 LLMConfig. Khi provider tra 429 thi tam dung ca limiter den het Retry-After."""
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        self.rpm = TokenBucket(rpm) if rpm else None
+        self.tpm = TokenBucket(tpm) if tpm else None
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 0, max_wait: Optional[float] = None) -> bool:
+        """Chiem 1 request + `tokens` token uoc luong, block cho toi khi duoc phep.
+        Neu phai cho lau hon max_wait thi bo cuoc ngay (khong chiem gi), tra ve False."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                delay = max(0.0, self.paused_until - now)
+                if self.rpm:
+                    delay = max(delay, self.rpm.wait_time(1, now))
+                if self.tpm and tokens:
+                    delay = max(delay, self.tpm.wait_time(tokens, now))
+                if delay <= 0:
+                    if self.rpm:
+                        self.rpm.take(1)
+                    if self.tpm and tokens:
+                        self.tpm.take(tokens)
+                    return True
+                if max_wait is not None and delay > max_wait:
+                    return False
+                self.waited += delay
+            time.sleep(delay)
+
+    def adjust(self, estimated: int, actual: int):
+        """Bu tru chenh lech giua so token uoc luong va usage thuc te provider bao ve"""
+        if self.tpm and actual is not None:
+            with self._lock:
+                self.tpm.take(actual - estimated)
+
+    def pause(self, seconds: float):
+        """Provider bao qua tai (429): moi request dung limiter nay cho het `seconds`"""
+        with self._lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "rpm": self.rpm.capacity if self.rpm else None,
+                "tpm": self.tpm.capacity if self.tpm else None,
+                "throttled": self.throttled,
+                "waited_seconds": round(self.waited, 2),
+                "paused_for": round(max(0.0, self.paused_until - now), 2),
+            }
+
+
+class RateLimiterRegistry:
+    """1 RateLimiter cho moi LLMConfig; config khong khai bao thi dung LLM_RPM_LIMIT / LLM_TPM_LIMIT (neu co)"""
+
+    def __init__(self):
+        self.default_rpm = int(os.getenv("LLM_RPM_LIMIT", "0")) or None
+        self.default_tpm = int(os.getenv("LLM_TPM_LIMIT", "0")) or None
+        self._limiters: Dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, config) -> RateLimiter:
+        rpm = getattr(config, "rpm_limit", None) or self.default_rpm
+        tpm = getattr(config, "tpm_limit", None) or self.default_tpm
+        with self._lock:
+            limiter = self._limiters.get(config.id)
+            # Tao lai khi gioi han tren config thay doi
+            if limiter is None or limiter.limits != (rpm, tpm):
+                limiter = RateLimiter(rpm, tpm)
+                limiter.limits = (rpm, tpm)
+                self._limiters[config.id] = limiter
+            return limiter
+
+    def drop(self, key):
+        with self._lock:
+            self._limiters.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {cid: limiter.stats() for cid, limiter in self._limiters.items()}
@@ -0,0 +1,116 @@
+import os
+import json
+import threading
+from typing import Dict
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, SourceRegistryEntry, init_db
+
+
+class SourceRegistry:
+    """Map (session_id, ten nguon) -> ID trich dan, luu trong bang source_registry."""
+
+    def __init__(self, legacy_map_file: str = None):
+        init_db()
+        self._lock = threading.Lock()
+        if legacy_map_file:
+            self._migrate_json(legacy_map_file)
+
+    def _migrate_json(self, path: str):
+        """Chuyen source_map.json cu vao DB (chi chay 1 lan, sau do doi ten file)"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Khong doc duoc {path}: {e}")
+            return
+
+        db = SessionLocal()
+        try:
+            migrated = 0
+            for session_id, mapping in data.items():
+                # Format cu (value la int) khong co session -> bo qua nhu truoc day
+                if not isinstance(mapping, dict):
+                    continue
+                for source_name, source_id in mapping.items():
+                    exists = db.query(SourceRegistryEntry.id).filter(
+                        SourceRegistryEntry.session_id == session_id,
+                        SourceRegistryEntry.source_name == source_name
+                    ).first()
+                    if not exists:
+                        db.add(SourceRegistryEntry(session_id=session_id, source_name=source_name, source_id=source_id))
+                        migrated += 1
+            db.commit()
+        finally:
+            db.close()
+        os.replace(path, path + ".migrated")
+        print(f"Da chuyen {migrated} nguon tu source_map.json vao DB.")
+
+    def get_or_create(self, source_name: str, session_id: str) -> int:
+        db = SessionLocal()
+        try:
+            for _ in range(5):
+                entry = db.query(SourceRegistryEntry).filter(
+                    SourceRegistryEntry.session_id == session_id,
+                    SourceRegistryEntry.source_name == source_name
+                ).first()
+                if entry:
+                    return entry.source_id
+
+                # Cap ID = max + 1 trong session; UniqueConstraint chan 2 process cap trung
+                with self._lock:
+                    max_id = db.query(func.max(SourceRegistryEntry.source_id)).filter(
+                        SourceRegistryEntry.session_id == session_id
+                    ).scalar() or 0
+                    db.add(SourceRegistryEntry(session_id=session_id, source_name=source_name, source_id=max_id + 1))
+                    try:
+                        db.commit()
+                        return max_id + 1
+                    except IntegrityError:
+                        db.rollback()
+            raise RuntimeError(f"Khong cap duoc source ID cho {source_name}")
+        finally:
+            db.close()
+
+    def session_map(self, session_id: str) -> Dict[int, str]:
+        """{source_id: ten nguon} cua 1 session"""
+        db = SessionLocal()
+        try:
+            rows = db.query(SourceRegistryEntry.source_id, SourceRegistryEntry.source_name).filter(
+                SourceRegistryEntry.session_id == session_id
+            ).all()
+            return {sid: name for sid, name in rows}
+        finally:
+            db.close()
+
+    def delete_session(self, session_id: str):
+        db = SessionLocal()
+        try:
+            db.query(SourceRegistryEntry).filter(SourceRegistryEntry.session_id == session_id).delete()
+            db.commit()
+        finally:
+            db.close()
+
+    def compact(self, valid_session_ids) -> int:
+        """Xoa so thu tu nguon cua cac session khong con ton tai, tra ve so dong da xoa"""
+        db = SessionLocal()
+        try:
+            removed = db.query(SourceRegistryEntry).filter(
+                SourceRegistryEntry.session_id.notin_(list(valid_session_ids))
+            ).delete(synchronize_session=False)
+            db.commit()
+            return removed
+        finally:
+            db.close()
+
+    def clear(self):
+        db = SessionLocal()
+        try:
+            db.query(SourceRegistryEntry).delete()
+            db.commit()
+        finally:
+            db.close()
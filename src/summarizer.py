@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+import threading
+from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+
+from context_builder import count_tokens, token_budget
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+
+
+def pack_groups(texts: List[str], budget: int, provider: str = "ollama", model_name: str = "",
+                separator: str = "\n") -> List[List[str]]:
+    """Gom cac doan lien tiep (giu thu tu) thanh nhom sao cho moi nhom <= budget token.
+    Doan tu no da vuot budget thi dung 1 minh 1 nhom."""
+    sep_tokens = count_tokens(separator, provider, model_name)
+    groups, current, used = [], [], 0
+    for text in texts:
+        cost = count_tokens(text, provider, model_name) + sep_tokens
+        if current and used + cost > budget:
+            groups.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += cost
+    if current:
+        groups.append(current)
+    return groups
+
+
+class MapReduceSummarizer:
+    """Tom tat phan cap cho transcript dai.
+
+    Map: gom chunk cua tung nguon thanh nhom vua ngan sach token cua provider (token_budget),
+    tom tat song song (cache theo hash noi dung nhom).
+    Reduce: gop cac ban tom tat thanh digest; neu van vuot ngan sach token thi lap lai tren cac ban tom tat.
+    """
+
+    MAP_PROMPT = (
+        "Tóm tắt ngắn gọn đoạn nội dung sau bằng tiếng Việt, giữ lại các ý chính, số liệu, tên riêng.\n"
+        "Chỉ trả về bản tóm tắt, không giải thích thêm.\n"
+        "Nội dung:\n{text}"
+    )
+    REDUCE_PROMPT = (
+        "Gộp các bản tóm tắt từng phần sau thành một bản tóm tắt tổng thể mạch lạc bằng tiếng Việt, "
+        "theo đúng thứ tự nội dung, không bỏ sót ý quan trọng.\n"
+        "Các bản tóm tắt:\n{text}"
+    )
+
+    def __init__(self, llm, cache_dir: str, max_workers: Optional[int] = None):
+        self.llm = llm
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    # --- cache tom tat tung phan, 1 file JSON cho moi (session, nguon) ---
+    def _cache_path(self, session_id: str, source_id) -> str:
+        return os.path.join(self.cache_dir, session_id, f"source_{source_id}.json")
+
+    def _load_cache(self, session_id: str, source_id) -> Dict[str, str]:
+        try:
+            with open(self._cache_path(session_id, source_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, session_id: str, source_id, data: Dict[str, str]):
+        path = self._cache_path(session_id, source_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            with open(path + ".tmp", 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+
+    def _summarize(self, template: str, text: str) -> str:
+        return (self.llm.send_prompt(template.format(text=text), options={"temperature": 0.2, "num_predict": 400}) or "").strip()
+
+    def _parallel(self, template: str, texts: List[str]) -> List[str]:
+        workers = self.max_workers or self.llm.get_concurrency_limit()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(lambda t: self._summarize(template, t), texts))
+
+    def map_sources(self, session_id: str, chunks_by_source: Dict[int, List[str]],
+                    budget: Optional[int] = None) -> List[str]:
+        """Tom tat tung nhom chunk cua moi nguon (giu thu tu, moi nhom <= budget token),
+        dung lai ket qua da cache.
+
+        Nhom chua co trong cache cua tat ca cac nguon duoc gui song song trong 1 lan.
+        """
+        provider, model_name = self.llm.active_provider_model()
+        budget = budget or token_budget(provider)
+        plan = {}
+        todo = []
+        for source_id in sorted(chunks_by_source):
+            chunks = chunks_by_source[source_id]
+            groups = ["\n".join(g) for g in pack_groups(chunks, budget, provider, model_name)]
+            keys = [_hash(g) for g in groups]
+            cache = self._load_cache(session_id, source_id)
+            plan[source_id] = (keys, cache)
+            todo.extend((source_id, k, g) for k, g in zip(keys, groups) if k not in cache)
+
+        if todo:
+            print(f"-> Tom tat {len(todo)} nhom chunk moi ({len(plan)} nguon)")
+            for (source_id, k, _), summary in zip(todo, self._parallel(self.MAP_PROMPT, [g for _, _, g in todo])):
+                plan[source_id][1][k] = summary
+            for source_id in {sid for sid, _, _ in todo}:
+                keys, cache = plan[source_id]
+                # Chi giu lai cac nhom con ton tai de file cache khong phinh ra
+                self._save_cache(session_id, source_id, {k: cache[k] for k in keys})
+
+        partials = []
+        for source_id in sorted(plan):
+            keys, cache = plan[source_id]
+            partials.extend(cache[k] for k in keys)
+        return partials
+
+    def reduce(self, summaries: List[str], budget: Optional[int] = None) -> str:
+        provider, model_name = self.llm.active_provider_model()
+        budget = budget or token_budget(provider)
+        summaries = [s for s in summaries if s]
+        while len(summaries) > 1:
+            combined = "\n\n".join(summaries)
+            if count_tokens(combined, provider, model_name) <= budget:
+                return self._summarize(self.REDUCE_PROMPT, combined)
+            # Qua dai: gop tung nhom ban tom tat vua ngan sach roi lap lai
+            groups = pack_groups(summaries, budget, provider, model_name, separator="\n\n")
+            if len(groups) == len(summaries):
+                # Moi ban tom tat da gan bang ngan sach: ghep tung cap de vong lap van thu nho duoc
+                groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+            groups = ["\n\n".join(g) for g in groups]
+            summaries = [s for s in self._parallel(self.REDUCE_PROMPT, groups) if s]
+        return summaries[0] if summaries else ""
+
+    def summarize(self, session_id: str, chunks_by_source: Dict[int, List[str]], budget: Optional[int] = None) -> str:
+        partials = self.map_sources(session_id, chunks_by_source, budget)
+        # Digest cung duoc cache theo hash cua cac ban tom tat tung phan
+        digest_key = _hash("\n".join(partials) + f"|{budget}")
+        cache = self._load_cache(session_id, "digest")
+        if digest_key not in cache:
+            cache = {digest_key: self.reduce(partials, budget)}
+            self._save_cache(session_id, "digest", cache)
+        return cache[digest_key]
@@ -0,0 +1,157 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, Optional, Union
+
+import numpy as np
+
+SAMPLE_RATE = 16000  # Whisper (moi backend) lam viec voi audio mono 16 kHz
+
+# openai-whisper: PyTorch goc (cham tren CPU)
+# faster-whisper: CTranslate2, compute_type int8 tren CPU (`pip install faster-whisper`)
+# whisper.cpp:    ban C/C++ qua binding pywhispercpp (`pip install pywhispercpp`)
+BACKENDS = ("openai-whisper", "faster-whisper", "whisper.cpp")
+
+# Tu lon (chinh xac) den nho (nhanh), dung cho che do model_size="auto"
+MODEL_SIZES = ("large-v3", "large-v3-turbo", "medium", "small", "base", "tiny")
+AUTO_MODEL_SIZE = "auto"
+
+# Real-time factor uoc luong tren CPU (giay xu ly / giay audio), chi dung den khi do duoc RTF that
+ESTIMATED_RTF = {
+    "openai-whisper": {"tiny": 0.1, "base": 0.2, "small": 0.6, "medium": 1.8, "large-v3-turbo": 1.2, "large-v3": 3.5},
+    "faster-whisper": {"tiny": 0.03, "base": 0.05, "small": 0.15, "medium": 0.45, "large-v3-turbo": 0.3, "large-v3": 0.9},
+    "whisper.cpp": {"tiny": 0.05, "base": 0.08, "small": 0.25, "medium": 0.7, "large-v3-turbo": 0.5, "large-v3": 1.4},
+}
+# Thoi gian nap model (giay, da co file tren dia): cong vao chi phi khi model chua nam trong RAM
+ESTIMATED_LOAD_SECONDS = {"tiny": 1, "base": 2, "small": 5, "medium": 12, "large-v3-turbo": 15, "large-v3": 25}
+
+Audio = Union[str, np.ndarray]
+
+
+def load_audio(file_path: str) -> np.ndarray:
+    """Doc file audio/video thanh float32 mono 16 kHz bang thu vien cua backend nao dang cai"""
+    try:
+        import whisper
+        return whisper.load_audio(file_path)
+    except ImportError:
+        from faster_whisper import decode_audio
+        return decode_audio(file_path, sampling_rate=SAMPLE_RATE)
+
+
+class Transcriber(ABC):
+    """Giao dien chung: transcribe(audio) -> {"text": ...} giong whisper.transcribe,
+    audio la duong dan file hoac mang float32 16 kHz."""
+
+    backend = ""
+
+    def __init__(self, model_size: str):
+        self.model_size = model_size
+
+    @abstractmethod
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict:
+        ...
+
+
+class OpenAIWhisperTranscriber(Transcriber):
+    backend = "openai-whisper"
+
+    def __init__(self, model_size: str, threads: int = 0, **_):
+        super().__init__(model_size)
+        import whisper
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = whisper.load_model(model_size)
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict:
+        result = self.model.transcribe(audio, language=language)
+        return {"text": result["text"].strip(), "language": result.get("language")}
+
+
+class FasterWhisperTranscriber(Transcriber):
+    backend = "faster-whisper"
+
+    def __init__(self, model_size: str, threads: int = 0, compute_type: str = "int8", **_):
+        super().__init__(model_size)
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=threads)
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict:
+        segments, info = self.model.transcribe(audio, language=language)
+        # segments la generator: phai duyet het thi moi chay xong
+        text = "".join(segment.text for segment in segments)
+        return {"text": text.strip(), "language": info.language}
+
+
+class WhisperCppTranscriber(Transcriber):
+    backend = "whisper.cpp"
+
+    def __init__(self, model_size: str, threads: int = 0, **_):
+        super().__init__(model_size)
+        from pywhispercpp.model import Model
+        options = {"n_threads": threads} if threads else {}
+        self.model = Model(model_size, print_progress=False, print_realtime=False, **options)
+
+    def transcribe(self, audio: Audio, language: Optional[str] = None) -> Dict:
+        if isinstance(audio, np.ndarray):
+            audio = audio.astype(np.float32)
+        options = {"language": language} if language else {}
+        segments = self.model.transcribe(audio, **options)
+        return {"text": " ".join(segment.text.strip() for segment in segments).strip(), "language": language}
+
+
+_TRANSCRIBERS = {
+    "openai-whisper": OpenAIWhisperTranscriber,
+    "faster-whisper": FasterWhisperTranscriber,
+    "whisper.cpp": WhisperCppTranscriber,
+}
+
+
+def load_transcriber(model_size: str, backend: str = "openai-whisper", **options) -> Transcriber:
+    if backend not in _TRANSCRIBERS:
+        raise ValueError(f"Backend Whisper khong hop le: {backend} (chon {', '.join(BACKENDS)})")
+    return _TRANSCRIBERS[backend](model_size, **options)
+
+
+# --- CHON MODEL THEO DO DAI AUDIO ---
+_observed_rtf: Dict[tuple, float] = {}
+_rtf_lock = threading.Lock()
+
+
+def record_rtf(backend: str, model_size: str, audio_seconds: float, elapsed: float):
+    """Cap nhat RTF do duoc (trung binh truot) de lan chon sau sat voi may dang chay"""
+    if audio_seconds <= 0:
+        return
+    rtf = elapsed / audio_seconds
+    with _rtf_lock:
+        old = _observed_rtf.get((backend, model_size))
+        _observed_rtf[(backend, model_size)] = rtf if old is None else 0.7 * old + 0.3 * rtf
+
+
+def expected_rtf(backend: str, model_size: str) -> float:
+    with _rtf_lock:
+        observed = _observed_rtf.get((backend, model_size))
+    return observed if observed is not None else ESTIMATED_RTF.get(backend, {}).get(model_size, 1.0)
+
+
+def select_model_size(audio_seconds: float, backend: str, target_rtf: float,
+                      min_budget_seconds: float = 0, loaded: Iterable[str] = ()) -> str:
+    """Model lon nhat xong trong ngan sach target_rtf * do dai audio.
+
+    Chi phi = RTF du kien * do dai audio, cong thoi gian nap neu model chua nam trong `loaded`
+    (voi audio ngan, nap model lon ton hon ca transcribe). min_budget_seconds > 0 (tuy chon) noi
+    ngan sach toi thieu cho audio ngan. Khong model nao dat thi dung model nhanh nhat.
+    """
+    loaded = set(loaded)
+    budget = max(target_rtf * audio_seconds, min_budget_seconds)
+    for size in MODEL_SIZES:
+        cost = expected_rtf(backend, size) * audio_seconds
+        if size not in loaded:
+            cost += ESTIMATED_LOAD_SECONDS.get(size, 0)
+        if cost <= budget:
+            return size
+    return MODEL_SIZES[-1]
+
+
+def rtf_stats() -> Dict[str, float]:
+    with _rtf_lock:
+        return {f"{backend}:{size}": round(rtf, 3) for (backend, size), rtf in _observed_rtf.items()}
@@ -0,0 +1,265 @@
+import os
+import re
+import argparse
+import hashlib
+import threading
+from typing import Dict, List, Iterable, Optional
+
+from embedding_backend import BACKENDS
+from memory_index import MemoryIndexCache, SessionIndex
+
+LEGACY_COLLECTION = "wiki_docs"
+COLLECTION_PREFIX = "session_"
+_VALID_NAME = re.compile(r"^[a-zA-Z0-9_-]+$")
+
+
+def collection_name(session_id: str, embedding_backend: str = "torch") -> str:
+    """Ten collection Chroma cua session (3-63 ky tu [a-zA-Z0-9_-]); ID la thi dung hash.
+
+    Vector cua backend khac torch (onnx / int8) lech khong gian voi vector float nen nam o
+    collection rieng (hau to __<backend>); torch giu ten cu.
+    """
+    suffix = "" if embedding_backend == "torch" else f"__{embedding_backend}"
+    name = COLLECTION_PREFIX + session_id + suffix
+    if len(name) > 63 or not _VALID_NAME.match(session_id) or not session_id[-1].isalnum():
+        name = COLLECTION_PREFIX + hashlib.sha1(session_id.encode('utf-8')).hexdigest() + suffix
+    return name
+
+
+def _empty_query_result(n_queries: int, include: List[str]) -> Dict:
+    result = {"ids": [[] for _ in range(n_queries)]}
+    for key in include:
+        result[key] = [[] for _ in range(n_queries)]
+    return result
+
+
+class SessionVectorStore:
+    """Moi session 1 collection Chroma rieng: truy van chi quet du lieu cua session do
+    (khong con where={"doc_name": ...} tren collection chung), xoa session = xoa collection.
+
+    Collection wiki_docs cu (neu con) duoc chia ra theo doc_name 1 lan khi mo store.
+    Session nho duoc nap vao MemoryIndexCache (NumPy) va tra loi truy van khong qua Chroma.
+    Store chi doc / ghi collection cua embedding_backend dang dung: doi EMBEDDING_BACKEND thi
+    session cu phai ingest lai (khong tron vector cua 2 backend trong 1 collection).
+    """
+
+    def __init__(self, path: str, memory_index: Optional[MemoryIndexCache] = None,
+                 embedding_backend: str = "torch"):
+        self.path = path
+        self.memory_index = memory_index
+        self.embedding_backend = embedding_backend
+        self._warned_sessions = set()
+        self._client = None
+        self._collections = {}
+        self._lock = threading.Lock()
+        # Khoa theo session: nap snapshot vao MemoryIndexCache va upsert khong duoc xen nhau
+        self._session_locks: Dict[str, threading.Lock] = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import chromadb
+                    client = chromadb.PersistentClient(path=self.path)
+                    self._migrate_legacy(client)
+                    self._client = client
+        return self._client
+
+    def _collection_names(self, client=None) -> List[str]:
+        # chromadb < 0.6 tra ve Collection, ban moi tra ve ten
+        return [c if isinstance(c, str) else c.name for c in (client or self.client).list_collections()]
+
+    def _migrate_legacy(self, client, batch_size: int = 1000):
+        if LEGACY_COLLECTION not in self._collection_names(client):
+            return
+        legacy = client.get_collection(LEGACY_COLLECTION)
+        total = legacy.count()
+        print(f"--- Chuyen {total} vector tu '{LEGACY_COLLECTION}' sang collection theo session ---")
+        offset = 0
+        while offset < total:
+            page = legacy.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+            groups = {}
+            for i, meta in enumerate(page["metadatas"]):
+                groups.setdefault((meta or {}).get("doc_name", "_unknown"), []).append(i)
+            for session_id, idx in groups.items():
+                target = client.get_or_create_collection(collection_name(session_id),
+                                                         metadata={"session_id": session_id})
+                target.upsert(ids=[page["ids"][i] for i in idx],
+                              documents=[page["documents"][i] for i in idx],
+                              embeddings=[list(page["embeddings"][i]) for i in idx],
+                              metadatas=[page["metadatas"][i] for i in idx])
+            offset += len(page["ids"])
+            if not page["ids"]:
+                break
+        client.delete_collection(LEGACY_COLLECTION)
+        print("--- Da chuyen xong, xoa collection cu ---")
+
+    def collection(self, session_id: str, create: bool = True):
+        """Collection cua session; create=False va chua co thi tra ve None"""
+        name = collection_name(session_id, self.embedding_backend)
+        col = self._collections.get(name)
+        if col is not None:
+            return col
+        if create:
+            col = self.client.get_or_create_collection(
+                name, metadata={"session_id": session_id, "embedding_backend": self.embedding_backend})
+        else:
+            try:
+                col = self.client.get_collection(name)
+            except Exception:
+                return None
+        with self._lock:
+            self._collections[name] = col
+        return col
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._lock:
+            if session_id not in self._session_locks:
+                self._session_locks[session_id] = threading.Lock()
+            return self._session_locks[session_id]
+
+    def upsert(self, session_id: str, **batch):
+        if not self.memory_index:
+            self.collection(session_id).upsert(**batch)
+            return
+        # Lo upsert trong luc dang nap snapshot se cho snapshot vao cache xong roi moi cap nhat index
+        with self._session_lock(session_id):
+            self.collection(session_id).upsert(**batch)
+            self.memory_index.upsert(session_id, batch["ids"], batch["documents"],
+                                     batch["metadatas"], batch["embeddings"])
+
+    def _memory(self, session_id: str) -> Optional[SessionIndex]:
+        """Index trong RAM cua session; chua co thi nap tu Chroma neu session du nho"""
+        if not self.memory_index:
+            return None
+        index = self.memory_index.get(session_id)
+        if index is not None:
+            return index
+        with self._session_lock(session_id):
+            # Luong khac co the vua nap xong trong luc cho khoa
+            index = self.memory_index.peek(session_id)
+            if index is not None:
+                return index
+            col = self.collection(session_id, create=False)
+            if col is None or col.count() > self.memory_index.max_chunks:
+                return None
+            data = col.get(include=["documents", "metadatas", "embeddings"])
+            index = SessionIndex(data["ids"], data["documents"], data["metadatas"], data["embeddings"])
+            self.memory_index.put(session_id, index)
+            return index
+
+    def query(self, session_id: str, query_embeddings: List, n_results: int, include: List[str]) -> Dict:
+        index = self._memory(session_id)
+        if index is not None:
+            return index.search(query_embeddings, n_results, include)
+        col = self.collection(session_id, create=False)
+        count = col.count() if col is not None else 0
+        if not count:
+            self._warn_other_backends(session_id)
+            return _empty_query_result(len(query_embeddings), include)
+        return col.query(query_embeddings=query_embeddings, n_results=min(n_results, count), include=include)
+
+    def get(self, session_id: str, include: List[str]) -> Dict:
+        index = self._memory(session_id)
+        if index is not None:
+            return index.get(include)
+        col = self.collection(session_id, create=False)
+        if col is None:
+            return {"ids": [], **{key: [] for key in include}}
+        return col.get(include=include)
+
+    def count(self, session_id: str) -> int:
+        index = self.memory_index.peek(session_id) if self.memory_index else None
+        if index is not None:
+            return len(index)
+        col = self.collection(session_id, create=False)
+        return col.count() if col is not None else 0
+
+    def _warn_other_backends(self, session_id: str):
+        # Session da ingest bang backend embedding khac: bao 1 lan thay vi im lang tra ve rong
+        if session_id in self._warned_sessions:
+            return
+        existing = set(self._collection_names())
+        others = [b for b in BACKENDS if b != self.embedding_backend and collection_name(session_id, b) in existing]
+        if others:
+            self._warned_sessions.add(session_id)
+            print(f"--- Session {session_id} chi co vector cua backend {', '.join(others)}, "
+                  f"can ingest lai voi EMBEDDING_BACKEND={self.embedding_backend} ---")
+
+    def delete_session(self, session_id: str) -> bool:
+        """Xoa collection cua session o moi backend embedding"""
+        if self.memory_index:
+            with self._session_lock(session_id):
+                self.memory_index.drop(session_id)
+        names = [collection_name(session_id, backend) for backend in BACKENDS]
+        with self._lock:
+            for name in names:
+                self._collections.pop(name, None)
+            self._session_locks.pop(session_id, None)
+        deleted = False
+        for name in names:
+            try:
+                self.client.delete_collection(name)
+                deleted = True
+            except Exception:
+                pass
+        return deleted
+
+    def sessions(self, all_backends: bool = False) -> Dict[str, str]:
+        """{session_id: ten collection} cua moi collection do store tao ra (cua backend dang dung,
+        all_backends=True: moi backend)"""
+        result = {}
+        for name in self._collection_names():
+            if not name.startswith(COLLECTION_PREFIX):
+                continue
+            col = self.client.get_collection(name)
+            metadata = col.metadata or {}
+            session_id = metadata.get("session_id")
+            # Collection tao truoc khi co tag embedding_backend deu la torch
+            if session_id and (all_backends or metadata.get("embedding_backend", "torch") == self.embedding_backend):
+                result[session_id] = name
+        return result
+
+    def compact(self, valid_session_ids: Iterable[str]) -> List[str]:
+        """Xoa collection cua session khong con ton tai (vector mo coi), tra ve danh sach session da xoa"""
+        valid = set(valid_session_ids)
+        removed = []
+        for session_id in self.sessions(all_backends=True):
+            if session_id not in valid and self.delete_session(session_id):
+                removed.append(session_id)
+        return removed
+
+    def stats(self) -> Dict:
+        sessions = self.sessions()
+        return {
+            "collections": len(sessions),
+            "vectors": sum(self.count(sid) for sid in sessions),
+            "memory_index": self.memory_index.stats() if self.memory_index else None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quan ly vector theo session")
+    parser.add_argument("command", choices=["compact", "stats"],
+                        help="compact: xoa du lieu cua session khong con trong DB; stats: thong ke")
+    args = parser.parse_args()
+
+    from database import SessionLocal, SessionModel, init_db
+    from wiki_composer import WikiComposer
+    init_db()
+    base_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data_storage")
+    composer = WikiComposer(base_dir=base_dir)
+    if args.command == "stats":
+        print(composer.vector_store.stats())
+        return
+    db = SessionLocal()
+    try:
+        session_ids = [sid for (sid,) in db.query(SessionModel.id).all()]
+    finally:
+        db.close()
+    print(composer.compact_storage(session_ids))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,29 @@
 import os
 import json
 import random
-import uuid
 import re
-from typing import List, Dict, Set, Optional
+import shutil
+import itertools
+from typing import List, Dict, Set, Optional, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
 
-import chromadb
-from sentence_transformers import SentenceTransformer
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from llm_engine import LLMManager
 from extractor import Extractor
+from extraction_cache import ExtractionCache
+from embedding_cache import EmbeddingCache, chunk_hash
+from source_registry import SourceRegistry
+from context_builder import build_context
+from ingest_pipeline import StreamingIndexer
+from vector_store import SessionVectorStore
+from memory_index import MemoryIndexCache
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from summarizer import MapReduceSummarizer
+from response_cache import ResponseCache
 from ollama_client import OllamaClient
+import model_registry
+import executors
 
 class WikiComposer:
     def __init__(self, base_dir: str = "data_storage"):
@@ -20,117 +33,287 @@ class WikiComposer:
         os.makedirs(self.raw_dir, exist_ok=True)
 
         # 2. Khoi tao Core
-        self.extractor = Extractor(model_size="base")
+        self.extraction_cache = ExtractionCache(os.path.join(base_dir, "extract_cache"))
+        # Backend Whisper: openai-whisper (mac dinh) / faster-whisper (int8) / whisper.cpp.
+        # WHISPER_MODEL_SIZE=auto: chon model theo do dai audio va WHISPER_TARGET_RTF
+        # (WHISPER_MIN_BUDGET_SECONDS > 0: ngan sach toi thieu cho audio ngan, mac dinh tat)
+        self.extractor = Extractor(
+            model_size=os.getenv("WHISPER_MODEL_SIZE", "base"), cache=self.extraction_cache,
+            split_seconds=int(os.getenv("WHISPER_SPLIT_SECONDS", "300")),
+            transcribe_workers=int(os.getenv("WHISPER_WORKERS", "1")),
+            pdf_workers=int(os.getenv("PDF_WORKERS", "0")) or None,
+            backend=os.getenv("WHISPER_BACKEND", "openai-whisper"),
+            compute_type=os.getenv("WHISPER_COMPUTE_TYPE", "int8"),
+            threads=int(os.getenv("WHISPER_THREADS", "0")),
+            target_rtf=float(os.getenv("WHISPER_TARGET_RTF", "0.5")),
+            min_budget_seconds=float(os.getenv("WHISPER_MIN_BUDGET_SECONDS", "0"))
+        )
         #self.llm = OllamaClient(model="qwen2.5:3b")
-        self.llm = LLMManager()
+        # Cache ket qua LLM (opt-in): LLM_RESPONSE_CACHE=1
+        self.response_cache = None
+        if os.getenv("LLM_RESPONSE_CACHE", "0") == "1":
+            self.response_cache = ResponseCache(
+                os.path.join(base_dir, "llm_cache.db"),
+                ttl_seconds=int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+                max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")),
+                max_temperature=float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.3"))
+            )
+        self.llm = LLMManager(response_cache=self.response_cache)
         
-        print("Dang tai model Embedding...")
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-
-        # 3. Khoi tao ChromaDB
-        self.chroma_client = chromadb.PersistentClient(path=self.vector_path)
-        self.collection = self.chroma_client.get_or_create_collection(name="wiki_docs")
+        # Embedding model & ChromaDB duoc nap khi dung lan dau (xem property ben duoi)
+        self.embedding_model_name = 'all-MiniLM-L6-v2'
+        # Backend embedding: torch (mac dinh) / onnx / int8, xem embedding_backend.py
+        self.embedding_options = {
+            "backend": os.getenv("EMBEDDING_BACKEND", "torch"),
+            "threads": int(os.getenv("EMBEDDING_THREADS", "0")),
+            "batch_size": int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+        }
+        # Vector cua backend khac (vd int8) lech chut it so voi float: cache va collection Chroma rieng theo backend
+        cache_model = self.embedding_model_name
+        if self.embedding_options["backend"] != "torch":
+            cache_model += "@" + self.embedding_options["backend"]
+        self.embedding_cache = EmbeddingCache(os.path.join(base_dir, "embedding_cache.db"), cache_model)
+        # Moi session 1 collection Chroma (mo client khi dung lan dau)
+        # Session nho (<= MEMORY_INDEX_MAX_CHUNKS) duoc truy van bang NumPy trong RAM, tat bang MEMORY_INDEX=0
+        memory_index = None
+        if os.getenv("MEMORY_INDEX", "1") == "1":
+            memory_index = MemoryIndexCache(
+                max_chunks=int(os.getenv("MEMORY_INDEX_MAX_CHUNKS", "5000")),
+                max_bytes=int(os.getenv("MEMORY_INDEX_MAX_MB", "256")) * 1024 * 1024
+            )
+        self.vector_store = SessionVectorStore(self.vector_path, memory_index=memory_index,
+                                               embedding_backend=self.embedding_options["backend"])
+        # Inverted index BM25 (cap nhat cung luc voi Vector DB), gop voi ket qua embedding bang RRF.
+        # RETRIEVAL_MODE=dense de chi dung embedding nhu truoc
+        self.lexical_index = LexicalIndex(os.path.join(base_dir, "lexical_index.db"))
+        self.hybrid_retrieval = os.getenv("RETRIEVAL_MODE", "hybrid") == "hybrid"
+        self._lexical_checked: Set[str] = set()
 
         # 4. Quan ly Source Map (Registry)
+        # source_map.json cu (neu con) duoc chuyen vao bang source_registry 1 lan
         self.source_map_file = os.path.join(base_dir, "source_map.json")
-        self.source_registry = self._load_source_registry()
+        self.source_registry = SourceRegistry(legacy_map_file=self.source_map_file)
         
+        # 5. Tom tat map-reduce cho nguon dai (cache tom tat tung phan theo nguon)
+        self.summarizer = MapReduceSummarizer(self.llm, os.path.join(base_dir, "summaries"))
+        self.long_session_chunks = int(os.getenv("LONG_SESSION_CHUNKS", "40"))
+
+        # Pipeline ingest: so chunk moi lo embed/upsert, so lo toi da dang cho giua cac stage
+        self.ingest_batch_size = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+        self.ingest_max_pending = int(os.getenv("INGEST_MAX_PENDING_BATCHES", "2"))
+        self.chunk_size = 800
         self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800,
+            chunk_size=self.chunk_size,
             chunk_overlap=100,
             separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
         )
 
-    # --- QUAN LY NGUON (REGISTRY - LOGIC MOI) ---
-    def _load_source_registry(self) -> Dict:
-        if os.path.exists(self.source_map_file):
-            try:
-                with open(self.source_map_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Kiem tra xem co phai format cu khong (neu value la int thi la format cu)
-                    if data and isinstance(list(data.values())[0], int):
-                        print("Phat hien source_map cu, se reset de dung format moi.")
-                        return {}
-                    return data
-            except Exception:
-                return {}
-        return {}
-
-    def _save_source_registry(self):
-        with open(self.source_map_file, 'w', encoding='utf-8') as f:
-            json.dump(self.source_registry, f, ensure_ascii=False, indent=2)
+    @property
+    def embedding_model(self):
+        return model_registry.get_embedder(self.embedding_model_name, **self.embedding_options)
+
+    def _encode(self, texts: List[str]):
+        # Encode chay tren pool "embed" rieng de gioi han so luong tac vu CPU song song
+        return executors.run_blocking("embed", self.embedding_model.encode, texts)
+
+    def warm_up(self):
+        """Nap truoc Whisper, embedder va Chroma de request dau tien khong bi cham"""
+        model_registry.warm_up(self.extractor.warm_up_size, self.embedding_model_name,
+                               whisper_options=self.extractor.whisper_options,
+                               embedder_options=self.embedding_options)
+        _ = self.vector_store.client
+
+    # --- XOA / DON DEP DU LIEU SESSION ---
+    def _session_dirs(self, session_id: str) -> List[str]:
+        return [os.path.join(self.raw_dir, session_id), os.path.join(self.summarizer.cache_dir, session_id)]
+
+    def delete_session_data(self, session_id: str):
+        """Xoa vector, raw backup, cache tom tat va so thu tu nguon cua session"""
+        self.vector_store.delete_session(session_id)
+        self.lexical_index.delete_session(session_id)
+        self._lexical_checked.discard(session_id)
+        for path in self._session_dirs(session_id):
+            shutil.rmtree(path, ignore_errors=True)
+        self.source_registry.delete_session(session_id)
+        print(f"-> Da xoa du lieu cua session {session_id}")
+
+    def compact_storage(self, valid_session_ids: Iterable[str]) -> Dict:
+        """Don du lieu mo coi: collection / raw / tom tat / registry cua session khong con trong DB"""
+        valid = set(valid_session_ids)
+        removed_vectors = self.vector_store.compact(valid)
+        removed_dirs = []
+        for base in (self.raw_dir, self.summarizer.cache_dir):
+            for name in os.listdir(base):
+                path = os.path.join(base, name)
+                if os.path.isdir(path) and name not in valid:
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed_dirs.append(path)
+        removed_registry = self.source_registry.compact(valid)
+        removed_lexical = self.lexical_index.compact(valid)
+        return {
+            "collections_removed": removed_vectors,
+            "lexical_sessions_removed": removed_lexical,
+            "dirs_removed": len(removed_dirs),
+            "registry_rows_removed": removed_registry,
+        }
 
+    # --- QUAN LY NGUON (REGISTRY - LOGIC MOI) ---
     def clear_source_registry(self):
         """Reset registry."""
-        if os.path.exists(self.source_map_file):
-            os.remove(self.source_map_file)
-        self.source_registry = {}
-        print("source_map.json removed; registry reset.")
+        self.source_registry.clear()
+        print("source_registry cleared; registry reset.")
 
     # [SỬA ĐỔI] Thêm tham số session_id
     def _get_source_id(self, source_name: str, session_id: str) -> int:
-        # Khoi tao dictionary cho session neu chua co
-        if session_id not in self.source_registry:
-            self.source_registry[session_id] = {}
-
-        # Neu nguon chua co trong session nay, tao ID moi bat dau tu 1
-        if source_name not in self.source_registry[session_id]:
-            # ID moi = so luong nguon hien tai cua session + 1
-            new_id = len(self.source_registry[session_id]) + 1
-            self.source_registry[session_id][source_name] = new_id
-            self._save_source_registry()
-            
-        return self.source_registry[session_id][source_name]
+        # ID moi bat dau tu 1 trong moi session, cap nguyen tu trong DB
+        return self.source_registry.get_or_create(source_name, session_id)
 
     # --- XU LY VECTOR & INPUT ---
-    def _prepare_vector_data(self, chunks: List[str], session_id: str, source_id: int):
-        ids = []
-        metadatas = []
+    def _make_chunk_id(self, chunk_text: str, session_id: str) -> str:
+        # ID co dinh theo noi dung: nap lai cung nguon se upsert thay vi tao vector trung
+        return chunk_hash(f"{session_id}|{chunk_text}")
+
+    def _encode_chunks(self, chunks: List[str]) -> List[List[float]]:
+        """Encode co cache: chi chay SentenceTransformer cho cac chunk chua tung thay"""
+        hashes = [chunk_hash(c) for c in chunks]
+        cached = self.embedding_cache.get_many(hashes)
+
+        missing = {}
+        for h, c in zip(hashes, chunks):
+            if h not in cached and h not in missing:
+                missing[h] = c
+        if missing:
+            vectors = self._encode(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self.embedding_cache.put_many(fresh)
+            cached.update(fresh)
+        print(f"-> Embedding: {len(chunks) - len(missing)} tu cache, {len(missing)} moi")
+        return [cached[h].tolist() for h in hashes]
+
+    def _iter_records(self, chunks: Iterable[str], session_id: str, source_id: int, seen: Set[str]) -> Iterator[tuple]:
+        """(chunk_id, text, metadata) cho tung chunk, bo qua chunk trung noi dung"""
         for i, chunk_text in enumerate(chunks):
-            ids.append(str(uuid.uuid4()))
-            metadatas.append({
+            chunk_id = self._make_chunk_id(chunk_text, session_id)
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            yield chunk_id, chunk_text, {
                 "doc_name": session_id, 
                 "chunk_index": i, 
                 "source_id": source_id
-            })
-        embeddings = self.embedding_model.encode(chunks).tolist()
-        return ids, embeddings, metadatas
+            }
+
+    def _make_indexer(self, session_id: str, on_progress: Optional[Callable[[Dict], None]] = None) -> StreamingIndexer:
+        return StreamingIndexer(
+            encode_fn=self._encode_chunks,
+            upsert_fn=lambda **batch: self._upsert_batch(session_id, **batch),
+            batch_size=self.ingest_batch_size,
+            max_pending=self.ingest_max_pending,
+            on_progress=on_progress,
+        )
+
+    def _upsert_batch(self, session_id: str, ids, documents, embeddings, metadatas):
+        self.vector_store.upsert(session_id, ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+        self.lexical_index.add(session_id, ids, documents, metadatas)
+
+    def _ensure_lexical(self, session_id: str):
+        """Session nap truoc khi co inverted index: dung index tu chunk trong Vector DB (1 lan)"""
+        if session_id in self._lexical_checked:
+            return
+        if self.vector_store.count(session_id) > self.lexical_index.count(session_id):
+            data = self.vector_store.get(session_id, include=["documents", "metadatas"])
+            self.lexical_index.add(session_id, data["ids"], data["documents"], data["metadatas"])
+            print(f"-> Da dung inverted index cho session {session_id} ({len(data['ids'])} chunks)")
+        self._lexical_checked.add(session_id)
+
+    def _save_raw(self, input_source: str, raw: str, session_id: str) -> int:
+        """Cap source ID va luu ban raw backup, tra ve source ID"""
+        # [SỬA ĐỔI] Goi ham lay ID voi session_id
+        source_id = self._get_source_id(input_source, session_id)
+        for _ in self._tee_raw(input_source, source_id, session_id, [raw]):
+            pass
+        return source_id
+
+    def _tee_raw(self, input_source: str, source_id: int, session_id: str, blocks: Iterable[str]) -> Iterator[str]:
+        """Ghi raw backup {"source", "content"} dan theo tung block, dong thoi yield lai block"""
+        session_raw_dir = os.path.join(self.raw_dir, session_id)
+        os.makedirs(session_raw_dir, exist_ok=True)
+        safe_name = f"source_{source_id}.json"
+        with open(os.path.join(session_raw_dir, safe_name), 'w', encoding='utf-8') as f:
+            f.write('{"source": ' + json.dumps(input_source, ensure_ascii=False) + ', "content": "')
+            for block in blocks:
+                f.write(json.dumps(block, ensure_ascii=False)[1:-1])
+                yield block
+            f.write('"}')
+
+    def _split_stream(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Chia chunk dan theo block: chi giu trong bo nho phan text chua chia xong"""
+        window = 8 * self.chunk_size
+        buffer = ""
+        for block in blocks:
+            buffer += block
+            if len(buffer) < window:
+                continue
+            chunks = self.text_splitter.split_text(buffer)
+            if not chunks:
+                buffer = ""
+                continue
+            # Chunk cuoi co the bi cat ngang giua cau: giu lai phan text goc (chua strip) tu vi tri
+            # cua chunk do, de block tiep theo ghep vao van giu dau xuong dong / khoang trang
+            yield from chunks[:-1]
+            start = buffer.rfind(chunks[-1])
+            buffer = buffer[start:] if start != -1 else chunks[-1] + "\n\n"
+        if buffer.strip():
+            yield from self.text_splitter.split_text(buffer)
+
+    def index_chunks(self, session_id: str, items: List[tuple]) -> List[int]:
+        """Nap nhieu nguon da chia chunk [(input_source, raw, chunks)] vao Vector DB qua cung 1
+        pipeline embed/index (dung cho bulk ingest). Tra ve source ID theo thu tu items."""
+        source_ids = [self._save_raw(input_source, raw, session_id) for input_source, raw, _ in items]
+        seen = set()
+        records = itertools.chain.from_iterable(
+            self._iter_records(chunks, session_id, source_id, seen)
+            for (_, _, chunks), source_id in zip(items, source_ids)
+        )
+        stats = self._make_indexer(session_id).run(records)
+        print(f"-> Bulk: {len(items)} nguon, {stats['chunks_indexed']} chunks vao Vector DB")
+        return source_ids
 
-    def process_input_to_vector(self, input_source: str, input_type: str, session_id: str) -> bool:
+    def process_input_to_vector(self, input_source: str, input_type: str, session_id: str,
+                                on_stage: Optional[Callable[[str], None]] = None,
+                                on_progress: Optional[Callable[[Dict], None]] = None) -> bool:
         print(f"--- Xu ly cho Session: {session_id} | Nguon: {input_source} ---")
-        
-        # 1. Trich xuat
+        report = on_stage or (lambda stage: None)
+
+        # 1. Trich xuat (PDF/DOCX: generator tung trang / doan, doc dan thay vi ca file 1 luc)
+        report("extracting")
         try:
             raw = None
             if input_type == "url": raw = self.extractor.extract_website(input_source)
-            elif input_type in ["pdf", "docx"]: raw = self.extractor.extract_text_file(input_source)
+            elif input_type in ["pdf", "docx"]: blocks = self.extractor.iter_text_file(input_source)
             elif input_type == "youtube": raw = self.extractor.extract_youtube(input_source) 
             elif input_type == "audio": raw = self.extractor.extract_mp3(input_source)
+            if input_type not in ["pdf", "docx"]:
+                blocks = iter([raw] if raw else [])
 
-            if not raw: 
+            # Bo qua block rong dau file; het file ma khong co chu nao thi coi nhu Empty
+            first = next((b for b in blocks if b.strip()), None)
+            if first is None: 
                 print("-> Khong trich xuat duoc noi dung (Empty).")
                 return False
         except Exception as e:
             print(f"-> Loi trich xuat: {e}")
             return False
 
-        # 2. Luu file raw backup
-        session_raw_dir = os.path.join(self.raw_dir, session_id)
-        os.makedirs(session_raw_dir, exist_ok=True)
-
-        # [SỬA ĐỔI] Goi ham lay ID voi session_id
+        # 2. Luu raw backup (ghi dan) -> chia chunk -> embed -> Vector DB, chay noi tiep theo lo:
+        # lo dau tien tim kiem duoc ngay, bo nho khong phu thuoc kich thuoc nguon
         source_id = self._get_source_id(input_source, session_id)
-        
-        safe_name = f"source_{source_id}.json"
-        with open(os.path.join(session_raw_dir, safe_name), 'w', encoding='utf-8') as f:
-            json.dump({"source": input_source, "content": raw}, f, ensure_ascii=False)
-
-        chunks = self.text_splitter.split_text(raw)
-        print(f"-> Da chia thanh {len(chunks)} chunks. Source ID: {source_id}")
-
-        # 3. Luu vao Vector DB
-        ids, embeddings, metadatas = self._prepare_vector_data(chunks, session_id, source_id)
-        self.collection.add(documents=chunks, embeddings=embeddings, metadatas=metadatas, ids=ids)
+        report("indexing")
+        blocks = self._tee_raw(input_source, source_id, session_id, itertools.chain([first], blocks))
+        records = self._iter_records(self._split_stream(blocks), session_id, source_id, set())
+        stats = self._make_indexer(session_id, on_progress).run(records)
+        print(f"-> Da nap {stats['chunks_indexed']} chunks ({stats['batches_indexed']} lo, "
+              f"{stats['seconds']}s). Source ID: {source_id}")
         return True
 
     # --- CAC HAM HELPER ---
@@ -147,23 +330,105 @@ class WikiComposer:
                 text = text[:last_punct+1]
         return text.strip()
 
-    def _parse_chroma_results(self, results) -> List[Dict]:
+    def _parse_chroma_results(self, results, query_index: int = 0) -> List[Dict]:
         parsed_data = []
         if results and results['documents']:
-            doc_list = results['documents'][0]
-            meta_list = results['metadatas'][0]
+            doc_list = results['documents'][query_index]
+            meta_list = results['metadatas'][query_index]
             for i in range(len(doc_list)):
-                parsed_data.append({"content": doc_list[i], "source_id": meta_list[i].get('source_id', 0)})
+                parsed_data.append({
+                    "content": doc_list[i],
+                    "source_id": meta_list[i].get('source_id', 0),
+                    "chunk_index": meta_list[i].get('chunk_index', 0),
+                })
         return parsed_data
 
-    def _get_relevant_chunks(self, query: str, session_id: str) -> List[Dict]:
-        query_vector = self.embedding_model.encode(query).tolist()
-        results = self.collection.query(
-            query_embeddings=[query_vector],
-            n_results=4,
-            where={"doc_name": session_id} 
+    def _mmr_select(self, query_vec: np.ndarray, doc_vecs: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+        """Maximal Marginal Relevance: chon k chunk vua lien quan vua it trung lap"""
+        doc_vecs = doc_vecs / (np.linalg.norm(doc_vecs, axis=1, keepdims=True) + 1e-12)
+        query_vec = query_vec / (np.linalg.norm(query_vec) + 1e-12)
+        relevance = doc_vecs @ query_vec
+        selected = [int(np.argmax(relevance))]
+        while len(selected) < min(k, len(doc_vecs)):
+            redundancy = np.max(doc_vecs @ doc_vecs[selected].T, axis=1)
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            scores[selected] = -np.inf
+            selected.append(int(np.argmax(scores)))
+        return selected
+
+    def _fuse_hybrid(self, query: str, session_id: str, results, query_index: int,
+                     n_results: int, fetch_k: int) -> List[Dict]:
+        """Gop xep hang embedding va BM25 bang Reciprocal Rank Fusion"""
+        dense = self._parse_chroma_results(results, query_index)
+        by_id = dict(zip(results['ids'][query_index], dense)) if dense else {}
+        lexical = self.lexical_index.search(session_id, query, n_results=fetch_k)
+        for hit in lexical:
+            by_id.setdefault(hit["id"], {k: hit[k] for k in ("content", "source_id", "chunk_index")})
+        fused = reciprocal_rank_fusion([list(results['ids'][query_index]) if dense else [],
+                                        [hit["id"] for hit in lexical]])
+        return [by_id[cid] for cid in fused[:n_results]]
+
+    def _get_relevant_chunks_batch(self, queries: List[str], session_id: str, n_results: int = 4,
+                                   mmr: bool = False, fetch_k: int = 20, lambda_mult: float = 0.5) -> List[List[Dict]]:
+        """Lay context cho nhieu query: 1 lan encode theo batch + 1 lan query Chroma.
+        Che do hybrid: lay fetch_k ung vien tu moi ben (embedding, BM25) roi gop bang RRF."""
+        if not queries: return []
+        hybrid = self.hybrid_retrieval and not mmr
+        if hybrid:
+            self._ensure_lexical(session_id)
+        query_vectors = self._encode(queries)
+        results = self.vector_store.query(
+            session_id,
+            query_embeddings=query_vectors.tolist(),
+            n_results=max(n_results, fetch_k) if (mmr or hybrid) else n_results,
+            include=["documents", "metadatas", "embeddings"] if mmr else ["documents", "metadatas"]
         )
-        return self._parse_chroma_results(results)
+
+        batches = []
+        for qi in range(len(queries)):
+            if hybrid:
+                batches.append(self._fuse_hybrid(queries[qi], session_id, results, qi, n_results, max(n_results, fetch_k)))
+                continue
+            chunks = self._parse_chroma_results(results, qi)
+            if mmr and len(chunks) > n_results:
+                order = self._mmr_select(query_vectors[qi], np.asarray(results['embeddings'][qi]), n_results, lambda_mult)
+                chunks = [chunks[i] for i in order]
+            batches.append(chunks[:n_results])
+        return batches
+
+    def _get_relevant_chunks(self, query: str, session_id: str) -> List[Dict]:
+        return self._get_relevant_chunks_batch([query], session_id)[0]
+
+    def _build_budgeted_context(self, session_id: str, query: str, separator: str = "\n",
+                                budget: Optional[int] = None, candidates: int = 30) -> str:
+        """Xep chunk theo do lien quan voi yeu cau roi dong goi vua ngan sach token cua provider"""
+        chunks = self._get_relevant_chunks_batch([query], session_id, n_results=candidates)[0]
+        provider, model_name = self.llm.active_provider_model()
+        return build_context(chunks, budget, provider, model_name, separator)
+
+    def _get_session_chunks(self, session_id: str) -> Dict[int, List[str]]:
+        """Toan bo chunk cua session, nhom theo source_id va sap theo chunk_index"""
+        results = self.vector_store.get(session_id, include=["documents", "metadatas"])
+        by_source = {}
+        for doc, meta in zip(results['documents'], results['metadatas']):
+            by_source.setdefault(meta.get('source_id', 0), []).append((meta.get('chunk_index', 0), doc))
+        return {sid: [doc for _, doc in sorted(items, key=lambda x: x[0])] for sid, items in by_source.items()}
+
+    def summarize_session(self, session_id: str, budget: Optional[int] = None) -> str:
+        """Digest cua session bang map-reduce (tom tat nhom chunk song song, roi gop lai)"""
+        chunks_by_source = self._get_session_chunks(session_id)
+        if not chunks_by_source: return ""
+        return self.summarizer.summarize(session_id, chunks_by_source, budget)
+
+    def _build_session_context(self, session_id: str, query: str, separator: str = "\n") -> str:
+        """Session ngan: chunk lien quan nhat (vua ngan sach). Session dai: digest map-reduce."""
+        total = self.vector_store.count(session_id)
+        if total > self.long_session_chunks:
+            print(f"-> Session co {total} chunks, dung digest map-reduce")
+            digest = self.summarize_session(session_id)
+            if digest:
+                return digest
+        return self._build_budgeted_context(session_id, query, separator)
 
     def _append_citations_manually(self, text: str, used_ids: Set[int]) -> str:
         if not text or not used_ids: return text
@@ -172,13 +437,10 @@ class WikiComposer:
         return f"{text}\n\n*(Nguồn tham khảo: {citation_str})*"
 
     # --- HAM CORE LOGIC ---
-    def generate_outline(self, session_id: str, topic_type: str = "science", custom_instruction: Optional[str] = None) -> List[str]:
-        results = self.collection.get(where={"doc_name": session_id}, limit=5)
-        if not results['documents']: return []
-        context = "\n".join(results['documents'])
-
+    def _build_outline_prompt(self, session_id: str, topic_type: str = "science", custom_instruction: Optional[str] = None) -> Optional[str]:
         if custom_instruction:
             instruction = f"Lập dàn ý theo yêu cầu: {custom_instruction}"
+            query = custom_instruction
         else:
             templates = {
                 "science": "Bài Wiki Khoa học (Gồm: Định nghĩa, Cơ chế, Ứng dụng).",
@@ -186,21 +448,44 @@ class WikiComposer:
             }
             style = templates.get(topic_type, templates["general"])
             instruction = f"Lập Dàn ý chi tiết cho {style}"
+            query = style
 
-        prompt = (
+        context = self._build_session_context(session_id, query)
+        if not context: return None
+
+        return (
             "Dựa trên nội dung tham khảo sau, hãy " + instruction + "\n"
             "Chỉ liệt kê các mục lớn (I, II, III...). KHÔNG giải thích.\n"
-            "Nội dung tham khảo:\n" + context[:2000]
+            "Nội dung tham khảo:\n" + context
         )
-        
-        print(f"Dang lap dan y...")
-        response = self.llm.send_prompt(prompt, options={"temperature": 0.2})
+
+    def _parse_outline(self, response: str) -> List[str]:
         if not response: return []
-        
         return [l.strip() for l in response.split('\n') if any(c.isdigit() or c in "IVX" for c in l.strip()[:3])]
 
+    def generate_outline(self, session_id: str, topic_type: str = "science", custom_instruction: Optional[str] = None) -> List[str]:
+        prompt = self._build_outline_prompt(session_id, topic_type, custom_instruction)
+        if not prompt: return []
+
+        print(f"Dang lap dan y...")
+        response = self.llm.send_prompt(prompt, options={"temperature": 0.2})
+        return self._parse_outline(response)
+
+    def generate_outline_stream(self, session_id: str, topic_type: str = "science", custom_instruction: Optional[str] = None):
+        """Generator su kien: {"type": "token", "text"} ... {"type": "done", "outline"}"""
+        prompt = self._build_outline_prompt(session_id, topic_type, custom_instruction)
+        response = ""
+        if prompt:
+            for token in self.llm.send_prompt_stream(prompt, options={"temperature": 0.2}):
+                response += token
+                yield {"type": "token", "text": token}
+        yield {"type": "done", "outline": self._parse_outline(response)}
+
     def write_section(self, section_title: str, session_id: str) -> (str, List[int]):
         chunks = self._get_relevant_chunks(section_title, session_id)
+        return self._write_section_from_chunks(section_title, chunks)
+
+    def _build_section_prompt(self, section_title: str, chunks: List[Dict]) -> (str, Set[int]):
         context_str = ""
         used_ids = set()
         for c in chunks:
@@ -214,8 +499,9 @@ class WikiComposer:
             "Yêu cầu: Chỉ dùng dữ liệu tham khảo. Nếu thiếu, ghi 'Nội dung này chưa được cập nhật trong tài liệu.'\n"
             "Viết bằng tiếng Việt, văn xuôi, không danh sách, không tự điền số trích dẫn."
         )
+        return prompt, used_ids
 
-        raw_text = self.llm.send_prompt(prompt, options={"num_predict": 800, "repeat_penalty": 1.2})
+    def _finalize_section(self, section_title: str, raw_text: str, used_ids: Set[int]) -> (str, List[int]):
         cleaned_text = self._clean_output_text(raw_text, section_title)
 
         if cleaned_text and "chưa được cập nhật" in cleaned_text.lower() and len(cleaned_text) < 100:
@@ -224,13 +510,28 @@ class WikiComposer:
         final_text = self._append_citations_manually(cleaned_text, used_ids)
         return final_text, list(used_ids)
 
+    def _write_section_from_chunks(self, section_title: str, chunks: List[Dict]) -> (str, List[int]):
+        print(f"Dang viet: {section_title}")
+        prompt, used_ids = self._build_section_prompt(section_title, chunks)
+        raw_text = self.llm.send_prompt(prompt, options={"num_predict": 800, "repeat_penalty": 1.2})
+        return self._finalize_section(section_title, raw_text, used_ids)
+
+    def write_section_stream(self, section_title: str, session_id: str):
+        """Generator su kien: token tho tu LLM, cuoi cung la noi dung da lam sach + used_ids"""
+        chunks = self._get_relevant_chunks(section_title, session_id)
+        prompt, used_ids = self._build_section_prompt(section_title, chunks)
+        raw_text = ""
+        for token in self.llm.send_prompt_stream(prompt, options={"num_predict": 800, "repeat_penalty": 1.2}):
+            raw_text += token
+            yield {"type": "token", "text": token}
+        content, ids = self._finalize_section(section_title, raw_text, used_ids)
+        yield {"type": "done", "content": content, "used_ids": ids}
+
     # [SỬA ĐỔI] Thêm session_id vào đây để lấy đúng map
     def generate_bibliography(self, used_ids_list: List[int], session_id: str = None) -> str:
         """Tao footer tai lieu tham khao"""
-        # Lay map rieng cua session nay
-        session_map = self.source_registry.get(session_id, {})
-        # Dao nguoc map: {1: "url", 2: "file.pdf"}
-        id_to_source = {v: k for k, v in session_map.items()}
+        # Lay map rieng cua session nay: {1: "url", 2: "file.pdf"}
+        id_to_source = self.source_registry.session_map(session_id)
         
         if not used_ids_list:
             return "\n## DANH SÁCH TÀI LIỆU THAM KHẢO\nChưa có trích dẫn."
@@ -241,10 +542,21 @@ class WikiComposer:
             footer += f"- **[{sid}]**: {source_url}\n"
         return footer
 
-    def compose_wiki(self, doc_name: str, topic_type: str = "science", custom_instruction: Optional[str] = None) -> str:
+    def _write_sections_concurrently(self, outline: List[str], session_id: str, max_workers: Optional[int] = None) -> List:
+        """Lay context cho moi muc truoc, roi gui prompt song song (ket qua giu dung thu tu dan y)"""
+        contexts = self._get_relevant_chunks_batch(outline, session_id)
+        workers = max_workers or self.llm.get_concurrency_limit()
+        print(f"-> Viet {len(outline)} muc song song ({workers} luong)")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(self._write_section_from_chunks, outline, contexts))
+
+    def compose_wiki(self, doc_name: str, topic_type: str = "science", custom_instruction: Optional[str] = None,
+                     concurrent: bool = False, max_workers: Optional[int] = None,
+                     outline: Optional[List[str]] = None) -> str:
         # doc_name chinh la session_id
         session_id = doc_name
-        outline = self.generate_outline(session_id, topic_type, custom_instruction)
+        # Dan y co the truyen vao san (vd batch pipeline can luu lai dan y)
+        outline = outline or self.generate_outline(session_id, topic_type, custom_instruction)
         if not outline: return "Khong the tao dan y."
 
         full_article = f"# BÀI VIẾT WIKI: {session_id.upper()}\n"
@@ -254,15 +566,17 @@ class WikiComposer:
         all_used_source_ids = set()
 
         print("\n--- Bat dau viet bai ---")
-        for section in outline:
-            print(f"Dang viet: {section}")
-            content, ids_in_section = self.write_section(section, session_id)
+        if concurrent:
+            results = self._write_sections_concurrently(outline, session_id, max_workers)
+        else:
+            results = (self.write_section(section, session_id) for section in outline)
+
+        for section, (content, ids_in_section) in zip(outline, results):
             if not content:
                 print(f"-> Khong tim thay thong tin cho muc: {section}")
                 continue
-            if content:
-                full_article += f"## {section}\n{content}\n\n"
-                all_used_source_ids.update(ids_in_section)
+            full_article += f"## {section}\n{content}\n\n"
+            all_used_source_ids.update(ids_in_section)
 
         # [SỬA ĐỔI] Truyen session_id vao de lay dung link
         full_article += self.generate_bibliography(list(all_used_source_ids), session_id)
@@ -270,15 +584,14 @@ class WikiComposer:
         return full_article
 
     def get_prompt_suggestion(self, session_id: str, n_suggestions: int = 5) -> List[str]:
-        results = self.collection.get(where={"doc_name": session_id}, limit=6)
-        if not results or not results.get('documents') or not results['documents'][0]:
+        context = self._build_budgeted_context(session_id, "Tóm tắt nội dung chính", separator="\n---\n")
+        if not context:
             return []
 
-        context = "\n---\n".join(results['documents'][0][:6])
         prompt = f'''
             Dựa trên nội dung tham khảo, hãy đề xuất {n_suggestions} câu lệnh (prompt) bằng TIẾNG VIỆT để người dùng yêu cầu AI viết bài.
             Ví dụ: "Tóm tắt nội dung", "Phân tích ưu điểm".
-            Nội dung: {context[:2000]}
+            Nội dung: {context}
             '''
         raw = self.llm.send_prompt(prompt, options={"temperature": 0.5})
         if not raw: return []
@@ -292,10 +605,9 @@ class WikiComposer:
         return suggestions
     
 
-    def generate_youtube_seo(self, session_id: str, custom_prompt: str) -> str:
-        # 1. Lấy bối cảnh (Context)
-        results = self.collection.get(where={"doc_name": session_id})
-        context = "\n".join(results['documents'][:15])
+    def _build_youtube_seo_prompt(self, session_id: str, custom_prompt: str) -> str:
+        # 1. Lấy bối cảnh (Context): chunk liên quan nhất tới yêu cầu, vừa ngân sách token
+        context = self._build_session_context(session_id, custom_prompt or "Tóm tắt nội dung chính của video")
 
         # 2. System Prompt tối giản - Chỉ giữ lại quy tắc "Sạch"
         # Chúng ta bỏ hết các yêu cầu về SEO, tiêu đề... để người dùng tự quyết
@@ -307,7 +619,7 @@ class WikiComposer:
 
         # 3. Kết hợp chỉ thị của người dùng
         # Ở đây, yêu cầu của Phúc là trung tâm
-        prompt = f"""
+        return f"""
         {system_rules}
         ---
         BỐI CẢNH VIDEO: {context}
@@ -315,5 +627,15 @@ class WikiComposer:
         YÊU CẦU CỦA NGƯỜI DÙNG: {custom_prompt}
         """
 
+    def generate_youtube_seo(self, session_id: str, custom_prompt: str) -> str:
+        prompt = self._build_youtube_seo_prompt(session_id, custom_prompt)
         return self.llm.send_prompt(prompt, options={"temperature": 0.7})
-        
\ No newline at end of file
+
+    def generate_youtube_seo_stream(self, session_id: str, custom_prompt: str):
+        """Generator su kien cho SSE: token tung phan, cuoi cung la toan bo noi dung"""
+        prompt = self._build_youtube_seo_prompt(session_id, custom_prompt)
+        content = ""
+        for token in self.llm.send_prompt_stream(prompt, options={"temperature": 0.7}):
+            content += token
+            yield {"type": "token", "text": token}
+        yield {"type": "done", "content": content}
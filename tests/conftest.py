@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Cac module trong src import lan nhau theo ten (flat), giong khi chay server tu thu muc src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
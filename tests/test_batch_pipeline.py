@@ -0,0 +1,20 @@
+import pytest
+
+from batch_pipeline import BatchPipeline
+
+
+class _RaisingComposer:
+    def process_input_to_vector(self, input_source, input_type, session_id):
+        raise RuntimeError("index failed")
+
+
+def test_ingest_error_marks_source_row_as_error(tmp_path, monkeypatch):
+    pipeline = BatchPipeline(_RaisingComposer(), str(tmp_path), ingest_workers=1, llm_workers=1)
+    statuses = []
+    monkeypatch.setattr(pipeline, "_set_source_status", lambda row_id, status: statuses.append((row_id, status)))
+    item = {"session_id": "s1", "source_row_id": 7, "url": "https://example.com", "type": "url", "title": "t"}
+
+    with pytest.raises(RuntimeError):
+        pipeline._ingest(item)
+
+    assert statuses == [(7, "error")]
@@ -0,0 +1,20 @@
+from docx import Document
+
+from document_reader import iter_docx_blocks
+
+
+def test_table_keeps_equal_adjacent_cells_and_collapses_merged(tmp_path):
+    doc = Document()
+    table = doc.add_table(rows=2, cols=3)
+    for cell, value in zip(table.rows[0].cells, ["2024", "10", "10"]):
+        cell.text = value
+    merged = table.cell(1, 0).merge(table.cell(1, 1))
+    merged.text = "Tong"
+    table.cell(1, 2).text = "20"
+    path = tmp_path / "table.docx"
+    doc.save(str(path))
+
+    text = "".join(iter_docx_blocks(str(path)))
+
+    assert "2024 | 10 | 10" in text
+    assert "Tong | 20" in text
@@ -0,0 +1,21 @@
+import numpy as np
+
+import embedding_benchmark
+
+
+class _FakeEmbedder:
+    def encode(self, texts):
+        return np.array([[len(t), t.count("a") + 1.0] for t in texts])
+
+
+def test_backend_load_error_is_skipped(monkeypatch):
+    def fake_load(model_name, backend="torch", **_):
+        if backend == "onnx":
+            raise RuntimeError("thieu onnxruntime")
+        return _FakeEmbedder()
+
+    monkeypatch.setattr(embedding_benchmark, "load_embedder", fake_load)
+    sessions = {"s1": [f"chunk {'a' * i} so {i}" for i in range(10)]}
+    rows = embedding_benchmark.run_benchmark(sessions, "m", ["onnx", "torch", "int8"], n_queries=5, k=2)
+    assert [row["backend"] for row in rows] == ["torch", "int8"]
+    assert rows[0]["recall@2"] == 1.0
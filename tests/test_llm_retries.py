@@ -0,0 +1,47 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+import llm_engine
+from llm_engine import LLMError, LLMManager, LLMRateLimitError, _classify_openai_error, _is_retryable
+
+
+class _Config:
+    id = 9001
+    name = "test-provider"
+    provider = "openai"
+    rpm_limit = None
+    tpm_limit = None
+
+
+def _status_error(cls, status: int, headers: dict = None):
+    response = httpx.Response(status, headers=headers or {}, request=httpx.Request("POST", "http://llm.test"))
+    return cls("error", response=response, body=None)
+
+
+def test_unexpected_errors_are_not_retried():
+    assert not _is_retryable(LLMError("bug"))
+    assert not _is_retryable(_classify_openai_error(ValueError("bug"), "openai"))
+    assert not _is_retryable(_classify_openai_error(_status_error(openai.BadRequestError, 400), "openai"))
+    assert _is_retryable(_classify_openai_error(_status_error(openai.InternalServerError, 500), "openai"))
+    assert _is_retryable(_classify_openai_error(_status_error(openai.RateLimitError, 429), "openai"))
+
+
+def test_routed_call_fails_fast_on_long_retry_after(monkeypatch):
+    manager = LLMManager()
+    calls = []
+    config = _Config()
+    llm_engine.rate_limiters.drop(config.id)
+
+    def request():
+        calls.append(1)
+        raise _status_error(openai.RateLimitError, 429, {"retry-after": "30"})
+
+    start = time.time()
+    with pytest.raises(LLMRateLimitError):
+        manager._with_retries(config, 10, request, routed=True)
+    assert len(calls) == 1
+    assert time.time() - start < 1
+    llm_engine.rate_limiters.drop(config.id)
@@ -0,0 +1,55 @@
+import time
+import threading
+
+from llm_router import LLMRouter
+
+
+class _Config:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+        self.weight = 1
+
+
+def _run_with_timeout(fn, timeout=5):
+    result = {}
+
+    def target():
+        result["value"] = fn()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "route() bi treo (deadlock)"
+    return result["value"]
+
+
+def test_hedge_fires_when_primary_is_slow():
+    router = LLMRouter(strategy="least_outstanding", hedge_after=0.05)
+    primary, secondary = _Config(1, "slow"), _Config(2, "fast")
+
+    def call(config, prompt, options):
+        if config is primary:
+            time.sleep(0.5)
+            return "slow answer"
+        return "fast answer"
+
+    # order() giu thu tu khi thong ke bang nhau: primary duoc chon truoc
+    result = _run_with_timeout(lambda: router.route([primary, secondary], call, "hi", {}))
+
+    assert result == "fast answer"
+    snapshot = _run_with_timeout(router.snapshot)
+    assert snapshot["providers"][2]["hedged"] == 1
+
+
+def test_failover_when_primary_errors():
+    router = LLMRouter(strategy="least_outstanding", hedge_after=0)
+    primary, secondary = _Config(1, "broken"), _Config(2, "ok")
+
+    def call(config, prompt, options):
+        if config is primary:
+            raise RuntimeError("boom")
+        return "ok"
+
+    assert router.route([primary, secondary], call, "hi", {}) == "ok"
+    assert router.snapshot()["providers"][1]["errors"] == 1
@@ -0,0 +1,18 @@
+import fitz
+
+from document_reader import iter_pdf_pages
+
+
+def test_parallel_pdf_pages_match_sequential(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    doc = fitz.open()
+    for i in range(40):
+        doc.new_page().insert_text((72, 72), f"Trang so {i}")
+    doc.save(path)
+    doc.close()
+
+    sequential = list(iter_pdf_pages(path, workers=1))
+    parallel = list(iter_pdf_pages(path, workers=2, pages_per_task=8, parallel_min_pages=10))
+
+    assert parallel == sequential
+    assert "Trang so 39" in parallel[-1]
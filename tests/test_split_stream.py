@@ -0,0 +1,25 @@
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from wiki_composer import WikiComposer
+
+
+def _composer():
+    # Chi can text_splitter / chunk_size, khong khoi tao DB, Chroma hay model
+    composer = WikiComposer.__new__(WikiComposer)
+    composer.chunk_size = 800
+    composer.text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=800, chunk_overlap=100, separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
+    )
+    return composer
+
+
+def test_streamed_chunks_do_not_fuse_words_across_blocks():
+    composer = _composer()
+    blocks = [("alpha beta gamma delta. " * 40) + f"ENDPAGE{i}\n" for i in range(20)]
+
+    chunks = list(composer._split_stream(iter(blocks)))
+
+    joined = " ".join(chunks)
+    for i in range(20):
+        assert f"ENDPAGE{i}alpha" not in joined
+        assert f"ENDPAGE{i}" in joined
@@ -0,0 +1,36 @@
+from context_builder import count_tokens
+from summarizer import MapReduceSummarizer, pack_groups
+
+
+class _FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def active_provider_model(self):
+        return "ollama", "qwen2.5:3b"
+
+    def get_concurrency_limit(self):
+        return 1
+
+    def send_prompt(self, prompt, options=None):
+        self.prompts.append(prompt)
+        return "tom tat " * 40
+
+
+def test_pack_groups_respects_budget_and_order():
+    texts = [f"doan {i} " + "x" * 790 for i in range(20)]
+    groups = pack_groups(texts, 1200)
+    assert [t for g in groups for t in g] == texts
+    for g in groups:
+        assert count_tokens("\n".join(g)) <= 1200
+
+
+def test_map_and_reduce_prompts_fit_ollama_budget(tmp_path):
+    llm = _FakeLLM()
+    summarizer = MapReduceSummarizer(llm, str(tmp_path))
+    chunks = {1: ["noi dung " * 88 for _ in range(40)]}
+    summarizer.summarize("s1", chunks, budget=1200)
+    template_tokens = count_tokens(MapReduceSummarizer.MAP_PROMPT) + 10
+    assert llm.prompts
+    for prompt in llm.prompts:
+        assert count_tokens(prompt) <= 1200 + template_tokens
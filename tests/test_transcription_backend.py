@@ -0,0 +1,36 @@
+import pytest
+
+from extraction_cache import ExtractionCache
+from extractor import Extractor
+from transcription_backend import ESTIMATED_LOAD_SECONDS, Transcriber, select_model_size
+
+
+def test_short_audio_follows_target_rtf():
+    # 5s audio, RTF 0.5 -> ngan sach 2.5s: khong duoc nap large-v3 (25s)
+    size = select_model_size(5, "faster-whisper", 0.5)
+    assert ESTIMATED_LOAD_SECONDS[size] <= 2.5
+    # Model da nam trong RAM thi khong tinh thoi gian nap
+    assert select_model_size(5, "faster-whisper", 0.5, loaded=["small"]) == "small"
+
+
+def test_min_budget_is_opt_in():
+    assert select_model_size(5, "faster-whisper", 0.5, min_budget_seconds=60) == "large-v3"
+
+
+def test_transcriber_is_abstract():
+    with pytest.raises(TypeError):
+        Transcriber("base")
+
+
+def test_auto_mode_caches_under_selected_size(tmp_path, monkeypatch):
+    audio = tmp_path / "a.mp3"
+    audio.write_bytes(b"fake audio")
+    extractor = Extractor(model_size="auto", cache=ExtractionCache(str(tmp_path / "cache")))
+    calls = []
+    monkeypatch.setattr(extractor, "_transcribe", lambda path: calls.append(path) or ("xin chao", "small"))
+
+    assert extractor.extract_mp3(str(audio)) == "xin chao"
+    assert extractor.extract_mp3(str(audio)) == "xin chao"
+    assert len(calls) == 1
+    key = extractor.cache.make_key("whisper", extractor.cache.hash_file(str(audio)), "small")
+    assert extractor.cache.get(key) == "xin chao"
@@ -0,0 +1,91 @@
+import time
+import threading
+
+import numpy as np
+
+from memory_index import MemoryIndexCache
+from vector_store import SessionVectorStore, collection_name
+
+
+class _SlowCollection:
+    """Collection gia: get() cham de mo cua so race giua nap snapshot va upsert"""
+
+    def __init__(self):
+        self.rows = {}
+        self.loading = threading.Event()
+
+    def count(self):
+        return len(self.rows)
+
+    def upsert(self, ids, documents, metadatas, embeddings):
+        for i, cid in enumerate(ids):
+            self.rows[cid] = (documents[i], metadatas[i], embeddings[i])
+
+    def get(self, include):
+        snapshot = dict(self.rows)
+        self.loading.set()
+        time.sleep(0.2)
+        return {
+            "ids": list(snapshot),
+            "documents": [v[0] for v in snapshot.values()],
+            "metadatas": [v[1] for v in snapshot.values()],
+            "embeddings": [v[2] for v in snapshot.values()],
+        }
+
+
+def _batch(ids):
+    rng = np.random.default_rng(len(ids))
+    return dict(ids=ids, documents=[f"doc {i}" for i in ids], metadatas=[{} for _ in ids],
+                embeddings=rng.normal(size=(len(ids), 8)).tolist())
+
+
+def test_upsert_during_snapshot_load_reaches_memory_index():
+    store = SessionVectorStore("/unused", memory_index=MemoryIndexCache(max_chunks=100))
+    col = _SlowCollection()
+    store._collections[collection_name("s1")] = col
+    store.upsert("s1", **_batch(["a", "b"]))
+
+    loader = threading.Thread(target=lambda: store.get("s1", include=["documents"]))
+    loader.start()
+    col.loading.wait(2)
+    store.upsert("s1", **_batch(["c"]))
+    loader.join()
+
+    assert sorted(store.get("s1", include=["documents"])["ids"]) == ["a", "b", "c"]
+
+
+class _FakeClient:
+    def __init__(self):
+        self.collections = {}
+
+    def list_collections(self):
+        return list(self.collections)
+
+    def get_or_create_collection(self, name, metadata=None):
+        col = self.collections.setdefault(name, _SlowCollection())
+        col.metadata = metadata
+        return col
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+    def delete_collection(self, name):
+        del self.collections[name]
+
+
+def test_embedding_backends_use_separate_collections():
+    assert collection_name("s1") == "session_s1"
+    assert collection_name("s1", "int8") != collection_name("s1")
+    assert len(collection_name("x" * 80, "onnx")) <= 63
+
+    client = _FakeClient()
+    torch_store = SessionVectorStore("/unused")
+    int8_store = SessionVectorStore("/unused", embedding_backend="int8")
+    torch_store._client = int8_store._client = client
+    torch_store.upsert("s1", **_batch(["a"]))
+
+    assert int8_store.count("s1") == 0
+    assert int8_store.sessions() == {}
+    assert list(int8_store.sessions(all_backends=True)) == ["s1"]
+    assert int8_store.delete_session("s1")
+    assert client.collections == {}
@@ -92,12 +92,23 @@ const WorkspacePage = () => {
     loadSession();
   }, [id, location.state]);
 
+  // Chờ job ingest (trích xuất + embedding) chạy nền hoàn tất
+  const waitForJob = async (jobId) => {
+    while (true) {
+      const res = await axios.get(`${API_URL}/jobs/${jobId}`);
+      if (res.data.status === "done") return res.data;
+      if (res.data.status === "error") throw new Error(res.data.error || "Không xử lý được nguồn.");
+      await new Promise((r) => setTimeout(r, 2000));
+    }
+  };
+
   const handleGenerate = async () => {
     setProcessing(true);
     setStep(2);
     setShowModal(false);
     try {
-      await axios.post(`${API_URL}/sessions/${id}/add-url`, { url: urlInput, type: "youtube" });
+      const srcRes = await axios.post(`${API_URL}/sessions/${id}/add-url`, { url: urlInput, type: "youtube" });
+      await waitForJob(srcRes.data.job_id);
       const res = await axios.post(`${API_URL}/sessions/${id}/generate-youtube-seo`, { custom_prompt: mainPrompt });
       
       // Tách hashtag ngay khi AI phản hồi